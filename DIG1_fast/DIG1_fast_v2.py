@@ -2,9 +2,14 @@ import os
 import random
 import time
 import asyncio
+import itertools
 from datetime import datetime
 
 from machine_lib import *
+from records_index import iter_filter_simulated
+from expr_stream import BoundedSeen, Counted
+from enum_cursor import EnumerationCursor, field_rng
+from expr_validator import ExpressionValidator
 from config import *
 from fields import *
 
@@ -41,17 +46,32 @@ def retry_on_exception(retries=3, delay=5):
     return decorator
 
 
-def small_first_order_factory(fields, ops_set, per_field_min=1, per_field_max=3, per_field_target=10):
+def iter_small_first_order_factory(fields, ops_set, per_field_min=1, per_field_max=3, per_field_target=10,
+                                   seed=ENUM_SEED, start=(0, 0), positions=False):
     """
-    每个字段尽量生成 per_field_target(默认10) 个表达式，优先组合：
+    逐字段产出表达式（生成器），每个字段尽量生成 per_field_target(默认10) 个，优先组合：
       - ts_* 窗口: 5, 11, 22, 66, 120, 252
       - group_* 分组: sector/industry/cap分桶
       - 基础算子: rank, zscore, signed_power
-    自动跳过当前环境缺失的算子；去重；避免与字段字符串冲突。
+    自动跳过当前环境缺失的算子；去重（全局去重只记最近 STREAM_DEDUP_CAPACITY 条）；避免与字段字符串冲突。
+    窗口、分组用每个字段自己的种子随机数挑（enum_cursor.field_rng），同样的字段和 seed 每次生成同样的表达式；
+    start=(字段序号, 字段内序号) 从该位置继续，之前的字段不生成；positions=True 时产出 (表达式, 位置)。
     """
-    import random
-    alpha_set = []
+    g_seen = BoundedSeen(key=str)
+    ops = first_order_ops()
+
+    first_field, skip = start
+    for field_no, field in enumerate(itertools.islice(fields, first_field, None), first_field):
+        # 去重（全局）保持顺序
+        for j, a in enumerate(field_first_order_exprs(field, ops, per_field_target, seed)):
+            if field_no == first_field and j < skip:
+                continue
+            if g_seen.add(a):
+                yield (a, (field_no, j)) if positions else a
+
 
+def first_order_ops():
+    """当前环境可用的 (基础算子, ts 算子, 分组算子)"""
     # 可用集合（基于已过滤的全局算子）
     ts_avail = [op for op in [
         "ts_zscore", "ts_mean", "ts_std_dev", "ts_delta", "ts_rank", "ts_sum"
@@ -62,7 +82,12 @@ def small_first_order_factory(fields, ops_set, per_field_min=1, per_field_max=3,
     group_avail = [op for op in [
         "group_neutralize", "group_rank", "group_zscore"
     ] if 'group_ops' in globals() and op in group_ops]
+    return basic_avail, ts_avail, group_avail
 
+
+def field_first_order_exprs(field, ops, per_field_target=10, seed=ENUM_SEED):
+    """一个字段的候选表达式（按生成顺序）；只由字段、可用算子和 seed 决定"""
+    basic_avail, ts_avail, group_avail = ops
     ts_windows = [5, 11, 22, 66, 120, 252]
     group_choices = [
         "sector",
@@ -70,71 +95,75 @@ def small_first_order_factory(fields, ops_set, per_field_min=1, per_field_max=3,
         "bucket(rank(cap), range='0.1, 1, 0.1')"
     ]
 
-    for field in fields:
-        # 针对每个字段收集候选，控制数量
-        seen = set()
-        per_field_exprs = []
-
-        # 1) 基础算子优先
-        for op in basic_avail:
-            if len(per_field_exprs) >= per_field_target:
-                break
-            if op == "signed_power":
-                expr = f"signed_power({field}, 2)"
-            else:
-                expr = f"{op}({field})"
-            if expr not in seen and op not in field:
-                seen.add(expr)
-                per_field_exprs.append(expr)
-
-        # 2) 时间序列算子（窗口多样化）
-        for op in ts_avail:
-            if len(per_field_exprs) >= per_field_target:
-                break
-            # 为每个 op 选择 1-2 个窗口
-            sel_ws = random.sample(ts_windows, k=min(2, len(ts_windows)))
-            for w in sel_ws:
-                if len(per_field_exprs) >= per_field_target:
-                    break
-                expr = f"{op}({field}, {w})"
-                if expr not in seen and op not in field:
-                    seen.add(expr)
-                    per_field_exprs.append(expr)
-
-        # 3) 分组算子（不同分组）
-        for op in group_avail:
+    rng = field_rng(field, seed)
+    # 针对每个字段收集候选，控制数量
+    seen = set()
+    per_field_exprs = []
+
+    # 1) 基础算子优先
+    for op in basic_avail:
+        if len(per_field_exprs) >= per_field_target:
+            break
+        if op == "signed_power":
+            expr = f"signed_power({field}, 2)"
+        else:
+            expr = f"{op}({field})"
+        if expr not in seen and op not in field:
+            seen.add(expr)
+            per_field_exprs.append(expr)
+
+    # 2) 时间序列算子（窗口多样化）
+    for op in ts_avail:
+        if len(per_field_exprs) >= per_field_target:
+            break
+        # 为每个 op 选择 1-2 个窗口
+        sel_ws = rng.sample(ts_windows, k=min(2, len(ts_windows)))
+        for w in sel_ws:
             if len(per_field_exprs) >= per_field_target:
                 break
-            g = random.choice(group_choices)
-            expr = f"{op}({field}, densify({g}))"
-            if expr not in seen and op not in field:
-                seen.add(expr)
-                per_field_exprs.append(expr)
-
-        # 如果仍不足，回退多取 ts 窗口
-        i = 0
-        while len(per_field_exprs) < per_field_target and ts_avail:
-            op = ts_avail[i % len(ts_avail)]
-            w = ts_windows[i % len(ts_windows)]
             expr = f"{op}({field}, {w})"
             if expr not in seen and op not in field:
                 seen.add(expr)
                 per_field_exprs.append(expr)
-            i += 1
 
-        alpha_set.extend(per_field_exprs)
+    # 3) 分组算子（不同分组）
+    for op in group_avail:
+        if len(per_field_exprs) >= per_field_target:
+            break
+        g = rng.choice(group_choices)
+        expr = f"{op}({field}, densify({g}))"
+        if expr not in seen and op not in field:
+            seen.add(expr)
+            per_field_exprs.append(expr)
+
+    # 如果仍不足，回退多取 ts 窗口
+    i = 0
+    while len(per_field_exprs) < per_field_target and ts_avail:
+        op = ts_avail[i % len(ts_avail)]
+        w = ts_windows[i % len(ts_windows)]
+        expr = f"{op}({field}, {w})"
+        if expr not in seen and op not in field:
+            seen.add(expr)
+            per_field_exprs.append(expr)
+        i += 1
+
+    return per_field_exprs
+
+
+def first_order_sizes(fields, per_field_target=10, seed=ENUM_SEED):
+    """
+    iter_small_first_order_factory 每个字段会产出多少条，不保留表达式、不查历史记录
+    （表达式都带字段名，不同字段之间不会重复，全局去重不影响条数）
+    """
+    ops = first_order_ops()
+    return [len(field_first_order_exprs(field, ops, per_field_target, seed)) for field in fields]
 
-    # 去重（全局）保持顺序
-    g_seen = set()
-    uniq = []
-    for a in alpha_set:
-        if a not in g_seen:
-            g_seen.add(a)
-            uniq.append(a)
-    return uniq
+def small_first_order_factory(fields, ops_set, per_field_min=1, per_field_max=3, per_field_target=10):
+    return list(iter_small_first_order_factory(fields, ops_set, per_field_min, per_field_max, per_field_target))
 
 @while_true_try_decorator
-def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=None):
+def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=None,
+             dedup_history=ENUM_DEDUP_HISTORY):
     delay = int(delay)
     n_jobs = int(n_jobs)
 
@@ -151,12 +180,9 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
     # 封装登录和字段获取，使其具备断线重连能力
     @retry_on_exception(retries=5, delay=10)
     def login_and_get_datafields():
-        print(datetime.now(), "开始登录...")
-        s = login()
-        print(datetime.now(), "登录成功，开始拉取字段...")
-        group = get_datafields(s=s, dataset_id=dataset_id, region=region, delay=delay, universe=universe)
-        s.close()
-        return group
+        # 字段元数据走本地缓存，只有缓存未命中时才会登录拉取
+        print(datetime.now(), "开始拉取字段...")
+        return get_datafields(dataset_id=dataset_id, region=region, delay=delay, universe=universe)
 
     try:
         group = login_and_get_datafields()
@@ -173,8 +199,6 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
         tag = f"{region}_{dataset_id}_fast_check"
     else:
         tag = f"{region}_{dataset_id}_fast_check"
-    completed_file_path = os.path.join(RECORDS_PATH, f"{tag}_simulated_alpha_expression.txt")
-    completed_alphas = read_completed_alphas_with_comments(completed_file_path)
 
     # 字段统计（官方原始 vs. 派生可用 vs. 本轮选用）
     total_official = len(group)
@@ -194,44 +218,61 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
     print(f"- 处理后的可用字段数：{total_derived}")
     print(f"- 参与生成的字段数：{len(pc_fields)}（全部参与）")
 
+    # 确定性枚举：字段按种子排好序，从上次停下的位置继续（records/{tag}_cursor.json），不再和历史记录做差集
+    cursor = EnumerationCursor(tag, pc_fields)
+    print(f"- 枚举游标：第 {cursor.position[0]}/{len(cursor.fields)} 个字段，累计已完成 {cursor.emitted} 条")
+    if cursor.exhausted:
+        print(datetime.now(), f"{tag} 所有表达式已完成，跳过")
+        return
+
     # 单层 + 全算子池，但每字段只采样 1-3 个表达式
     ops_pool = ts_ops + basic_ops
     print(datetime.now(), "开始构造表达式（单层，每个字段1-3个）...")
-    raw_alpha_list = small_first_order_factory(pc_fields, ops_pool, per_field_min=3, per_field_max=5, per_field_target=10)
-    print(datetime.now(), f"表达式生成完成：共 {len(raw_alpha_list)} 条")
-
-    alpha_list = [alpha for alpha in raw_alpha_list if alpha not in completed_alphas]
-
-    if len(alpha_list) == 0:
+    # 表达式边生成边过滤、提交，不在内存里攒完整列表；元素是 (表达式, 枚举位置)
+    raw_alphas = Counted(iter_small_first_order_factory(cursor.fields, ops_pool, per_field_target=10,
+                                                        seed=cursor.seed, start=cursor.position, positions=True))
+    # 游标之后的都还没模拟过，默认不再查历史；dedup_history=True 时额外剔除 records/ 全局索引里已有的（跨 tag 去重）
+    fresh = Counted(iter_filter_simulated(raw_alphas) if dedup_history else raw_alphas)
+
+    first = next(fresh, None)
+    if first is None:
+        cursor.finish()
         print(datetime.now(), f"{tag} 所有表达式已完成，跳过")
         return
+    alpha_stream = itertools.chain([first], fresh)
 
-    print(datetime.now(), "表达式统计：")
-    print(f"- 生成表达式总数：{len(raw_alpha_list)}")
-    print(f"- 待回测表达式数：{len(alpha_list)}（已剔除历史重复）")
+    # 每个 pool 取一个 region / decay / delay，数量跟着表达式流走
+    region_list = itertools.repeat((region, universe))
+    decay_list = (random.randint(0, 10) for _ in itertools.count())
+    delay_list = itertools.repeat(delay)
 
-    random.shuffle(alpha_list)
+    neut = 'SUBINDUSTRY'
 
-    region_list = [(region, universe)] * len(alpha_list)
-    decay_list = [random.randint(0, 10) for _ in alpha_list]
-    delay_list = [delay] * len(alpha_list)
+    # 本次提交的表达式清单（与成功结果文件区分开），表达式进 pool 时逐条追加
+    submitted_file_path = os.path.join(RECORDS_PATH, f"{tag}_submitted_alpha_expression.txt")
 
-    neut = 'SUBINDUSTRY'
+    def record_submitted(items):
+        with open(submitted_file_path, 'a', encoding='utf-8') as f:
+            for alpha, position in items:
+                f.write(alpha.strip() + '\n')
+                cursor.issue(position, alpha)  # 进了 pool 还不算完成，结果落盘后由 on_done 推进游标
+                yield alpha
+        cursor.finish()  # 枚举到头，等最后几个 pool 跑完游标才移到末尾
 
-    print(datetime.now(), f"开始提交回测：共 {len(alpha_list)} 条表达式")
+    print(datetime.now(), "开始提交回测（表达式边生成边提交）")
     
     # 简单直接的方式，让任务一直跑下去
-    asyncio.run(simulate_multiple_tasks(
-        alpha_list, region_list, decay_list, delay_list,
-        tag, neut, [], n=n_jobs
-    ))
-    # 回测完成后，保存本次提交的表达式清单（与成功结果文件区分开）
-    submitted_file_path = os.path.join(RECORDS_PATH, f"{tag}_submitted_alpha_expression.txt")
-    try:
-        save_completed_alphas(submitted_file_path, alpha_list)
-        print(datetime.now(), f"已保存提交表达式清单至：{submitted_file_path}")
-    except Exception as e:
-        print(datetime.now(), f"保存提交清单失败：{e}")
+    with cursor:  # 退出时（包括出错中断）保存游标，没跑完的候选下次重新生成
+        asyncio.run(simulate_multiple_tasks(
+            record_submitted(alpha_stream), region_list, decay_list, delay_list,
+            tag, neut, [], n=n_jobs, on_done=cursor.done,
+            validator=ExpressionValidator(operator_catalog, fields=group)  # 字段不在该 region/universe 的也在提交前剔除
+        ))
+    print(datetime.now(), "表达式统计：")
+    print(f"- 生成表达式总数：{raw_alphas.count}")
+    print(f"- 待回测表达式数：{fresh.count}" + ("（已剔除历史重复）" if dedup_history else ""))
+    print(f"- 枚举游标：第 {cursor.position[0]}/{len(cursor.fields)} 个字段，累计已完成 {cursor.emitted} 条")
+    print(datetime.now(), f"提交表达式清单：{submitted_file_path}")
     print(datetime.now(), "回测提交完成。")
 
 
@@ -246,10 +287,7 @@ def plan_dataset(dataset_id, region, delay, instrumentType, universe, n_jobs, ta
     # 封装登录和字段获取，使其具备断线重连能力
     @retry_on_exception(retries=5, delay=10)
     def login_and_get_datafields():
-        s = login()
-        group = get_datafields(s=s, dataset_id=dataset_id, region=region, delay=delay, universe=universe)
-        s.close()
-        return group
+        return get_datafields(dataset_id=dataset_id, region=region, delay=delay, universe=universe)
     
     print(datetime.now(), f"准备统计数据集 {dataset_id} ...")
     try:
@@ -276,8 +314,6 @@ def plan_dataset(dataset_id, region, delay, instrumentType, universe, n_jobs, ta
         tag_local = f"{region}_{dataset_id}_fast_check"
     else:
         tag_local = f"{region}_{dataset_id}_fast_check"
-    completed_file_path = os.path.join(RECORDS_PATH, f"{tag_local}_simulated_alpha_expression.txt")
-    completed_alphas = read_completed_alphas_with_comments(completed_file_path)
 
     official_total = len(group)
     try:
@@ -290,9 +326,12 @@ def plan_dataset(dataset_id, region, delay, instrumentType, universe, n_jobs, ta
     derived_total = len(derived_fields)
     pc_fields = derived_fields  # 全部参与
 
-    ops_pool = ts_ops + basic_ops
-    raw_alpha_list = small_first_order_factory(pc_fields, ops_pool, per_field_min=1, per_field_max=3)
-    alpha_list = [alpha for alpha in raw_alpha_list if alpha not in completed_alphas]
+    # 与 run_task 同一套确定性枚举：按字段算出各自的候选数，总数从头加，待回测从游标位置加（不生成整条流）
+    cursor = EnumerationCursor(tag_local, pc_fields)
+    sizes = first_order_sizes(cursor.fields, per_field_target=10, seed=cursor.seed)
+    generated_total = sum(sizes)
+    first_field, offset = cursor.position
+    pending_total = max(0, sum(sizes[first_field:]) - offset)
 
     return {
         'dataset_id': dataset_id,
@@ -302,8 +341,8 @@ def plan_dataset(dataset_id, region, delay, instrumentType, universe, n_jobs, ta
         'vector_cnt': vector_cnt,
         'derived_total': derived_total,
         'selected_fields': len(pc_fields),
-        'generated_total': len(raw_alpha_list),
-        'pending_total': len(alpha_list),
+        'generated_total': generated_total,
+        'pending_total': pending_total,
     }
 
 def read_completed_alphas_with_comments(filepath):
@@ -1,5 +1,6 @@
-from 增强machine_lib import *
+from machine_lib import *
 from config import *
+from group_catalog import group_catalog
 import asyncio
 import aiofiles
 import time
@@ -60,11 +61,14 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
 
         print(datetime.now(),f'qualified expression: {len(fo_layer)}')
 
+        # 该 region / universe / delay 下字段齐全的分组（进程内只建一次），每个一阶因子展开的条数固定
+        catalog = group_catalog(region, universe, delay, instrumentType, operators=operator_catalog)
+
         so_alpha_list = []
 
         for expr, decay in fo_layer:
             so_alpha_list.append((expr, decay))
-            for alpha in get_group_second_order_factory([expr], group_ops):
+            for alpha in get_group_second_order_factory([expr], group_ops, catalog=catalog):
                 so_alpha_list.append((alpha, decay))
 
         # 读取已完成的alpha表达式
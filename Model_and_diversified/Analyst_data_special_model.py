@@ -13,6 +13,7 @@ import asyncio
 from datetime import datetime
 
 from machine_lib import *      # 你的登录/提交/并发/装饰器等
+from records_index import filter_simulated
 from config import *           # 需要 RECORDS_PATH
 
 # ==================== 算法参数 ====================
@@ -159,7 +160,7 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
     # 单一历史文件：simulated_alpha_expression.txt
     record_path = os.path.join(RECORDS_PATH, f"{tag}_simulated_alpha_expression.txt")
     done = read_completed(record_path)
-    todo = [e for e in exprs if e not in done]
+    todo = filter_simulated([e for e in exprs if e not in done])  # 同时剔除其他 tag 已模拟过的
     print(datetime.now(), f"[INFO] 待回测: {len(todo)}（已记录完成 {len(done)}）")
 
     if not todo:
@@ -177,15 +178,7 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
         todo, region_list, decay_list, delay_list, tag, neut, [], n=n_jobs
     ))
 
-    # 提交即入库：只写同一个历史文件，保持与 read_completed 对齐
-    try:
-        os.makedirs(RECORDS_PATH, exist_ok=True)
-        with open(record_path, "a", encoding="utf-8") as f:
-            for e in todo:
-                f.write(e + "\n")
-        print(datetime.now(), f"[INFO] 已写入历史记录：{record_path}（追加 {len(todo)} 条）")
-    except Exception as e:
-        print(datetime.now(), f"[WARN] 写历史记录失败：{e}")
+    # 回测完成的表达式已由 simulate_multiple_tasks 写入同一个历史文件（records_writer），这里不再重复追加
 
 
 def run_multi_datasets(dataset_ids, region, delay, instrumentType, universe, n_jobs, tag=None):
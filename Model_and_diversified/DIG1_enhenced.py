@@ -8,6 +8,7 @@
 
 import os
 import random
+import itertools
 import time
 import asyncio
 from datetime import datetime
@@ -15,6 +16,8 @@ import argparse
 
 from machine_lib_v2 import *                    # 你原有的API：login/get_datafields/process_datafields/...
 from machine_lib_v2 import MachinelibTemplates  # 模板生成器类
+from records_index import iter_filter_simulated
+from expr_space import ChainSpace, iter_sample
 from config import *                         # 你的常规配置
 from fields import *                         # 字段映射等
 
@@ -25,9 +28,9 @@ console = Console()
 
 
 # ---------------------- 基于模板的候选生成 ----------------------
-def _pick_template_alphas(model_type: str, group) -> list:
+def _template_space(model_type: str, group):
     """
-    从字段集合 `group` 生成表达式；放大产量的版本。
+    从字段集合 `group` 生成候选的下标空间（expr_space，不展开组合，可直接按下标均匀抽样）；放大产量的版本。
     支持:
       - momentum_diverse      扩大窗口/分组
       - twin / risk_compare   同上
@@ -62,10 +65,10 @@ def _pick_template_alphas(model_type: str, group) -> list:
     LONG_MEDIUM   = [66, 120, 252]
 
     key = (model_type or "").strip().lower().replace(" ", "_")
-    out = []
+    out = ChainSpace()
 
     if key in ("momentum_diverse", "momentum", "mom_div", ""):
-        out = MachinelibTemplates.build_momentum_diverse(
+        out = MachinelibTemplates.space_momentum_diverse(
             fields=core_fields,
             groups=GROUPS_FULL,                 # 扩到全组
             short_windows=SHORT_BIG,            # 扩到 5 个短窗
@@ -74,7 +77,7 @@ def _pick_template_alphas(model_type: str, group) -> list:
         )
 
     elif key in ("twin", "pair", "corr"):
-        out = MachinelibTemplates.build_twin_ops(
+        out = MachinelibTemplates.space_twin_ops(
             primary_fields=core_fields[:80],    # 控制对数，避免组合爆炸
             twin_fields=(twin_fields or core_fields)[:80],
             windows=LONG_MEDIUM,
@@ -84,7 +87,7 @@ def _pick_template_alphas(model_type: str, group) -> list:
         )
 
     elif key in ("risk_compare", "risk_group"):
-        out = MachinelibTemplates.build_risk_group_compare(
+        out = MachinelibTemplates.space_risk_group_compare(
             risk_fields=risk_fields[:120],
             groups=GROUPS_FULL,
             compare_ops=MachinelibTemplates.GROUP_COMPARE_OPS,
@@ -93,14 +96,14 @@ def _pick_template_alphas(model_type: str, group) -> list:
 
     elif key in ("combo_core",):
         # 合并三类模板（数量通常几千到一两万，视字段而定）
-        a1 = MachinelibTemplates.build_momentum_diverse(
+        a1 = MachinelibTemplates.space_momentum_diverse(
             fields=core_fields,
             groups=GROUPS_FULL,
             short_windows=SHORT_BIG,
             long_windows=LONG_MEDIUM,
             wrap=(120, 4.0, True)
         )
-        a2 = MachinelibTemplates.build_twin_ops(
+        a2 = MachinelibTemplates.space_twin_ops(
             primary_fields=core_fields[:60],
             twin_fields=(twin_fields or core_fields)[:60],
             windows=LONG_MEDIUM,
@@ -108,24 +111,24 @@ def _pick_template_alphas(model_type: str, group) -> list:
             groups=GROUPS_FULL,
             wrap=(120, 4.0, True)
         )
-        a3 = MachinelibTemplates.build_risk_group_compare(
+        a3 = MachinelibTemplates.space_risk_group_compare(
             risk_fields=risk_fields[:100],
             groups=GROUPS_FULL,
             compare_ops=["group_neutralize", "group_rank", "group_zscore"],
             wrap=(120, 4.0, True)
         )
-        out = list(dict.fromkeys(a1 + a2 + a3))  # 去重保持顺序
+        out = ChainSpace(a1, a2, a3)
 
     elif key in ("combo_heavy",):
-        # 重口味：字段/分组/窗口全拉满（小心 OOM）
-        a1 = MachinelibTemplates.build_momentum_diverse(
+        # 重口味：字段/分组/窗口全拉满（流式生成，不会一次占满内存，但条数很多）
+        a1 = MachinelibTemplates.space_momentum_diverse(
             fields=core_fields[:300],
             groups=GROUPS_FULL,
             short_windows=SHORT_BIG,
             long_windows=LONG_BIG,
             wrap=(120, 4.0, True)
         )
-        a2 = MachinelibTemplates.build_twin_ops(
+        a2 = MachinelibTemplates.space_twin_ops(
             primary_fields=core_fields[:150],
             twin_fields=(twin_fields or core_fields)[:150],
             windows=LONG_BIG,
@@ -133,19 +136,19 @@ def _pick_template_alphas(model_type: str, group) -> list:
             groups=GROUPS_FULL,
             wrap=(120, 4.0, True)
         )
-        a3 = MachinelibTemplates.build_risk_group_compare(
+        a3 = MachinelibTemplates.space_risk_group_compare(
             risk_fields=risk_fields[:200],
             groups=GROUPS_FULL,
             compare_ops=MachinelibTemplates.GROUP_COMPARE_OPS,
             wrap=(120, 4.0, True)
         )
-        out = list(dict.fromkeys(a1 + a2 + a3))
+        out = ChainSpace(a1, a2, a3)
 
     elif key in ("news_corr", "news_volume"):
         if not news_fields:
             print(datetime.now(), "未发现新闻字段，退回 momentum_diverse")
-            return _pick_template_alphas("momentum_diverse", group)
-        out = MachinelibTemplates.build_news_return_corr(
+            return _template_space("momentum_diverse", group)
+        out = MachinelibTemplates.space_news_return_corr(
             news_fields=news_fields[:60],
             windows=[120, 180, 252],
             groups=GROUPS_FULL,
@@ -153,7 +156,7 @@ def _pick_template_alphas(model_type: str, group) -> list:
         )
 
     elif key in ("analyst_reg", "analyst_regression"):
-        out = MachinelibTemplates.build_analyst_regression(
+        out = MachinelibTemplates.space_analyst_regression(
             analyst_fields=analyst_fields[:80],
             pv_fields=list(dict.fromkeys(pv_fields + ["close*volume"]))[:10],
             w1=22, w2=120,
@@ -162,14 +165,14 @@ def _pick_template_alphas(model_type: str, group) -> list:
         )
 
     elif key in ("fcf", "fundamental_fcf"):
-        out = MachinelibTemplates.build_fcf_ratio(
+        out = MachinelibTemplates.space_fcf_ratio(
             fcf_field="fcf", mkt_cap_field="market_cap",
             smooth_window=60, groups=["sector","industry"], wrap=(120, 4.0, True)
         )
 
     elif key in ("vector_neut", "risk_neutral"):
         risk_ref = next((x for x in all_fields if "risk" in x.lower()), "risk70")
-        out = MachinelibTemplates.build_vector_neutralized(
+        out = MachinelibTemplates.space_vector_neutralized(
             fields=core_fields[:150],
             risk_field=risk_ref,
             windows=[5,10,20,22,33],
@@ -178,11 +181,11 @@ def _pick_template_alphas(model_type: str, group) -> list:
         )
 
     elif key in ("explore", "smoke"):
-        out = MachinelibTemplates.build_explore_simple(core_fields[:200], wrap=(120, 4.0, True))
+        out = MachinelibTemplates.space_explore_simple(core_fields[:200], wrap=(120, 4.0, True))
 
     else:
         # 未识别：默认用放大的动量分歧
-        out = MachinelibTemplates.build_momentum_diverse(
+        out = MachinelibTemplates.space_momentum_diverse(
             fields=core_fields,
             groups=GROUPS_FULL,
             short_windows=SHORT_BIG,
@@ -190,8 +193,8 @@ def _pick_template_alphas(model_type: str, group) -> list:
             wrap=(120, 4.0, True)
         )
 
-    # 最后一道去重
-    return list(dict.fromkeys(out))
+    # 跨模板族重复的表达式由 run_task 里的 iter_filter_simulated 按规范形式去掉
+    return out
 
 
 # ---------------------- 主任务 ----------------------
@@ -228,23 +231,20 @@ def run_task(dataset_id, region, delay, instrumentType, universe, n_jobs, tag=No
     completed_file_path = os.path.join(RECORDS_PATH, f"{tag}_simulated_alpha_expression.txt")
     completed_alphas = read_completed_alphas(completed_file_path)
 
-    # 基于模板生成候选
+    # 基于模板生成候选空间（不展开组合，大小直接算出来）
     print(datetime.now(), f"🧱 使用模板 [{model_type}] 生成候选表达式...")
-    raw_alpha_list = _pick_template_alphas(model_type=model_type, group=group)
-    print(datetime.now(), f"✅ 模板生成完成，共 {len(raw_alpha_list)} 条")
+    space = _template_space(model_type=model_type, group=group)
+    print(datetime.now(), f"✅ 模板生成完成，共 {len(space)} 条")
 
-    # 过滤已完成
-    alpha_list = [alpha for alpha in raw_alpha_list if alpha not in completed_alphas]
+    # 按下标均匀不放回抽样（等价于全部 shuffle 后依次取），抽到的先过滤已完成，再剔除其他 tag 已模拟过的
+    fresh = iter_filter_simulated(alpha for alpha in map(str, iter_sample(space)) if alpha not in completed_alphas)
+    alpha_list = list(itertools.islice(fresh, 1000))  # 防卡死保险
 
     if len(alpha_list) == 0:
         print(datetime.now(), f"{tag} 所有表达式已完成，跳过")
         return
 
-    # 打乱+截断
-    random.shuffle(alpha_list)
-    alpha_list = alpha_list[:1000]  # 防卡死保险
-
-    print(datetime.now(), f"🎯 待回测表达式数：{len(alpha_list)} / {len(raw_alpha_list)}")
+    print(datetime.now(), f"🎯 待回测表达式数：{len(alpha_list)} / {len(space)}")
 
     # 组装提交参数
     region_list = [(region, universe)] * len(alpha_list)
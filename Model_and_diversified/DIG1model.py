@@ -15,7 +15,7 @@ import os
 import time
 import random
 import asyncio
-from itertools import product
+from itertools import islice
 from datetime import datetime
 
 # ==== 配置区：像 DIG1 那样在这里改 ====
@@ -47,6 +47,8 @@ from machine_lib import (
     simulate_multiple_tasks,
     read_completed_alphas,
 )
+from records_index import iter_filter_simulated
+from expr_space import ProductSpace, iter_sample
 
 # ===== 基础工具 =====
 def log(msg: str):
@@ -169,16 +171,11 @@ def run_once():
         log(f"字段为空：x={len(x_fields)} y={len(y_fields)}。检查权限/region/universe/delay/dataset id")
         return
 
-    # 组合表达式
-    exprs = []
-    for xf, yf in product(x_fields, y_fields):
-        expr = build_alpha_expr(xf, yf)
-        if expr not in completed_alphas:
-            exprs.append(expr)
-
-    random.shuffle(exprs)
-    if MAX_PAIRS > 0:
-        exprs = exprs[:MAX_PAIRS]
+    # 组合表达式：x × y 的下标空间里均匀不放回抽样，只生成抽到的那几条
+    pairs = ProductSpace([x_fields, y_fields], build_alpha_expr)
+    fresh = (expr for expr in iter_sample(pairs) if expr not in completed_alphas)
+    fresh = iter_filter_simulated(fresh)  # 其他 tag 已模拟过的也跳过
+    exprs = list(islice(fresh, MAX_PAIRS)) if MAX_PAIRS > 0 else list(fresh)
 
     if not exprs:
         log(f"无新增表达式。x_fields={len(x_fields)}, y_fields={len(y_fields)}")
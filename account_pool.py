@@ -0,0 +1,179 @@
+"""
+多账号会话池
+
+每个账号的并发模拟数由平台单独限制，只用一个 user_info.txt 时吞吐被一个账号的上限卡住。
+AccountPool 为每份凭证维护一套 SessionManager / AIMDLimiter / ProgressPoller，
+simulate_multiple_tasks 每取到一个 pool 就派给当前空闲槽位最多的账号：
+- acquire() 等到某个账号有空槽位，返回它的 AccountSlot 并先预留一个位置，
+  避免多个 worker 同时看中同一个空位
+- AccountSlot 可以直接当 simulate_multi / resume_multi 的 semaphore 用：进入时占该账号的槽位并撤销预留，
+  on_success / on_limit 调整该账号自己的并发窗口
+- 进度 URL、子模拟查询都必须用提交它的账号，所以 pool 的账号名会记进模拟日志，恢复时按名字找回
+
+用法:
+    accounts = await AccountPool.open(['user_info.txt', 'user_info_2.txt'], n=3)
+    slot = await accounts.acquire()
+    await simulate_multi(slot.session_manager, ..., slot, slot.poller, journal, account=slot.name)
+    await accounts.close()
+"""
+import time
+import asyncio
+
+from brain_auth import USER_INFO_FILE, load_user_info, async_login, token_lifetime, SessionManager
+from throttle import AIMDLimiter
+from sim_poller import ProgressPoller
+from config import SIM_MAX_CONCURRENCY
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+
+class Account:
+
+    def __init__(self, name, txt_file, session_manager, limiter, poller):
+        self.name = name
+        self.txt_file = txt_file
+        self.session_manager = session_manager
+        self.limiter = limiter
+        self.poller = poller
+        self.reserved = 0  # 已派发、还没进入槽位的 pool 数
+
+    @property
+    def free_slots(self):
+        return int(self.limiter.window) - self.limiter.in_flight - self.reserved
+
+
+class AccountSlot:
+    """派给某个账号的一个 pool；接口与 AIMDLimiter 一致，可以当 semaphore 传给 simulate_multi"""
+
+    def __init__(self, pool, account):
+        self.pool = pool
+        self.account = account
+        self.name = account.name
+        self.session_manager = account.session_manager
+        self.poller = account.poller
+        self._reserved = True
+
+    def _unreserve(self):
+        if self._reserved:
+            self._reserved = False
+            self.account.reserved -= 1
+
+    async def __aenter__(self):
+        await self.account.limiter.acquire()
+        self._unreserve()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.account.limiter.release()
+        await self.pool.notify()
+
+    def on_success(self):
+        self.account.limiter.on_success()
+        self.pool.notify_soon()  # 窗口可能变大了
+
+    def on_limit(self):
+        self.account.limiter.on_limit()
+
+    async def cancel(self):
+        """没用上的预留（pool 在进入槽位前就结束了）还回去"""
+        if self._reserved:
+            self._unreserve()
+            await self.pool.notify()
+
+
+class AccountPool:
+
+    def __init__(self, accounts):
+        if not accounts:
+            raise ValueError("AccountPool needs at least one account")
+        self.accounts = list(accounts)
+        self._by_name = {a.name: a for a in self.accounts}
+        self._cond = asyncio.Condition()
+        self._notify_tasks = set()  # 事件循环只弱引用任务，这里留着引用直到通知完成
+
+    @classmethod
+    async def open(cls, credential_files=(USER_INFO_FILE,), n=10, max_window=SIM_MAX_CONCURRENCY):
+        """逐个登录；某个账号登录失败只跳过它，全部失败才抛出"""
+        accounts = []
+        for txt_file in credential_files:
+            username, _ = load_user_info(txt_file)
+            if any(a.name == username for a in accounts):
+                log.warning('duplicate credentials ignored', account=username, file=txt_file)
+                continue
+            try:
+                session = await async_login(txt_file)
+            except Exception as e:
+                log.error('account login failed, skipping', account=username, file=txt_file, error=str(e))
+                continue
+            session_manager = SessionManager(session, time.time(), token_lifetime(txt_file), txt_file=txt_file)
+            session_manager.start()  # 到期前后台换新会话
+            limiter = AIMDLimiter(n, max_window=max(n, max_window))
+            accounts.append(Account(username, txt_file, session_manager, limiter, ProgressPoller(session_manager)))
+        if not accounts:
+            raise Exception("no account could log in: %s" % ', '.join(credential_files))
+        log.info('account pool ready', accounts=[a.name for a in accounts])
+        return cls(accounts)
+
+    async def notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def notify_soon(self):
+        """在同步回调里安排一次 notify()"""
+        task = asyncio.ensure_future(self.notify())
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    def _best(self):
+        account = max(self.accounts, key=lambda a: (a.free_slots, -a.limiter.in_flight))
+        return account if account.free_slots > 0 else None
+
+    async def acquire(self):
+        """等到有账号空出槽位，返回派给它的 AccountSlot"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._best() is not None)
+            account = self._best()
+            account.reserved += 1
+        return AccountSlot(self, account)
+
+    def slot(self, name=None):
+        """指定账号的 AccountSlot（恢复日志里的 pool 用）；找不到该账号时返回第一个账号的"""
+        account = self._by_name.get(name)
+        if account is None:
+            if name is not None:
+                log.warning('journal account not in pool, using default', account=name)
+            account = self.accounts[0]
+        account.reserved += 1
+        return AccountSlot(self, account)
+
+    # ---- 汇总，供指标与日志使用 ----
+    @property
+    def window(self):
+        return sum(a.limiter.window for a in self.accounts)
+
+    @property
+    def max_window(self):
+        return sum(a.limiter.max_window for a in self.accounts)
+
+    @property
+    def in_flight(self):
+        return sum(a.limiter.in_flight for a in self.accounts)
+
+    @property
+    def n_polls(self):
+        return sum(a.poller.n_polls for a in self.accounts)
+
+    def idle_slot_seconds(self):
+        return sum(a.limiter.idle_slot_seconds() for a in self.accounts)
+
+    def stats(self):
+        return {a.name: a.limiter.stats() for a in self.accounts}
+
+    async def close(self):
+        for account in self.accounts:
+            try:
+                await account.poller.close()
+                await account.session_manager.close()
+            except Exception as e:
+                log.warning('closing account failed', account=account.name, error=str(e))
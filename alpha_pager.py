@@ -0,0 +1,180 @@
+"""
+/users/self/alphas 并发分页拉取
+
+- AlphaPager        : 异步拉取器，先取第一页拿到 count，其余 offset 在速率预算内并发请求；
+                      命中数超过 offset 上限时把 dateCreated 区间二分，直到每个子区间都能翻完
+- iter_alpha_pages  : 同步迭代器，后台线程下载，调用方边拿边处理
+"""
+import queue
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from collections import namedtuple
+
+import aiohttp
+
+from config import ALPHA_FETCH_CONCURRENCY, ALPHA_FETCH_RATE
+from brain_auth import async_login
+from throttle import RateBudget
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+PAGE_SIZE = 100
+OFFSET_CAP = 9900  # 平台 offset 上限，超过后翻不到
+MIN_WINDOW = timedelta(seconds=1)  # dateCreated 区间最多二分到这个长度
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S-04:00'
+
+# query: 第几个查询；window: 该页所属的 (start, end) 区间；offset: 该页在区间内的起始位置；
+# count: 该区间命中数；total: 该查询所有区间的命中数之和；results: 该页的 alpha 列表（已按 id 去重）
+AlphaPage = namedtuple('AlphaPage', ['query', 'window', 'offset', 'count', 'total', 'results'])
+
+
+def _to_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class AlphaPager:
+    """
+    异步分页拉取器。查询地址里的 offset、dateCreated 区间用占位符表示，例如
+    ".../users/self/alphas?limit=100&offset={offset}&dateCreated%3E={start}&dateCreated%3C{end}&..."
+    """
+
+    def __init__(self, session=None, concurrency=ALPHA_FETCH_CONCURRENCY, rate=ALPHA_FETCH_RATE, max_retries=5):
+        self.session = session
+        self._own_session = session is None
+        self.budget = RateBudget(rate, concurrency=concurrency)
+        self.max_retries = max_retries
+        self._login_lock = asyncio.Lock()
+
+    async def _relogin(self, stale_session):
+        async with self._login_lock:
+            if self.session is stale_session:
+                await self.session.close()
+                self.session = await async_login(force=True)
+                self._own_session = True
+
+    async def _get_page(self, url_template, window, offset):
+        start, end = window
+        url = (url_template.replace('{offset}', str(offset))
+               .replace('{start}', start.strftime(DATE_FORMAT)).replace('{end}', end.strftime(DATE_FORMAT)))
+        for i in range(self.max_retries):
+            session = self.session
+            try:
+                async with self.budget:
+                    async with session.get(url) as resp:
+                        if resp.status == 401:
+                            await self._relogin(session)
+                            continue
+                        retry_after = resp.headers.get('Retry-After')
+                        if resp.status == 429 or resp.status >= 500:
+                            await asyncio.sleep(float(retry_after or 2 ** i))
+                            continue
+                        data = await resp.json()
+                return int(data['count']), data['results']
+            except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+                log.warning('alpha page request failed', url=url, offset=offset, attempt=i + 1,
+                            max_retries=self.max_retries, error=str(e))
+                await asyncio.sleep(min(60, 2 ** i))
+        raise Exception(f"Failed to get alphas after {self.max_retries} retries: {url}")
+
+    async def _split(self, url_template, window):
+        """
+        取区间的第一页；命中数达到 offset 上限就把区间从中间切开分别处理。
+        返回 [(window, count, 第一页 results), ...]，按时间先后排列
+        """
+        count, results = await self._get_page(url_template, window, 0)
+        start, end = window
+        if count < OFFSET_CAP:
+            return [(window, count, results)]
+        if end - start <= MIN_WINDOW:
+            log.warning('date window cannot be split further, results truncated',
+                        start=start, end=end, count=count, cap=OFFSET_CAP)
+            return [(window, count, results)]
+        mid = start + (end - start) / 2
+        mid = mid.replace(microsecond=0)  # 接口的时间精度是秒
+        left, right = await asyncio.gather(self._split(url_template, (start, mid)),
+                                           self._split(url_template, (mid, end)))
+        return left + right
+
+    async def pages(self, query_urls, start_date, end_date):
+        """
+        异步生成器：按 (查询顺序, 区间先后, offset 顺序) 产出 AlphaPage；
+        所有查询的所有页同时下载，只在产出时按顺序排队。
+        """
+        if self.session is None:
+            self.session = await async_login()
+
+        window = (_to_datetime(start_date), _to_datetime(end_date))
+        plans = [asyncio.ensure_future(self._split(url, window)) for url in query_urls]
+        pending = []
+        try:
+            heads = []
+            for q, url in enumerate(query_urls):
+                leaves = []
+                for win, count, results in await plans[q]:
+                    tasks = [(offset, asyncio.ensure_future(self._get_page(url, win, offset)))
+                             for offset in range(PAGE_SIZE, min(count, OFFSET_CAP), PAGE_SIZE)]
+                    pending.extend(t for _, t in tasks)
+                    leaves.append((win, count, results, tasks))
+                heads.append(leaves)
+
+            for q, leaves in enumerate(heads):
+                total = sum(count for _, count, _, _ in leaves)
+                seen = set()
+                for win, count, results, tasks in leaves:
+                    offsets = [(0, None)] + tasks
+                    for offset, task in offsets:
+                        if task is not None:
+                            _, results = await task
+                        # 区间左闭右开，正常不会重复，按 id 去重兜底
+                        results = [a for a in results if a['id'] not in seen]
+                        seen.update(a['id'] for a in results)
+                        yield AlphaPage(q, win, offset, count, total, results)
+        finally:
+            for task in plans + pending:
+                task.cancel()
+
+    async def close(self):
+        if self._own_session and self.session is not None:
+            await self.session.close()
+
+
+def iter_alpha_pages(query_urls, start_date, end_date, **pager_kwargs):
+    """
+    同步迭代器：后台线程里跑 AlphaPager，每下载好一页就交给调用方，
+    DIG2~DIG4、check.py 可以在后面的页还在下载时就开始处理前面的页。
+    """
+    pages = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    async def run():
+        pager = AlphaPager(**pager_kwargs)
+        try:
+            async for page in pager.pages(query_urls, start_date, end_date):
+                if stop.is_set():
+                    break
+                pages.put(page)
+        finally:
+            await pager.close()
+
+    def worker():
+        try:
+            asyncio.run(run())
+        except BaseException as e:
+            pages.put(e)
+        finally:
+            pages.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
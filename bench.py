@@ -0,0 +1,228 @@
+"""
+端到端吞吐压测：在本地 FakeBrain 上跑真实的客户端代码
+
+    python bench.py simulate --alphas 500 --sim-limit 10 --sim-duration 5 --latency 0.05
+    python bench.py alphas --seed-alphas 20000
+    python bench.py check --seed-alphas 2000 --jobs 4
+
+- simulate : simulate_multiple_tasks，报告每小时完成的模拟数与平台槽位占用率（--accounts 个账号分摊）
+- alphas   : get_alphas 分页拉取，报告每秒拿到的 alpha 数
+- check    : check.py 的 check_alpha_by_self_prod，报告每小时检查的 alpha 数
+
+客户端的请求延迟通过 brain_auth.TRACE_CONFIGS（aiohttp）和 requests 的 response hook 统计，
+输出 p50/p99。记录文件、凭证缓存等写到临时目录，不会碰到 records/ 和 .cache/。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from fake_brain import FakeBrain, FakeBrainServer
+
+BENCH_USER = 'bench@localhost'
+
+
+class LatencyRecorder:
+    """按接口（路径里的 id 归一成 {id}）记录请求耗时，线程安全"""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, method, url, seconds):
+        parts = urlsplit(str(url)).path.strip('/').split('/')
+        path = '/' + '/'.join('{id}' if i == 1 and p not in ('self',) else p for i, p in enumerate(parts))
+        with self._lock:
+            self._samples[f'{method} {path}'].append(seconds)
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def on_start(session, ctx, params):
+            ctx.started = time.perf_counter()
+
+        async def on_end(session, ctx, params):
+            self.record(params.method, params.url, time.perf_counter() - ctx.started)
+
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        return trace
+
+    def requests_hook(self, response, *args, **kwargs):
+        self.record(response.request.method, response.request.url, response.elapsed.total_seconds())
+
+    def summary(self):
+        with self._lock:
+            samples = {k: sorted(v) for k, v in self._samples.items()}
+        everything = sorted(x for v in samples.values() for x in v)
+        report = {'all': _percentiles(everything)}
+        report.update({k: _percentiles(v) for k, v in sorted(samples.items())})
+        return report
+
+
+def _percentiles(values):
+    if not values:
+        return {'n': 0}
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+    return {'n': len(values), 'p50_ms': pick(0.5), 'p99_ms': pick(0.99)}
+
+
+def _setup_env(url, workdir, quiet):
+    """BRAIN_API_URL 等在客户端模块导入时读取，必须在导入 machine_lib 之前设置"""
+    os.environ['BRAIN_API_URL'] = url
+    os.environ['BRAIN_RECORDS_PATH'] = os.path.join(workdir, 'records')
+    os.environ['BRAIN_CACHE_PATH'] = os.path.join(workdir, '.cache')
+    if quiet:
+        os.environ['BRAIN_LOG_CONSOLE_LEVEL'] = 'ERROR'
+    with open(os.path.join(workdir, 'user_info.txt'), 'w') as f:
+        f.write(f"username: '{BENCH_USER}'\npassword: 'bench'\n")
+    os.chdir(workdir)  # login() 从当前目录读 user_info.txt
+
+
+def bench_simulate(args, recorder):
+    import machine_lib_v2 as ml
+
+    alpha_list = [f'rank(ts_mean(pv1_field_{i % 200}, {5 + i}))' for i in range(args.alphas)]
+    n_pools = -(-len(alpha_list) // 10)
+    region_list = [('USA', 'TOP3000')] * n_pools
+    decay_list = [4] * n_pools
+    delay_list = [1] * n_pools
+    credentials = ['user_info.txt']
+    for k in range(2, args.accounts + 1):  # FakeBrain 按账号分别限制在途模拟数
+        credentials.append(f'user_info_{k}.txt')
+        with open(credentials[-1], 'w') as f:
+            f.write(f"username: 'bench{k}@localhost'\npassword: 'bench'\n")
+    asyncio.run(ml.simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_list,
+                                           'bench', 'SUBINDUSTRY', [], n=args.n, credentials=credentials))
+    # simulate_multiple_tasks 结束时导出的客户端指标（sim_metrics）
+    with open(os.path.join(os.environ['BRAIN_RECORDS_PATH'], 'bench_metrics.json'), encoding='utf-8') as f:
+        client = json.load(f)
+    if args.dump_metrics:
+        with open(os.path.join(os.environ['BRAIN_RECORDS_PATH'], 'bench_metrics.prom'), encoding='utf-8') as f:
+            sys.stderr.write(f.read())
+    counters = {name: sum(item['value'] for item in series) for name, series in client['counters'].items()}
+    return {'submitted_alphas': len(alpha_list),
+            'limit_exceeded': counters.get('limit_exceeded_total', 0),
+            'submit_retries': counters.get('submit_retries_total', 0),
+            'idle_slot_seconds': round(client['gauges'].get('idle_slot_seconds', 0), 1)}
+
+
+def bench_alphas(args, recorder):
+    import machine_lib_v2 as ml
+
+    s = ml.login()
+    s.hooks['response'].append(recorder.requests_hook)
+    result = ml.get_alphas('2025-01-01', '2025-03-01', 0.5, 0.1, 10, 10, 'USA', 'TOP3000', 1, 'EQUITY',
+                           100, 'track', s=s)
+    return {'fetched_alphas': len(result['next']) + len(result['decay'])}
+
+
+def bench_check(args, recorder):
+    import check
+
+    s = check.login()
+    s.hooks['response'].append(recorder.requests_hook)
+    submitable_alpha_file = os.path.join(os.environ['BRAIN_RECORDS_PATH'], 'submitable_alpha.csv')
+    n_check = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for page in check.iter_alphas('2025-01-01', '2025-03-01', 1.25, 1, 10, 10, region='USA', universe='',
+                                      delay='', instrumentType='', usage='submit', tag='', color_exclude='RED', s=s):
+            for alpha in page['check'][:args.limit - n_check if args.limit else None]:
+                executor.submit(check.check_alpha_by_self_prod, s, alpha, submitable_alpha_file, args.mode)
+                n_check += 1
+            if args.limit and n_check >= args.limit:
+                break
+    return {'checked_alphas': n_check}
+
+
+SCENARIOS = {'simulate': bench_simulate, 'alphas': bench_alphas, 'check': bench_check}
+
+
+def run(args):
+    brain = FakeBrain(latency=args.latency, sim_limit=args.sim_limit, sim_duration=args.sim_duration,
+                      poll_interval=args.poll_interval, max_inflight=args.max_inflight, rate=args.rate,
+                      n_alphas=args.seed_alphas)
+    server = FakeBrainServer(brain).start()
+    recorder = LatencyRecorder()
+    cwd = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with tempfile.TemporaryDirectory(prefix='brain_bench_') as workdir:
+            _setup_env(server.url, workdir, args.quiet)
+            import brain_auth
+            brain_auth.TRACE_CONFIGS.append(recorder.trace_config())
+
+            started = time.time()
+            with contextlib.redirect_stdout(open(os.devnull, 'w') if args.quiet else sys.stdout):
+                result = SCENARIOS[args.scenario](args, recorder)
+            finished = time.time()
+            os.chdir(cwd)
+    finally:
+        server.stop()
+
+    elapsed = finished - started
+    server_stats = brain.stats(started, finished)
+    report = {
+        'scenario': args.scenario,
+        'elapsed_s': round(elapsed, 2),
+        **result,
+        'completed_simulations': server_stats['completed_alphas'],
+        'simulations_per_hour': round(server_stats['completed_alphas'] / elapsed * 3600, 1),
+        'slot_utilization': server_stats['slot_utilization'],
+        'status_counts': server_stats['status_counts'],
+        'latency': recorder.summary(),
+    }
+    for key in ('fetched_alphas', 'checked_alphas'):
+        if key in result:
+            report[key.split('_')[0] + '_per_hour'] = round(result[key] / elapsed * 3600, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在本地 FakeBrain 上压测客户端吞吐')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--alphas', type=int, default=200, help='simulate: 提交的表达式数')
+    parser.add_argument('--n', type=int, default=10, help='simulate: simulate_multiple_tasks 每个账号的初始并发窗口')
+    parser.add_argument('--accounts', type=int, default=1, help='simulate: 使用的账号数')
+    parser.add_argument('--jobs', type=int, default=4, help='check: 线程数')
+    parser.add_argument('--limit', type=int, default=50, help='check: 最多检查多少个 alpha（0 表示不限）')
+    parser.add_argument('--mode', default='USER', choices=['USER', 'CONSULTANT', 'PPAC'], help='check: 模式')
+    parser.add_argument('--latency', type=float, default=0.05, help='服务端每个请求的基础延迟（秒）')
+    parser.add_argument('--sim-limit', type=int, default=10, help='服务端每个账号同时在途的模拟数上限')
+    parser.add_argument('--sim-duration', type=float, default=5.0, help='服务端每个模拟耗时（秒）')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='服务端返回的 Retry-After（秒）')
+    parser.add_argument('--max-inflight', type=int, default=None, help='服务端同时处理的请求数上限')
+    parser.add_argument('--rate', type=float, default=None, help='服务端每秒请求数上限')
+    parser.add_argument('--seed-alphas', type=int, default=2000, help='服务端预置的 alpha 数')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help='显示客户端自身的输出')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出报告')
+    parser.add_argument('--dump-metrics', action='store_true', help='simulate: 把客户端导出的 Prometheus 指标打到 stderr')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    latency = report.pop('latency')
+    for key, value in report.items():
+        print(f'{key:>24}: {value}')
+    print('\n延迟（客户端视角）:')
+    for endpoint, stats in latency.items():
+        print(f'  {endpoint:<45} n={stats["n"]:<6} p50={stats.get("p50_ms", "-")}ms p99={stats.get("p99_ms", "-")}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+登录与凭证缓存
+
+/authentication 返回的 cookie 连同过期时间保存在 .cache/ 下，
+同步的 requests.Session 与异步的 aiohttp.ClientSession 共用同一份缓存：
+只有缓存缺失、token 快过期或服务端返回 401 时才重新 POST 账号密码。
+SessionManager 负责长时间运行的异步任务里会话的单飞刷新与到期前轮换。
+"""
+import os
+import time
+import hashlib
+import threading
+
+import requests
+import aiohttp
+import asyncio
+from yarl import URL
+
+from config import CACHE_PATH, BRAIN_API_URL, SESSION_ROTATE_AHEAD, SESSION_RETIRE_GRACE
+from brain_cache import read_json_cache, write_json_cache
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+USER_INFO_FILE = 'user_info.txt'
+
+DEFAULT_TOKEN_LIFETIME = 3 * 60 * 60  # 接口没返回 token.expiry 时按 3 小时算
+EXPIRY_MARGIN = 5 * 60                # 离过期不足 5 分钟就当作已过期
+
+# 新建的 aiohttp 会话都会挂上这些 aiohttp.TraceConfig（bench.py 用来统计请求延迟）
+TRACE_CONFIGS = []
+
+
+def load_user_info(txt_file=USER_INFO_FILE):
+    """
+    从txt文件读取账号密码
+    txt格式:
+    password: 'password'
+    username: 'username'
+    """
+    with open(txt_file, 'r') as f:
+        data = f.read()
+        data = data.strip().split('\n')
+        data = {line.split(': ')[0]: line.split(': ')[1] for line in data}
+
+    return data['username'][1:-1], data['password'][1:-1]
+
+
+def _token_expires_at(payload):
+    """根据 /authentication 的响应计算 token 过期的时间戳"""
+    try:
+        lifetime = float(payload['token']['expiry'])
+    except (KeyError, TypeError, ValueError):
+        lifetime = DEFAULT_TOKEN_LIFETIME
+    return time.time() + lifetime
+
+
+class CredentialCache:
+    """
+    单个账号的登录凭证缓存（cookie 列表 + 过期时间戳），文件权限 600
+    """
+
+    def __init__(self, username, cache_dir=CACHE_PATH):
+        digest = hashlib.sha1(username.encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(cache_dir, f'auth_{digest}.json')
+
+    def load(self):
+        """返回 {'cookies': [...], 'expires_at': ts}；缺失或即将过期时返回 None"""
+        data = read_json_cache(self.path)
+        if not data or data.get('expires_at', 0) - EXPIRY_MARGIN < time.time():
+            return None
+        return data
+
+    def save(self, cookies, expires_at):
+        write_json_cache(self.path, {'cookies': cookies, 'expires_at': expires_at}, private=True)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def remaining(self):
+        """缓存 token 的剩余有效秒数（没有缓存时为 0）"""
+        data = self.load()
+        return max(0.0, data['expires_at'] - EXPIRY_MARGIN - time.time()) if data else 0.0
+
+
+class BrainSession(requests.Session):
+    """
+    带凭证缓存的 requests.Session：
+    优先复用缓存 cookie；token 过期或请求返回 401 时自动重新登录并重发一次。
+    多线程共用同一个 session 时只有一个线程会去重新登录。
+    """
+
+    def __init__(self, username, password, cache=None):
+        super().__init__()
+        self._credentials = (username, password)
+        self.cache = cache or CredentialCache(username)
+        self.expires_at = 0
+        self._auth_version = 0
+        self._auth_lock = threading.Lock()
+
+    def authenticate(self, force=False):
+        """登录；force=False 时先尝试使用缓存"""
+        with self._auth_lock:
+            return self._authenticate(force)
+
+    def _authenticate(self, force):
+        if not force:
+            cached = self.cache.load()
+            if cached:
+                for c in cached['cookies']:
+                    self.cookies.set(c['name'], c['value'], domain=c.get('domain', ''), path=c.get('path', '/'))
+                self.expires_at = cached['expires_at']
+                self._auth_version += 1
+                return None
+
+        # 注意这里绕过 self.request，避免递归触发重新登录
+        response = super().request('POST', BRAIN_API_URL + '/authentication', auth=self._credentials)
+        if response.status_code == 201:
+            log.info('authentication successful', status=response.status_code)
+            self.expires_at = _token_expires_at(response.json())
+            cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                       for c in self.cookies]
+            self.cache.save(cookies, self.expires_at)
+        else:
+            log.warning('authentication failed', status=response.status_code)
+            self.cache.clear()
+        self._auth_version += 1
+        return response
+
+    def _reauthenticate(self, seen_version):
+        """token 失效后重新登录；其他线程/进程已经换过新 token 时直接复用"""
+        with self._auth_lock:
+            if seen_version != self._auth_version:
+                return
+            cached = self.cache.load()
+            self._authenticate(force=not cached or cached['expires_at'] <= self.expires_at)
+
+    def request(self, method, url, *args, **kwargs):
+        version = self._auth_version
+        if self.expires_at and time.time() > self.expires_at - EXPIRY_MARGIN:
+            self._reauthenticate(version)
+            version = self._auth_version
+        response = super().request(method, url, *args, **kwargs)
+        if response.status_code == 401:
+            self._reauthenticate(version)
+            response = super().request(method, url, *args, **kwargs)
+        return response
+
+
+def login(txt_file=USER_INFO_FILE):
+    """
+    返回已登录的 requests.Session（BrainSession），有可用缓存时不发登录请求
+    """
+    username, password = load_user_info(txt_file)
+    s = BrainSession(username, password)
+    s.authenticate()
+    return s
+
+
+def _new_client_session():
+    # unsafe=True 允许 IP 地址形式的 BRAIN_API_URL（本地测试服务器）保存 cookie
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False),
+                                 cookie_jar=aiohttp.CookieJar(unsafe=True),
+                                 trace_configs=list(TRACE_CONFIGS) or None)
+
+
+def _restore_cookies(session, cookies):
+    api_url = URL(BRAIN_API_URL)
+    for c in cookies:
+        session.cookie_jar.update_cookies({c['name']: c['value']}, response_url=api_url)
+
+
+def _dump_cookies(session):
+    host = URL(BRAIN_API_URL).host
+    return [{'name': m.key, 'value': m.value, 'domain': m['domain'] or host, 'path': m['path'] or '/'}
+            for m in session.cookie_jar]
+
+
+async def async_login(txt_file=USER_INFO_FILE, force=False):
+    """
+    异步登录，返回 aiohttp.ClientSession。
+    force=False 且缓存的 token 仍有效时直接复用 cookie，不请求 /authentication
+    """
+    username, password = load_user_info(txt_file)
+    cache = CredentialCache(username)
+
+    if not force:
+        cached = cache.load()
+        if cached:
+            session = _new_client_session()
+            _restore_cookies(session, cached['cookies'])
+            log.info('login reused cached credentials', account=username)
+            return session
+
+    time_out = 5
+    while True:
+        if time_out < 0:
+            log.error('login timeout')
+            raise Exception("Login timeout! 无法登录，退出程序中...")
+
+        time_out -= 1
+
+        # 创建一个aiohttp的Session
+        session = _new_client_session()
+        try:
+            # 发送一个POST请求到/authentication API
+            async with session.post(BRAIN_API_URL + '/authentication',
+                                    auth=aiohttp.BasicAuth(username, password)) as response:
+                # 检查状态码是否为201，确保登录成功
+                if response.status == 201:
+                    log.info('login successful', account=username)
+                    cache.save(_dump_cookies(session), _token_expires_at(await response.json()))
+                    return session
+                log.warning('login failed', account=username, status=response.status, response=await response.text())
+                cache.clear()
+            await session.close()
+            await asyncio.sleep(10)
+
+        except aiohttp.ClientError as e:
+            log.warning('login request failed', error=str(e))
+            await session.close()
+            await asyncio.sleep(10)
+        except Exception as e:
+            log.warning('login raised', error=str(e))
+            await session.close()
+            await asyncio.sleep(10)
+
+
+def token_lifetime(txt_file=USER_INFO_FILE, default=DEFAULT_TOKEN_LIFETIME):
+    """
+    缓存中 token 的剩余有效秒数，供 SessionManager 决定何时轮换会话
+    """
+    username, _ = load_user_info(txt_file)
+    return CredentialCache(username).remaining() or default
+
+
+class SessionManager:
+    """
+    simulate_* 共用的 aiohttp 会话。
+    - refresh_session: 同一时刻只有一个任务重新登录，其余任务等它完成后直接用新会话
+    - start() 之后后台任务会在 token 过期前 rotate_ahead 秒登录新会话并原子替换，
+      旧会话再保留 retire_grace 秒，让还在途的请求正常结束
+    """
+
+    def __init__(self, session, start_time, expiry_time,
+                 rotate_ahead=SESSION_ROTATE_AHEAD, retire_grace=SESSION_RETIRE_GRACE, txt_file=USER_INFO_FILE):
+        self.session = session
+        self.txt_file = txt_file  # 重新登录用的凭证文件（多账号时每个 SessionManager 各用各的）
+        self.start_time = start_time
+        self.expiry_time = expiry_time
+        self.rotate_ahead = rotate_ahead
+        self.retire_grace = retire_grace
+        self._lock = asyncio.Lock()
+        self._rotate_task = None
+        self._retired = set()
+        self._retire_tasks = set()  # 事件循环只弱引用任务，这里留着引用，close() 时统一取消
+
+    def start(self):
+        """启动后台轮换任务（需要在事件循环里调用）"""
+        if self._rotate_task is None:
+            self._rotate_task = asyncio.ensure_future(self._rotate_loop())
+
+    async def refresh_session(self, stale=None):
+        """
+        重新登录。stale 为调用方失败时用的会话（默认当前会话）；
+        拿到锁时如果会话已经被别的任务换掉，就不再重复登录
+        """
+        stale = stale or self.session
+        async with self._lock:
+            if self.session is not stale:
+                return
+            log.info('session expired, logging in again')
+            self._swap(await async_login(self.txt_file, force=True))
+
+    def _swap(self, session):
+        old = self.session
+        self.session = session
+        self.start_time = time.time()
+        self.expiry_time = token_lifetime(self.txt_file)
+        self._retired.add(old)
+        task = asyncio.ensure_future(self._retire(old))
+        self._retire_tasks.add(task)
+        task.add_done_callback(self._retire_tasks.discard)
+
+    async def _retire(self, session):
+        await asyncio.sleep(self.retire_grace)
+        if session in self._retired:
+            self._retired.discard(session)
+            await session.close()
+
+    async def _rotate_loop(self):
+        while True:
+            delay = self.start_time + self.expiry_time - self.rotate_ahead - time.time()
+            await asyncio.sleep(max(delay, 30))
+            if time.time() < self.start_time + self.expiry_time - self.rotate_ahead:
+                continue  # 期间已经有任务刷新过会话
+            async with self._lock:
+                try:
+                    session = await async_login(self.txt_file, force=True)
+                except Exception as e:
+                    log.warning('background session rotation failed', error=str(e))
+                    continue
+                log.info('session rotated before expiry')
+                self._swap(session)
+
+    async def close(self):
+        if self._rotate_task is not None:
+            self._rotate_task.cancel()
+            try:
+                await self._rotate_task
+            except asyncio.CancelledError:
+                pass
+            self._rotate_task = None
+        for task in list(self._retire_tasks):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._retire_tasks.clear()
+        for session in list(self._retired) + [self.session]:
+            await session.close()
+        self._retired.clear()
@@ -0,0 +1,223 @@
+"""
+平台元数据的本地磁盘缓存（带 TTL）
+
+- OperatorCatalog   : /operators 算子表，第一次被访问时才加载
+- LazyOperatorList  : machine_lib 里 ts_ops / basic_ops 等模块级列表的惰性版本
+- fetch_datafields  : /data-fields 并发分页拉取，按查询条件缓存到磁盘
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import UserList
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (CACHE_PATH, BRAIN_API_URL, OPERATOR_CACHE_TTL,
+                    DATAFIELD_CACHE_TTL, DATAFIELD_FETCH_WORKERS)
+
+
+def read_json_cache(path, ttl=None):
+    """
+    读取缓存文件；文件不存在、损坏或超过 ttl 秒时返回 None
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if ttl is not None and time.time() - payload.get('saved_at', 0) > ttl:
+        return None
+    return payload.get('data')
+
+
+def write_json_cache(path, data, private=False):
+    """
+    原子写入缓存文件：先写临时文件再替换，避免多进程同时读到半个文件。
+    private=True 时文件权限设为 600（用于登录凭证）
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'saved_at': time.time(), 'data': data}, f, ensure_ascii=False)
+    if private:
+        os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+
+class OperatorCatalog:
+    """
+    平台算子表。
+    第一次访问时先读磁盘缓存，缓存缺失或过期才登录并请求 /operators，
+    所以热启动的进程不需要任何网络请求。
+    """
+
+    def __init__(self, session_factory, cache_file=None, ttl=OPERATOR_CACHE_TTL):
+        self.session_factory = session_factory  # 返回已登录 requests.Session 的函数，一般是 login
+        self.cache_file = cache_file or os.path.join(CACHE_PATH, 'operators.json')
+        self.ttl = ttl
+        self._operators = None
+        self._names = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._operators is None:
+                operators = read_json_cache(self.cache_file, self.ttl)
+                if operators is None:
+                    operators = self._fetch()
+                    write_json_cache(self.cache_file, operators)
+                self._operators = operators
+                self._names = {op['name'] for op in operators}
+        return self._operators
+
+    def _fetch(self):
+        s = self.session_factory()
+        try:
+            res = s.get(BRAIN_API_URL + "/operators")
+            res.raise_for_status()
+            return res.json()
+        finally:
+            s.close()
+
+    def refresh(self):
+        """
+        丢弃内存与磁盘缓存，下次访问时重新拉取
+        """
+        with self._lock:
+            self._operators = None
+            self._names = None
+            try:
+                os.remove(self.cache_file)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def operators(self):
+        """完整的算子描述列表（name / category / definition ...）"""
+        return self._load()
+
+    @property
+    def names(self):
+        self._load()
+        return self._names
+
+    def filter(self, candidates):
+        """保持原顺序，只留下平台上可用的算子"""
+        names = self.names
+        return [op for op in candidates if op in names]
+
+    def __contains__(self, op):
+        return op in self.names
+
+
+class LazyOperatorList(UserList):
+    """
+    模块级算子列表的惰性版本：第一次被读取时才按算子表过滤候选列表。
+    candidates 为 None 时表示平台上全部算子名（即原来的 aval）。
+    """
+
+    def __init__(self, catalog, candidates=None):
+        self._catalog = catalog
+        self._candidates = None if candidates is None else list(candidates)
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            if self._candidates is None:
+                self._data = [op['name'] for op in self._catalog.operators]
+            else:
+                self._data = self._catalog.filter(self._candidates)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = list(value)
+
+    # UserList 默认会用 self.__class__(...) 构造新对象，这里统一返回普通 list
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __add__(self, other):
+        return self.data + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.data
+
+    def __mul__(self, n):
+        return self.data * n
+
+    __rmul__ = __mul__
+
+    def copy(self):
+        return list(self.data)
+
+
+# ------------------ 字段元数据 ------------------
+DATAFIELD_PAGE_SIZE = 50
+
+_datafield_memo = {}
+_datafield_lock = threading.Lock()
+
+
+def _datafield_cache_file(key):
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_PATH, 'datafields', f'{digest}.json')
+
+
+def _get_datafield_page(s, params, offset, max_retries=5):
+    """拉取一页字段；遇到限流按 Retry-After 等待后重试"""
+    for i in range(max_retries):
+        res = s.get(BRAIN_API_URL + "/data-fields", params={**params, 'offset': offset})
+        if res.status_code == 429:
+            time.sleep(float(res.headers.get('Retry-After', 2 ** i)))
+            continue
+        res.raise_for_status()
+        return res.json()
+    res.raise_for_status()
+
+
+def fetch_datafields(s=None, instrument_type='EQUITY', region='USA', delay=1, universe='TOP3000',
+                     dataset_id='', search='', session_factory=None,
+                     ttl=DATAFIELD_CACHE_TTL, max_workers=DATAFIELD_FETCH_WORKERS):
+    """
+    拉取字段元数据（list[dict]）。
+    结果按 (instrumentType, region, delay, universe, dataset_id, search) 缓存在内存和磁盘，
+    缓存未命中时先取第一页拿到 count，其余页用 max_workers 个线程并发请求。
+    s 为 None 且需要联网时调用 session_factory() 登录。
+    """
+    key = [instrument_type, region, str(delay), universe, dataset_id, search]
+    memo_key = tuple(key)
+    with _datafield_lock:
+        if memo_key in _datafield_memo:
+            return _datafield_memo[memo_key]
+
+    cache_file = _datafield_cache_file(key)
+    fields = read_json_cache(cache_file, ttl)
+    if fields is None:
+        own_session = s is None
+        if own_session:
+            s = session_factory()
+        try:
+            params = {'instrumentType': instrument_type, 'region': region, 'delay': str(delay),
+                      'universe': universe, 'limit': DATAFIELD_PAGE_SIZE}
+            if len(search) == 0:
+                params['dataset.id'] = dataset_id
+            else:
+                params['search'] = search
+
+            first = _get_datafield_page(s, params, 0)
+            offsets = range(DATAFIELD_PAGE_SIZE, int(first['count']), DATAFIELD_PAGE_SIZE)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pages = list(executor.map(lambda x: _get_datafield_page(s, params, x), offsets))
+        finally:
+            if own_session:
+                s.close()
+
+        fields = [item for page in [first] + pages for item in page['results']]
+        write_json_cache(cache_file, fields)
+
+    with _datafield_lock:
+        _datafield_memo[memo_key] = fields
+    return fields
@@ -0,0 +1,136 @@
+"""
+结构化事件日志
+
+模拟、轮询、打标签这些热路径原来每一步都同步 print 到终端，并发槽位一多 stdout 就成了瓶颈，
+输出也没法解析。这里的 logger 只把记录放进队列（logging.handlers.QueueHandler），
+由后台线程（QueueListener）统一写出：
+- records/events.jsonl : 每行一个 JSON 事件（时间、级别、事件、tag / pool_id / alpha_id / url 等字段），按大小轮转
+- 终端                 : 人能读的一行摘要
+
+级别通过 config 里的 LOG_LEVEL / LOG_CONSOLE_LEVEL（或环境变量 BRAIN_LOG_LEVEL / BRAIN_LOG_CONSOLE_LEVEL）配置。
+
+用法:
+    log = get_logger(__name__)
+    log.info('simulation submitted', tag=name, pool_id=pool_id, url=location)
+    pool_log = log.bind(tag=name, region=region)   # 之后每条都带上这些字段
+    pool_log.warning('limit exceeded')
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import RECORDS_PATH, LOG_LEVEL, LOG_CONSOLE_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+ROOT_LOGGER = 'brain'
+EVENTS_FILE = os.path.join(RECORDS_PATH, 'events.jsonl')
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """一条记录一行 JSON；EventLogger 传入的字段放在顶层"""
+
+    def format(self, record):
+        event = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        event.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            event['exc'] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """终端上的一行摘要：时间 级别 事件 key=value ..."""
+
+    def format(self, record):
+        fields = ' '.join(f'{k}={v}' for k, v in getattr(record, 'fields', {}).items())
+        line = '%s %s %s%s' % (datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S'),
+                               record.levelname, record.getMessage(), ' ' + fields if fields else '')
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level=LOG_LEVEL, console_level=LOG_CONSOLE_LEVEL, path=EVENTS_FILE):
+    """
+    配置 brain.* logger：挂一个 QueueHandler，后台线程写 JSON 文件和终端。
+    重复调用不会重复挂 handler；第一次 get_logger 时会自动用默认参数调用
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        file_handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                           encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonLinesFormatter())
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+        console_handler.setLevel(console_level)
+
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.addHandler(QueueHandler(records))
+        root.propagate = False
+
+
+def shutdown_logging():
+    """把队列里剩下的记录写完（进程退出时自动调用）"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+class EventLogger:
+    """带固定字段的 logger：log.info(event, **fields)"""
+
+    def __init__(self, logger, fields=None):
+        self.logger = logger
+        self.fields = fields or {}
+
+    def bind(self, **fields):
+        return EventLogger(self.logger, {**self.fields, **fields})
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, event, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info,
+                            extra={'fields': {k: v for k, v in {**self.fields, **fields}.items() if v is not None}})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+
+def get_logger(name):
+    setup_logging()
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + '.'):
+        name = f'{ROOT_LOGGER}.{name}'
+    return EventLogger(logging.getLogger(name))
@@ -4,7 +4,7 @@ import os
 import numpy as np
 import pandas as pd
 from config import RECORDS_PATH, REGION_LIST, UNIVERSE_DICT
-from machine_lib_v2 import s, login, get_alphas, set_alpha_properties, while_true_try_decorator
+from machine_lib_v2 import login, iter_alphas, set_alpha_properties, while_true_try_decorator
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 import threading
@@ -37,7 +37,7 @@ def wait_get(session: requests.Session, url: str, max_retries: int = 10) -> requ
 
 def get_alpha_region(session: requests.Session, alpha_id: str) -> str:
     """获取 alpha 所属区域"""
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
+    url = f"{brain_api_url}/alphas/{alpha_id}"
     alpha_info = wait_get(session, url).json()
     return alpha_info['settings']['region']
 
@@ -48,7 +48,7 @@ def get_region_alphas(session: requests.Session, region: str) -> List[str]:
     limit = 100
     alpha_ids = []
     while True:
-        url = (f"https://api.worldquantbrain.com/users/self/alphas?"
+        url = (f"{brain_api_url}/users/self/alphas?"
                f"stage=OS&limit={limit}&offset={offset}&order=-dateSubmitted")
         res = wait_get(session, url).json()
         for alpha in res['results']:
@@ -62,7 +62,7 @@ def get_region_alphas(session: requests.Session, region: str) -> List[str]:
 
 def get_alpha_pnl(session: requests.Session, alpha_id: str) -> pd.DataFrame:
     """获取单个 alpha 的 PnL 数据"""
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/pnl"
+    url = f"{brain_api_url}/alphas/{alpha_id}/recordsets/pnl"
     pnl_data = wait_get(session, url).json()
     df = pd.DataFrame(
         pnl_data['records'],
@@ -365,6 +365,7 @@ def check_alpha_by_self_prod(s, alpha, submitable_alpha_file, mode):
 @while_true_try_decorator
 def run_task(mode, n_jobs):
     n_jobs = int(n_jobs)
+    s = login()
     # mode = "PPAC"  # "USER" or "CONSULTANT" or "PPAC"
     # n_jobs = 1  # 每次检查的数量
     start_date_file = os.path.join(RECORDS_PATH, 'start_date.txt')
@@ -386,29 +387,23 @@ def run_task(mode, n_jobs):
                 elif mode == "PPAC":
                     sh_th = 1
                     fit_th = 0.5
-                need_to_check_alpha = get_alphas(start_date, end_date,
-                                        sh_th, fit_th,
-                                        10, 10,
-                                        region=region, universe="", delay='', instrumentType='',
-                                        alpha_num=9999, usage="submit", tag='', color_exclude='RED', s=s)
-
-                if len(need_to_check_alpha['check']) == 0:
+                # 边翻页边检查：每下载好一页就把其中待检查的因子交给线程池
+                n_check = 0
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    for page in iter_alphas(start_date, end_date,
+                                            sh_th, fit_th,
+                                            10, 10,
+                                            region=region, universe="", delay='', instrumentType='',
+                                            usage="submit", tag='', color_exclude='RED', s=s):
+                        for alpha in page['check']:
+                            executor.submit(check_alpha_by_self_prod, s, alpha, submitable_alpha_file, mode)
+                        n_check += len(page['check'])
+                        print(f"看来有{n_check}个因子等着被check")
+
+                if n_check == 0:
                     print(f"region: {region}", f"universe: all", "No alpha to check.")
                     continue
 
-                print(f"看来有{len(need_to_check_alpha['check'])}个因子等着被check")
-
-                # 将列表等分为n份
-                split_sizes = np.array_split(need_to_check_alpha['check'], max(len(need_to_check_alpha)//10, 1))
-
-                # 将结果转换为列表形式
-                chunks = [list(chunk) for chunk in split_sizes]
-
-                for chunk in chunks:
-                    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
-                        for alpha in chunk:
-                            executor.submit(check_alpha_by_self_prod, s,  alpha, submitable_alpha_file, mode)
-
                 if end_date < str(datetime.now().date()-timedelta(days=3)):
                     with open(start_date_file, 'w') as f:
                         f.write(end_date)
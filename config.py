@@ -7,10 +7,59 @@ if getattr(sys, 'frozen', False):
 else:
     ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
 
-# === 输出记录路径 ===
-RECORDS_PATH = os.path.join(ROOT_PATH, 'records')
+# === 输出记录路径（可用环境变量覆盖，bench.py 用它把记录写到临时目录） ===
+RECORDS_PATH = os.environ.get("BRAIN_RECORDS_PATH", os.path.join(ROOT_PATH, 'records'))
 os.makedirs(RECORDS_PATH, exist_ok=True)
 
+# === 本地缓存路径（算子表等平台元数据，可用环境变量覆盖） ===
+CACHE_PATH = os.environ.get("BRAIN_CACHE_PATH", os.path.join(ROOT_PATH, '.cache'))
+os.makedirs(CACHE_PATH, exist_ok=True)
+
+# === 平台 API 地址（可用环境变量覆盖） ===
+BRAIN_API_URL = os.environ.get("BRAIN_API_URL", "https://api.worldquantbrain.com")
+
+# === 缓存有效期（秒） ===
+OPERATOR_CACHE_TTL = 24 * 60 * 60
+DATAFIELD_CACHE_TTL = 24 * 60 * 60
+
+# === 字段元数据分页并发数 ===
+DATAFIELD_FETCH_WORKERS = 4
+
+# === /users/self/alphas 分页拉取：同时在途请求数与每秒请求预算 ===
+ALPHA_FETCH_CONCURRENCY = 4
+ALPHA_FETCH_RATE = 2.0
+# === 模拟并发窗口（AIMD）：simulate_multiple_tasks 的 n 为初始窗口，最多涨到这个值 ===
+SIM_MAX_CONCURRENCY = 10
+# === 多账号：simulate_multiple_tasks 默认使用的凭证文件（逗号分隔），pool 派给空闲槽位最多的账号 ===
+CREDENTIAL_FILES = os.environ.get("BRAIN_CREDENTIAL_FILES", "user_info.txt").split(",")
+# === 所有在途模拟共用的进度轮询：每秒最多发出的 GET 次数 ===
+SIM_POLL_RATE = 10.0
+# === multi simulation 完成后并发查询子模拟、打标签的请求数 ===
+CHILD_FETCH_CONCURRENCY = 5
+# === 异步会话在 token 过期前多少秒后台换新；旧会话保留多少秒让在途请求完成 ===
+SESSION_ROTATE_AHEAD = 10*60
+SESSION_RETIRE_GRACE = 120
+# === records/*_simulated_alpha_expression.txt 缓冲写入：攒够多少行或隔多少秒落盘一次 ===
+RECORDS_FLUSH_LINES = 200
+RECORDS_FLUSH_INTERVAL = 1.0
+# === 模拟指标（records/{tag}_metrics.prom / .json）每隔多少秒导出一次 ===
+METRICS_EXPORT_INTERVAL = 30
+# === 提交前静态检查（expr_validator）：单个表达式允许的算子个数上限 ===
+MAX_OPERATOR_COUNT = 64
+# === 流式生成表达式（expr_stream）：去重记住的最近不同表达式条数、打乱缓冲区大小 ===
+STREAM_DEDUP_CAPACITY = 500_000
+STREAM_SHUFFLE_BUFFER = 10_000
+# === 确定性枚举（enum_cursor）：默认种子；records/{tag}_cursor.json 每前进多少条落盘一次 ===
+ENUM_SEED = 20240101
+CURSOR_SAVE_EVERY = 100
+# 为 True 时 DIG1_fast 枚举出的表达式再和 records/ 全局历史做差集（跨 tag 去重），默认只按游标续跑
+ENUM_DEDUP_HISTORY = False
+# === 结构化事件日志（records/events.jsonl）与终端输出的级别，可用环境变量覆盖 ===
+LOG_LEVEL = os.environ.get("BRAIN_LOG_LEVEL", "INFO")
+LOG_CONSOLE_LEVEL = os.environ.get("BRAIN_LOG_CONSOLE_LEVEL", "INFO")
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
 # === 支持区域列表 ===
 REGION_LIST = ['USA', 'GLB', 'EUR', 'ASI', 'CHN']
 
@@ -0,0 +1,121 @@
+"""
+确定性、可续跑的候选枚举
+
+DIG1_fast 原来每轮用不带种子的 random.sample / random.choice 挑窗口和分组：plan_dataset 统计出的条数
+和 run_task 实际生成的对不上，每次重跑都换一批随机子集，再拿去和历史记录做差集。这里：
+- seeded_order     : 字段去重、排序后按种子打乱，顺序只由字段集合和种子决定，与接口返回的顺序无关
+- field_rng        : 每个字段一个独立的 random.Random(种子:字段)，一个字段的候选不受其他字段影响
+- EnumerationCursor: records/{tag}_cursor.json 记下枚举到第几个字段的第几条，下次从这里继续生成，
+                     之前的字段不再生成；字段集合或种子变了就从头开始。
+                     游标只推进到"之前的候选都已经有结果"的位置，进了 pool 但还没跑完的不算
+
+用法:
+    cursor = EnumerationCursor(tag, fields)
+    with cursor:
+        for alpha, position in factory(cursor.fields, seed=cursor.seed, start=cursor.position, positions=True):
+            cursor.issue(position, alpha)
+            submit(alpha, on_done=cursor.done)  # 结果落盘后回调 cursor.done([alpha, ...])
+        cursor.finish()
+"""
+import os
+import random
+import hashlib
+from collections import deque
+
+from config import RECORDS_PATH, ENUM_SEED, CURSOR_SAVE_EVERY
+from brain_cache import read_json_cache, write_json_cache
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+
+def seeded_order(fields, seed=ENUM_SEED):
+    order = sorted(dict.fromkeys(fields))
+    random.Random(str(seed)).shuffle(order)
+    return order
+
+
+def field_rng(field, seed=ENUM_SEED):
+    # 字符串种子走 sha512，跨进程、跨运行都一样（不受 PYTHONHASHSEED 影响）
+    return random.Random(f"{seed}:{field}")
+
+
+def fields_digest(fields, seed=ENUM_SEED):
+    h = hashlib.sha1(str(seed).encode('utf-8'))
+    for field in sorted(set(fields)):
+        h.update(b'\0' + field.encode('utf-8'))
+    return h.hexdigest()
+
+
+class EnumerationCursor:
+    """
+    position = (字段序号, 字段内序号)：下次从这里开始生成。
+    issue() 记下发出去（进了 pool）的候选，done() 在这些表达式不用再提交时调用（结果落盘、被拒或重试耗尽、
+    提交前被跳过、或交给模拟日志续跑）；position 停在最早一条还没 done 的候选上。还在队列里或在途的候选会挡住游标，
+    中断或崩溃后从它们开始重新生成，其中已经有结果的会被本机结果缓存跳过。
+    每 done save_every 条落盘一次，退出 with 块时再落盘一次
+    """
+
+    def __init__(self, tag, fields, seed=ENUM_SEED, path=None, save_every=CURSOR_SAVE_EVERY):
+        self.path = path or os.path.join(RECORDS_PATH, f'{tag}_cursor.json')
+        self.seed = seed
+        self.fields = seeded_order(fields, seed)
+        self.digest = fields_digest(self.fields, seed)
+        self.save_every = save_every
+        self.position = (0, 0)
+        self.emitted = 0  # 累计 done 的条数（跨运行）
+        self._unsaved = 0
+        self._pending = {}  # 已发出、还没 done 的位置（按发出顺序，也就是枚举顺序）
+        self._issued = {}   # 表达式 -> 位置队列
+
+        data = read_json_cache(self.path)
+        if data and data.get('digest') == self.digest:
+            self.position = tuple(data['position'])
+            self.emitted = data.get('emitted', 0)
+        elif data:
+            log.warning('cursor reset, fields or seed changed', path=self.path, fields=len(self.fields))
+        self._next = self.position  # 全部 done 之后游标移到这里
+
+    @property
+    def exhausted(self):
+        return self.position[0] >= len(self.fields)
+
+    def issue(self, position, alpha):
+        """位置 position 上的候选 alpha 已经发出，等它 done"""
+        field, offset = position
+        self._pending[position] = alpha
+        self._issued.setdefault(alpha, deque()).append(position)
+        self._next = (field, offset + 1)
+
+    def done(self, alphas):
+        """这些表达式已经有了结果：游标推进到最早一条还没 done 的候选（没有就是最后发出的那条之后）"""
+        for alpha in alphas:
+            positions = self._issued.get(alpha)
+            if not positions:
+                continue  # 不是本次发出的（例如上次运行留在模拟日志里的）
+            del self._pending[positions.popleft()]
+            if not positions:
+                del self._issued[alpha]
+            self.emitted += 1
+            self._unsaved += 1
+        self.position = next(iter(self._pending), self._next)
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def finish(self):
+        """整个枚举都已发出：还在途的候选都 done 之后游标移到末尾"""
+        self._next = (len(self.fields), 0)
+        if not self._pending:
+            self.position = self._next
+            self.save()
+
+    def save(self):
+        write_json_cache(self.path, {'digest': self.digest, 'seed': self.seed,
+                                     'position': list(self.position), 'emitted': self.emitted})
+        self._unsaved = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.save()
@@ -0,0 +1,247 @@
+"""
+生成表达式用的共享子树（hash-consing）
+
+模板工厂把同样的大子树一遍遍拼成新字符串：_wrap_core 的 -reverse(winsorize(ts_backfill(...), std=4)) 外壳、
+densify(bucket(rank(cap), range=...)) 这类分组……百万级候选就是百万份几乎相同的文本。这里：
+- Expr  : 全局去重的节点，op + 子节点（按对象身份）相同就返回已有对象，结构相等即 `is`，哈希预先算好，都是 O(1)；
+          叶子（字段名、数字、原样拼接的片段如 "close*volume"、"pcr_oi > 1"）不单独建节点
+- Template: 带洞（var）的 Expr，模板本身也只存一份
+- Bound : 模板 + 各个洞的取值，就是一条候选；只是一个小 tuple，相等比较只比模板身份和取值
+- str(x) 时才渲染成 FASTEXPR 文本：模板第一次渲染时编译成 “文本片段 + 洞” 的列表，之后每条候选只是拼接
+
+单层的候选如果都建成 Expr，每层一个节点、一条弱引用表项，反而比字符串更占内存，所以最外层统一用 Template + Bound。
+节点表、模板表都是弱引用表，生成器往后走、没人再引用的节点自动释放。
+
+用法:
+    X, L, g = var('X'), var('L'), var('g')
+    t = template(wrap_core(call('group_neutralize', call('ts_mean', X, L), call('densify', g))), 'X', 'L', 'g')
+    alpha = t.bind('close', 20, 'sector')
+    str(alpha)              # 渲染
+    alpha == t.bind('close', 20, 'sector')
+"""
+import re
+import weakref
+from functools import lru_cache
+
+from fastexpr import parse, FastExprSyntaxError, BINARY_PRECEDENCE, UNARY, ATOM, _precedence
+
+HOLE = '$'  # var 节点的 op
+
+_nodes = weakref.WeakValueDictionary()
+_templates = weakref.WeakValueDictionary()
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+class Expr:
+    """
+    全局唯一的表达式节点。op 为函数名（也可以是 var，函数名本身作为洞）、二元运算符，
+    或一元负号（op 为 '-' 且只有一个参数）；args 为子节点或叶子，kwargs 为 ((name, value), ...)
+    """
+    __slots__ = ('op', 'args', 'kwargs', '_hash', '__weakref__')
+
+    def __new__(cls, op, args=(), kwargs=()):
+        key = (op, args, kwargs)
+        node = _nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node.op, node.args, node.kwargs = op, args, kwargs
+            node._hash = hash(key)
+            _nodes[key] = node
+        return node
+
+    def __hash__(self):
+        return self._hash
+
+    # __eq__ 沿用 object 的身份比较：节点是唯一的，结构相等就是同一个对象
+
+    def __str__(self):
+        return render(self)
+
+    def __repr__(self):
+        return f'Expr({render(self)!r})'
+
+    def __neg__(self):
+        return Expr('-', (self,))
+
+    def __add__(self, other):
+        return binop('+', self, other)
+
+    def __radd__(self, other):
+        return binop('+', other, self)
+
+    def __sub__(self, other):
+        return binop('-', self, other)
+
+    def __rsub__(self, other):
+        return binop('-', other, self)
+
+    def __mul__(self, other):
+        return binop('*', self, other)
+
+    def __rmul__(self, other):
+        return binop('*', other, self)
+
+    def __truediv__(self, other):
+        return binop('/', self, other)
+
+    def __rtruediv__(self, other):
+        return binop('/', other, self)
+
+
+def call(func, *args, **kwargs):
+    return Expr(func, args, tuple(kwargs.items()))
+
+
+def binop(op, left, right):
+    if op not in BINARY_PRECEDENCE:
+        raise ValueError(f"unknown operator {op!r}")
+    return Expr(op, (left, right))
+
+
+def var(name):
+    """模板里的洞"""
+    return Expr(HOLE, (name,))
+
+
+class Template:
+    """带洞的表达式；holes 给出 bind 时各取值的顺序"""
+    __slots__ = ('root', 'holes', '_parts', '__weakref__')
+
+    def __new__(cls, root, holes):
+        key = (root, holes)
+        t = _templates.get(key)
+        if t is None:
+            t = object.__new__(cls)
+            t.root, t.holes, t._parts = root, holes, None
+            _templates[key] = t
+        return t
+
+    def bind(self, *values):
+        if len(values) != len(self.holes):
+            raise TypeError(f"template takes {len(self.holes)} values {self.holes}, got {len(values)}")
+        return Bound((self,) + values)
+
+    def render(self, values):
+        if self._parts is None:
+            index = {name: i for i, name in enumerate(self.holes)}
+            self._parts = tuple(_compile(self.root, 0, index))
+        return ''.join(p if p.__class__ is str else _text(values[p[0]], p[1]) for p in self._parts)
+
+    def __repr__(self):
+        return f'Template({render(self.root)!r}, {self.holes!r})'
+
+
+def template(root, *holes):
+    return Template(root, holes)
+
+
+class Bound(tuple):
+    """一条候选：(Template, 取值1, 取值2, ...)"""
+    __slots__ = ()
+
+    @property
+    def template(self):
+        return self[0]
+
+    @property
+    def values(self):
+        return self[1:]
+
+    def __str__(self):
+        return self[0].render(self[1:])
+
+    def __repr__(self):
+        return f'Bound({str(self)!r})'
+
+
+# ---------------- 渲染 ----------------
+@lru_cache(maxsize=4096)
+def _leaf_precedence(text):
+    """原样拼接的片段按解析结果定优先级，解析不了的一律加括号"""
+    if _IDENTIFIER.fullmatch(text):
+        return ATOM
+    try:
+        return _precedence(parse(text))
+    except FastExprSyntaxError:
+        return 0
+
+
+def _node_precedence(node):
+    if node.op in BINARY_PRECEDENCE and len(node.args) == 2:
+        return BINARY_PRECEDENCE[node.op]
+    if node.op == '-' and len(node.args) == 1:
+        return UNARY
+    return ATOM
+
+
+def _precedence_of(value):
+    if isinstance(value, Expr):
+        return _node_precedence(value)
+    if isinstance(value, Bound):
+        root = value[0].root
+        if root.op == HOLE:
+            return _precedence_of(value[1 + value[0].holes.index(root.args[0])])
+        return _node_precedence(root)
+    if isinstance(value, str):
+        return _leaf_precedence(value)
+    return UNARY if value < 0 else ATOM
+
+
+def _text(value, min_precedence=0):
+    text = render(value) if isinstance(value, Expr) else str(value)
+    return f'({text})' if _precedence_of(value) < min_precedence else text
+
+
+def _compile(node, min_precedence, holes):
+    """把节点展开成文本片段与 (洞的序号, 所需优先级)；不含洞的子树直接渲染成文本"""
+    if not isinstance(node, Expr):
+        yield _text(node, min_precedence)
+        return
+    if node.op == HOLE:
+        yield (holes[node.args[0]], min_precedence)
+        return
+    p = _node_precedence(node)
+    if p < min_precedence:
+        yield '('
+    if p != ATOM and len(node.args) == 2:  # 二元运算，^ 右结合
+        left, right = (p + 1, p) if node.op == '^' else (p, p + 1)
+        yield from _compile(node.args[0], left, holes)
+        yield f' {node.op} '
+        yield from _compile(node.args[1], right, holes)
+    elif p == UNARY:
+        yield '-'
+        yield from _compile(node.args[0], UNARY + 1, holes)
+    else:
+        yield from _compile(node.op, 0, holes) if isinstance(node.op, Expr) else (node.op,)
+        yield '('
+        first = True
+        for arg in node.args:
+            if not first:
+                yield ', '
+            yield from _compile(arg, 0, holes)
+            first = False
+        for name, value in node.kwargs:
+            if not first:
+                yield ', '
+            yield f'{name}='
+            yield from _compile(value, 0, holes)
+            first = False
+        yield ')'
+    if p < min_precedence:
+        yield ')'
+
+
+@lru_cache(maxsize=65536)
+def render(node):
+    """不含洞的 Expr 渲染成文本"""
+    parts = list(_compile(node, 0, {}))
+    if any(p.__class__ is not str for p in parts):
+        raise ValueError(f"expression has unbound holes; use template(...).bind(...)")
+    return ''.join(parts)
+
+
+def wrap_core(expr, backfill_window=120, winsor_std=4.0, do_reverse=True):
+    """MachinelibTemplates._wrap_core 的节点版本"""
+    core = call('ts_backfill', expr, backfill_window) if backfill_window else expr
+    core = call('winsorize', core, std=winsor_std) if winsor_std else core
+    return -call('reverse', core) if do_reverse else core
@@ -0,0 +1,145 @@
+"""
+模板组合的下标空间：不展开笛卡尔积也能知道大小、按下标取点、均匀不放回抽样
+
+combo_* 这类组合动辄上千万条，原来的做法是全部生成、shuffle、再取前 1000 条。
+这里把组合看成混合进制的数：每个轴是一位，第 i 个点按各轴长度逐位拆出下标，
+取点只是几次 divmod，抽样只需记住抽过的下标：
+- ProductSpace: 若干轴的笛卡尔积，点的顺序与 itertools.product 相同（最后一轴变化最快），
+                每个点交给 build 组装（通常是 Template.bind）；轴也可以是另一个空间
+- ChainSpace  : 几个空间首尾相接（模板族合并），按各自大小的前缀和定位
+- iter_sample : 不放回、随机顺序逐条产出：用带随机密钥的 Feistel 置换打乱下标，不记录取过哪些，内存与空间大小无关
+
+用法:
+    space = ProductSpace([fields, windows, groups], t.bind)
+    len(space)                      # 不用生成就知道大小
+    space[123456]                   # 第 123456 个点
+    batch = space.sample(1000)      # 均匀不放回抽 1000 条
+    fresh = (a for a in map(str, iter_sample(space)) if a not in completed)
+"""
+import random
+import itertools
+from bisect import bisect_right
+
+
+class Space:
+    """下标空间的公共接口：子类实现 __len__ / _get / __iter__"""
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("space index out of range")
+        return self._get(i)
+
+    def sample(self, k, rng=random):
+        """均匀不放回抽 k 个点（不足 k 个时返回全部，顺序随机）"""
+        return [self._get(i) for i in rng.sample(range(len(self)), min(k, len(self)))]
+
+
+class ProductSpace(Space):
+    """
+    axes 的笛卡尔积；build(*各轴取值) 组装一个点，默认返回 tuple。
+    普通轴按原顺序去重（重复的取值只会产出重复的点）；轴是 Space 时原样使用
+    """
+
+    def __init__(self, axes, build=None):
+        self.axes = [a if isinstance(a, Space) else list(dict.fromkeys(a)) for a in axes]
+        self.build = build or (lambda *values: values)
+        self.radices = [len(a) for a in self.axes]
+        self._size = 1
+        for r in self.radices:
+            self._size *= r
+
+    def __len__(self):
+        return self._size
+
+    def _get(self, i):
+        values = [None] * len(self.axes)
+        for j in range(len(self.axes) - 1, -1, -1):
+            i, d = divmod(i, self.radices[j])
+            values[j] = self.axes[j][d]
+        return self.build(*values)
+
+    def __iter__(self):
+        # 逐轴嵌套展开，不预先生成任何轴的组合；轴是 Space 时每一轮都惰性地重新遍历
+        if not self._size:
+            return
+        if not self.axes:
+            yield self.build()
+            return
+        yield from self._walk(0, ())
+
+    def _walk(self, j, prefix):
+        if j == len(self.axes) - 1:
+            for value in self.axes[j]:
+                yield self.build(*prefix, value)
+            return
+        for value in self.axes[j]:
+            yield from self._walk(j + 1, prefix + (value,))
+
+
+class ChainSpace(Space):
+    """几个空间首尾相接，下标依次落在各个子空间里"""
+
+    def __init__(self, *spaces):
+        self.spaces = list(spaces)
+        self.offsets = list(itertools.accumulate((len(s) for s in self.spaces), initial=0))
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def _get(self, i):
+        j = bisect_right(self.offsets, i) - 1
+        return self.spaces[j]._get(i - self.offsets[j])
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.spaces)
+
+
+_MASK64 = (1 << 64) - 1
+
+
+class FeistelPermutation:
+    """
+    range(n) 上的伪随机置换：在不小于 n 的 2^(2h) 个数上做几轮 Feistel（每轮一个随机密钥），
+    结果 >= n 时接着置换（cycle-walking）直到落回 range(n)；平均不到 4 步，不保存任何下标
+    """
+
+    def __init__(self, n, rng=random, rounds=4):
+        self.n = n
+        bits = max(2, (n - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.keys = [rng.getrandbits(64) for _ in range(rounds)]
+
+    def _round(self, x, key):
+        x = (x * 0x9E3779B97F4A7C15 + key) & _MASK64
+        x ^= x >> 29
+        x = (x * 0xBF58476D1CE4E5B9) & _MASK64
+        return (x ^ (x >> 32)) & self.mask
+
+    def _permute(self, i):
+        left, right = i >> self.half, i & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half) | right
+
+    def __call__(self, i):
+        i = self._permute(i)
+        while i >= self.n:
+            i = self._permute(i)
+        return i
+
+
+def iter_sample(space, rng=random):
+    """
+    按随机顺序不放回地逐条产出 space 的全部点（惰性，取多少算多少）；
+    下标经 FeistelPermutation 打乱，内存是常数，不随空间大小或已取条数增长
+    """
+    n = len(space)
+    if not n:
+        return
+    permutation = FeistelPermutation(n, rng)
+    for i in range(n):
+        yield space._get(permutation(i))
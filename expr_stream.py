@@ -0,0 +1,119 @@
+"""
+表达式流：生成、去重、打乱、抽样都逐条处理，不把整个搜索空间放进内存
+
+模板工厂（first_order_factory、MachinelibTemplates.build_* ...）返回完整列表，
+combo_heavy 这类组合一次就是几百万条字符串，再经 _uniq / dict.fromkeys 各拷一份。
+这里的工具都接受任意可迭代对象，只保留有界的状态：
+- unique          : 按 FASTEXPR 规范形式去重，只记最近 capacity 个不同表达式的 64 位摘要（LRU）；
+                    重复的表达式大多出现在同一段笛卡尔积附近，超出窗口的极少数漏网的由
+                    records_index / sim_cache 在提交前兜底
+- reservoir_sample: 蓄水池抽样，等价于 “全部 shuffle 后取前 k 条”，内存只有 k 条
+- bounded_shuffle : 固定大小缓冲区内随机打乱后产出，适合全部都要提交的场景
+- Counted         : 包一层计数，流跑完之后还能报告生成了多少条
+
+用法:
+    alphas = Counted(unique(MachinelibTemplates.iter_twin_ops(fields, twin_fields)))
+    batch = reservoir_sample(iter_filter_simulated(alphas), 1000)
+    print(alphas.count, len(batch))
+"""
+import random
+import hashlib
+from collections import OrderedDict
+
+from config import STREAM_DEDUP_CAPACITY, STREAM_SHUFFLE_BUFFER
+from fastexpr import canonical_key
+
+
+def expression_digest(expression, key=canonical_key):
+    """规范形式的 64 位摘要（int），比保存整条字符串省内存"""
+    return int.from_bytes(hashlib.blake2b(key(str(expression)).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class BoundedSeen:
+    """
+    最近 capacity 个不同表达式的摘要（LRU）：再次出现的表达式会刷新位置，
+    超出容量时淘汰最久没出现过的那个。
+    key=None 时直接记元素本身（expr_dag 的节点按结构哈希，不用渲染、解析）
+    """
+
+    def __init__(self, capacity=STREAM_DEDUP_CAPACITY, key=canonical_key):
+        self.capacity = capacity
+        self.key = key
+        self._digests = OrderedDict()
+        self.evicted = 0
+
+    def add(self, expression):
+        """记下 expression；之前（窗口内）没见过返回 True"""
+        digest = expression if self.key is None else expression_digest(expression, self.key)
+        if digest in self._digests:
+            self._digests.move_to_end(digest)
+            return False
+        self._digests[digest] = None
+        if self.capacity and len(self._digests) > self.capacity:
+            self._digests.popitem(last=False)
+            self.evicted += 1
+        return True
+
+    def __contains__(self, expression):
+        return (expression if self.key is None else expression_digest(expression, self.key)) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+
+def unique(expressions, capacity=STREAM_DEDUP_CAPACITY, key=canonical_key):
+    """
+    按原顺序产出规范形式没出现过的表达式（惰性）；
+    元素也可以是 (expression, ...) 元组，按第一个元素判断（expr_dag.Bound 虽然是 tuple 子类，按整体判断）
+    """
+    seen = BoundedSeen(capacity, key)
+    for item in expressions:
+        if seen.add(item[0] if type(item) in (tuple, list) else item):
+            yield item
+
+
+def reservoir_sample(iterable, k, rng=random):
+    """从流里等概率抽 k 条（Algorithm R），返回顺序随机的列表；不足 k 条时返回全部"""
+    sample = []
+    for i, item in enumerate(iterable):
+        if i < k:
+            sample.append(item)
+        else:
+            j = rng.randrange(i + 1)
+            if j < k:
+                sample[j] = item
+    rng.shuffle(sample)
+    return sample
+
+
+def bounded_shuffle(iterable, buffer_size=STREAM_SHUFFLE_BUFFER, rng=random):
+    """
+    缓冲区内随机打乱后逐条产出：每来一条就从缓冲区随机换出一条。
+    buffer_size 不小于总条数时等价于完整 shuffle
+    """
+    buffer = []
+    for item in iterable:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        j = rng.randrange(buffer_size)
+        buffer[j], item = item, buffer[j]
+        yield item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class Counted:
+    """迭代时计数的包装：count 为已经取出的条数"""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.count += 1
+        return item
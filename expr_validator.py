@@ -0,0 +1,248 @@
+"""
+提交前的表达式静态检查
+
+很多表达式要等提交、轮询一整轮之后才失败，有的还白占一个模拟槽位。这里在进 pool 之前用
+本地缓存的算子表（brain_cache.OperatorCatalog）和字段元数据（fetch_datafields）检查：
+- syntax / placeholder : 解析失败；template_factory 里没格式化的 {field} 之类占位符
+- unknown_operator     : 算子不在 /operators 里
+- arity / keyword      : 参数个数、关键字参数与算子 definition 不符
+- vector_type          : vec_* 作用在非 VECTOR 字段上，或 VECTOR 字段没经过 vec_* 直接参与运算
+- unknown_field        : 字段不在给定的 region / universe 字段表里（传了 fields 才检查）
+- operator_count       : 算子个数超过平台上限
+
+用法:
+    validator = ExpressionValidator(operator_catalog, fields=get_datafields(...))
+    problems = validator.check(expression)      # [] 表示通过
+    valid, invalid = validator.split(alpha_list)
+"""
+import re
+from collections import namedtuple
+
+from config import MAX_OPERATOR_COUNT
+from fastexpr import parse, FastExprSyntaxError, Name, Num, Call, UnaryOp, BinOp, Ternary, Assign, Program
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+Problem = namedtuple('Problem', ['kind', 'message'])
+Signature = namedtuple('Signature', ['required', 'keywords', 'variadic'])
+
+# 没有出现在数据集字段表里、但所有 region 都能用的名字（pv1 基础字段、分组字段、常量）
+BUILTIN_NAMES = {
+    'open', 'high', 'low', 'close', 'vwap', 'volume', 'returns', 'cap', 'adv20', 'sharesout', 'dividend',
+    'split', 'market', 'country', 'exchange', 'sector', 'industry', 'subindustry',
+    'true', 'false', 'nan', 'inf',
+}
+_PLACEHOLDER = re.compile(r'\{[A-Za-z_][A-Za-z0-9_]*\}')
+_KEYWORD = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*=(?!=)')
+
+
+def _split_params(text):
+    """按顶层逗号切分，跳过括号与引号内部"""
+    params, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            params.append(text[start:i])
+            start = i + 1
+    params.append(text[start:])
+    return [p.strip() for p in params if p.strip()]
+
+
+def parse_signature(name, definition):
+    """
+    从算子的 definition（例如 "ts_regression(y, x, d, lag = 0, rettype = 0)"）推出参数要求；
+    写法认不出时返回 None，不做参数检查
+    """
+    start = (definition or '').find(name + '(')
+    if start < 0:
+        return None
+    i = start + len(name) + 1
+    depth, quote = 1, None
+    for j in range(i, len(definition)):
+        ch = definition[j]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                break
+    else:
+        return None
+    required, keywords, variadic = 0, set(), False
+    for param in _split_params(definition[i:j]):
+        if '..' in param:
+            variadic = True
+        elif _KEYWORD.match(param):
+            keywords.update(_KEYWORD.findall(param))  # "range=... or buckets=..." 这类写法里的每个名字都算
+        elif not keywords:
+            required += 1
+    return Signature(required, frozenset(keywords), variadic)
+
+
+def count_operators(tree):
+    """平台口径的算子个数：函数调用与运算符（负号字面量不算）"""
+    if isinstance(tree, Program):
+        return sum(count_operators(s) for s in tree.body)
+    if isinstance(tree, Assign):
+        return count_operators(tree.value)
+    if isinstance(tree, Call):
+        return 1 + sum(count_operators(a) for a in tree.args) + sum(count_operators(v) for _, v in tree.kwargs)
+    if isinstance(tree, UnaryOp):
+        return (0 if isinstance(tree.operand, Num) else 1) + count_operators(tree.operand)
+    if isinstance(tree, BinOp):
+        return 1 + count_operators(tree.left) + count_operators(tree.right)
+    if isinstance(tree, Ternary):
+        return 1 + sum(count_operators(n) for n in tree)
+    return 0
+
+
+class ExpressionValidator:
+    """
+    operators: OperatorCatalog，或 /operators 返回的 list[dict]；None 时不检查算子
+    fields   : 该 region / delay / universe 的字段元数据（fetch_datafields 的 list[dict] 或 get_datafields 的 DataFrame）；
+               None 时不检查字段是否存在，VECTOR 字段也只能从 vec_* 的参数形式上检查
+    """
+
+    def __init__(self, operators=None, fields=None, max_operators=MAX_OPERATOR_COUNT):
+        self._operators_source = operators
+        self._signatures = None
+        self.max_operators = max_operators
+        self.field_types = None
+        if fields is not None:
+            records = fields.to_dict('records') if hasattr(fields, 'to_dict') else fields
+            self.field_types = {f['id']: f.get('type', 'MATRIX') for f in records}
+
+    @property
+    def signatures(self):
+        """算子名 -> Signature（None 表示 definition 认不出）；算子表取不到时为 None，跳过算子检查"""
+        if self._signatures is None and self._operators_source is not None:
+            source = self._operators_source
+            try:
+                operators = source.operators if hasattr(source, 'operators') else source
+                self._signatures = {op['name']: parse_signature(op['name'], op.get('definition'))
+                                    for op in operators}
+            except Exception as e:
+                log.warning('operator catalog unavailable, skipping operator checks', error=str(e))
+                self._operators_source = None
+        return self._signatures
+
+    def check(self, expression):
+        """返回 Problem 列表，空列表表示通过"""
+        expression = str(expression)
+        placeholder = _PLACEHOLDER.search(expression)
+        if placeholder:
+            return [Problem('placeholder', f"unformatted placeholder {placeholder.group()}")]
+        try:
+            tree = parse(expression)
+        except FastExprSyntaxError as e:
+            return [Problem('syntax', str(e))]
+
+        problems = []
+        n_ops = count_operators(tree)
+        if self.max_operators and n_ops > self.max_operators:
+            problems.append(Problem('operator_count', f"{n_ops} operators > limit {self.max_operators}"))
+
+        variables = set()
+        for statement in (tree.body if isinstance(tree, Program) else (tree,)):
+            if isinstance(statement, Assign):
+                self._check_node(statement.value, variables, problems)
+                variables.add(statement.name)
+            else:
+                self._check_node(statement, variables, problems)
+        return problems
+
+    def _is_vector(self, node):
+        return (isinstance(node, Name) and self.field_types is not None
+                and self.field_types.get(node.id) == 'VECTOR')
+
+    def _check_node(self, node, variables, problems, parent=None):
+        if isinstance(node, Name):
+            if node.id in variables or node.id.lower() in BUILTIN_NAMES:
+                return
+            if self.field_types is not None and node.id not in self.field_types:
+                problems.append(Problem('unknown_field', f"field {node.id} not available"))
+            elif self._is_vector(node) and not (parent or '').startswith('vec_'):
+                problems.append(Problem('vector_type', f"VECTOR field {node.id} used outside vec_* in "
+                                                       f"{parent or 'expression'}"))
+            return
+
+        if isinstance(node, Call):
+            self._check_call(node, problems)
+            for arg in node.args:
+                self._check_node(arg, variables, problems, node.func)
+            for _, value in node.kwargs:
+                self._check_node(value, variables, problems, node.func)
+            return
+
+        if isinstance(node, (UnaryOp, BinOp, Ternary)):
+            children = (node.operand,) if isinstance(node, UnaryOp) else \
+                (node.left, node.right) if isinstance(node, BinOp) else tuple(node)
+            for child in children:
+                self._check_node(child, variables, problems, getattr(node, 'op', '?:'))
+
+    def _check_call(self, node, problems):
+        func = node.func
+        if func.startswith('vec_'):
+            first = node.args[0] if node.args else None
+            if first is not None and not isinstance(first, Name):
+                problems.append(Problem('vector_type', f"{func} needs a VECTOR field, got an expression"))
+            elif (isinstance(first, Name) and self.field_types is not None
+                  and self.field_types.get(first.id, 'VECTOR') != 'VECTOR'):
+                problems.append(Problem('vector_type', f"{func} applied to {self.field_types[first.id]} "
+                                                       f"field {first.id}"))
+
+        signatures = self.signatures
+        if signatures is None:
+            return
+        if func not in signatures:
+            problems.append(Problem('unknown_operator', f"operator {func} not available"))
+            return
+        sig = signatures[func]
+        if sig is None:
+            return
+        n_args = len(node.args)
+        if n_args < sig.required:
+            problems.append(Problem('arity', f"{func} takes at least {sig.required} arguments, got {n_args}"))
+        elif not sig.variadic and n_args > sig.required + len(sig.keywords):
+            problems.append(Problem('arity', f"{func} takes at most {sig.required + len(sig.keywords)} "
+                                             f"arguments, got {n_args}"))
+        if not sig.variadic:
+            for name, _ in node.kwargs:
+                if name not in sig.keywords:
+                    problems.append(Problem('keyword', f"{func} has no keyword argument {name}"))
+
+    def __call__(self, expression):
+        return not self.check(expression)
+
+    def split(self, expressions):
+        """(通过的列表, [(表达式, problems), ...])"""
+        valid, invalid = [], []
+        for expression in expressions:
+            problems = self.check(expression)
+            if problems:
+                invalid.append((expression, problems))
+            else:
+                valid.append(expression)
+        return valid, invalid
+
+
+def write_report(path, invalid):
+    """把没通过检查的表达式追加到报告文件：表达式<TAB>kind: message; ..."""
+    with open(path, 'a', encoding='utf-8') as f:
+        for expression, problems in invalid:
+            reasons = '; '.join(f'{p.kind}: {p.message}' for p in problems)
+            f.write(f"{' '.join(str(expression).split())}\t{reasons}\n")
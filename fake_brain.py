@@ -0,0 +1,597 @@
+"""
+本地 BRAIN API 替身（aiohttp），用来在没有真实平台的情况下压测客户端
+
+实现客户端用到的接口:
+  POST   /authentication
+  POST   /simulations                  单个或 multi simulation（2~10 个），返回 Location；
+                                        某个账号在途模拟数达到 sim_limit 时 429 + SIMULATION_LIMIT_EXCEEDED
+  GET    /simulations/{id}             未完成时带 Retry-After；完成后返回 alpha 或 children
+  DELETE /simulations/{id}
+  GET    /alphas/{id}、PATCH /alphas/{id}
+  GET    /alphas/{id}/recordsets/pnl、/alphas/{id}/correlations/self|prod（先 Retry-After 再给结果）
+  GET    /users/self/alphas            支持 limit/offset/order、dateCreated 区间等过滤，offset 上限 9900
+  GET    /data-fields、/operators
+
+每个请求先睡 latency（±jitter）秒；max_inflight 限制同时处理的请求数，rate 限制每秒请求数，
+超出时返回 429 + Retry-After。stats() 给出服务端视角的模拟槽位占用和各状态码计数。
+
+单独运行:
+    python fake_brain.py --port 8765 --sim-limit 10 --sim-duration 5
+    BRAIN_API_URL=http://127.0.0.1:8765 python DIG1_fast/DIG1_fast_v2.py ...
+"""
+import time
+import base64
+import random
+import asyncio
+import argparse
+import threading
+import itertools
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+
+from aiohttp import web
+
+TOKEN_COOKIE = 't'
+OFFSET_CAP = 9900
+TZ = timezone(timedelta(hours=-4))  # 平台返回的时间都是 -04:00
+
+OPERATORS = [
+    ("add", "Arithmetic"), ("subtract", "Arithmetic"), ("multiply", "Arithmetic"), ("divide", "Arithmetic"),
+    ("abs", "Arithmetic"), ("log", "Arithmetic"), ("sqrt", "Arithmetic"), ("reverse", "Arithmetic"),
+    ("inverse", "Arithmetic"), ("power", "Arithmetic"), ("signed_power", "Arithmetic"), ("sign", "Arithmetic"),
+    ("s_log_1p", "Arithmetic"), ("sigmoid", "Arithmetic"), ("densify", "Arithmetic"),
+    ("rank", "Cross Sectional"), ("zscore", "Cross Sectional"), ("normalize", "Cross Sectional"),
+    ("quantile", "Cross Sectional"), ("scale", "Cross Sectional"), ("scale_down", "Cross Sectional"),
+    ("winsorize", "Cross Sectional"), ("fraction", "Cross Sectional"),
+    ("ts_rank", "Time Series"), ("ts_zscore", "Time Series"), ("ts_delta", "Time Series"),
+    ("ts_sum", "Time Series"), ("ts_product", "Time Series"), ("ts_ir", "Time Series"),
+    ("ts_std_dev", "Time Series"), ("ts_mean", "Time Series"), ("ts_arg_min", "Time Series"),
+    ("ts_arg_max", "Time Series"), ("ts_min_diff", "Time Series"), ("ts_max_diff", "Time Series"),
+    ("ts_returns", "Time Series"), ("ts_scale", "Time Series"), ("ts_skewness", "Time Series"),
+    ("ts_kurtosis", "Time Series"), ("ts_quantile", "Time Series"), ("ts_backfill", "Time Series"),
+    ("ts_decay_linear", "Time Series"), ("ts_decay_exp_window", "Time Series"), ("ts_corr", "Time Series"),
+    ("ts_covariance", "Time Series"), ("ts_regression", "Time Series"), ("ts_delay", "Time Series"),
+    ("ts_av_diff", "Time Series"), ("ts_count_nans", "Time Series"), ("ts_step", "Time Series"),
+    ("ts_moment", "Time Series"), ("ts_entropy", "Time Series"), ("ts_percentage", "Time Series"),
+    ("ts_min_max_cps", "Time Series"), ("ts_min_max_diff", "Time Series"),
+    ("group_neutralize", "Group"), ("group_rank", "Group"), ("group_normalize", "Group"),
+    ("group_scale", "Group"), ("group_zscore", "Group"), ("group_mean", "Group"), ("group_backfill", "Group"),
+    ("vec_avg", "Vector"), ("vec_sum", "Vector"), ("vec_max", "Vector"), ("vec_count", "Vector"),
+    ("vec_stddev", "Vector"), ("vector_neut", "Transformational"), ("vector_proj", "Transformational"),
+    ("trade_when", "Transformational"), ("bucket", "Transformational"), ("hump", "Transformational"),
+    ("if_else", "Logical"), ("is_nan", "Logical"), ("and", "Logical"), ("or", "Logical"), ("not", "Logical"),
+]
+
+# 参数不止一个的算子的 definition（与平台 /operators 的写法一致），其余都是 name(x)
+DEFINITIONS = {
+    'add': 'add(x, y, filter = false), x + y', 'subtract': 'subtract(x, y, filter=false), x - y',
+    'multiply': 'multiply(x ,y, ... , filter=false), x * y', 'divide': 'divide(x, y), x / y',
+    'power': 'power(x, y)', 'signed_power': 'signed_power(x, y)', 'rank': 'rank(x, rate=2)',
+    'quantile': 'quantile(x, driver = gaussian, sigma = 1.0)', 'scale': 'scale(x, scale=1, longscale=1, shortscale=1)',
+    'winsorize': 'winsorize(x, std=4)', 'normalize': 'normalize(x, useStd = false, limit = 0.0)',
+    'ts_regression': 'ts_regression(y, x, d, lag = 0, rettype = 0)',
+    'ts_backfill': 'ts_backfill(x,lookback = d, k=1, ignore="NAN")',
+    'ts_corr': 'ts_corr(x, y, d)', 'ts_covariance': 'ts_covariance(y, x, d)', 'ts_step': 'ts_step(1)',
+    'ts_decay_exp_window': 'ts_decay_exp_window(x, d, factor = f)', 'ts_quantile': 'ts_quantile(x,d, driver="gaussian" )',
+    'ts_rank': 'ts_rank(x, d, constant = 0)', 'ts_scale': 'ts_scale(x, d, constant = 0)',
+    'ts_moment': 'ts_moment(x, d, k=0)', 'ts_entropy': 'ts_entropy(x,d, buckets = 10)',
+    'ts_percentage': 'ts_percentage(x,d, percentage=0.5)', 'ts_min_max_cps': 'ts_min_max_cps(x, d, f = 2)',
+    'ts_min_max_diff': 'ts_min_max_diff(x, d, f = 0.5)', 'ts_returns': 'ts_returns (x, d, mode = 1)',
+    'group_backfill': 'group_backfill(x, group, d, std = 4.0)', 'group_mean': 'group_mean(x, weight, group)',
+    'vector_neut': 'vector_neut(x, y)', 'vector_proj': 'vector_proj(x, y)', 'trade_when': 'trade_when(x, y, z)',
+    'bucket': 'bucket(rank(x), range="0, 1, 0.1" or buckets = "2,5,6,7,10")', 'hump': 'hump(x, hump = 0.01)',
+    'if_else': 'if_else(input1, input2, input 3)', 'and': 'and(input1, input2)', 'or': 'or(input1, input2)',
+}
+
+DATASETS = ['pv1', 'fundamental6', 'analyst4', 'model16', 'news12', 'option8', 'socialmedia12']
+
+
+def _fmt_date(ts):
+    return datetime.fromtimestamp(ts, TZ).strftime('%Y-%m-%dT%H:%M:%S-04:00')
+
+
+class _Simulation:
+    __slots__ = ('id', 'settings', 'regular', 'children', 'parent', 'started', 'finish', 'ended', 'alpha', 'user')
+
+    def __init__(self, sim_id, settings, regular, started, finish, parent=None, user=None):
+        self.id = sim_id
+        self.user = user
+        self.settings = settings
+        self.regular = regular
+        self.children = []
+        self.parent = parent
+        self.started = started
+        self.finish = finish
+        self.ended = None   # 被 DELETE 的时间
+        self.alpha = None
+
+
+class FakeBrain:
+    """
+    用法:
+        brain = FakeBrain(latency=0.05, sim_limit=10, sim_duration=5)
+        web.run_app(brain.app(), port=8765)
+    或者在后台线程里跑（见 FakeBrainServer）
+    """
+
+    def __init__(self, latency=0.05, jitter=0.5, sim_limit=10, sim_duration=5.0, sim_jitter=0.2,
+                 poll_interval=1.0, corr_delay=1.0, max_inflight=None, rate=None, token_lifetime=3 * 60 * 60,
+                 n_alphas=2000, os_ratio=0.05, fields_per_dataset=200, pnl_days=500,
+                 start_date='2025-01-01', end_date='2025-03-01', seed=0):
+        self.latency = latency
+        self.jitter = jitter                # latency 按 ±jitter 比例随机抖动
+        self.sim_limit = sim_limit          # 每个账号同时在途的模拟（pool）数上限
+        self.sim_duration = sim_duration    # 每个模拟（pool）耗时，秒
+        self.sim_jitter = sim_jitter
+        self.poll_interval = poll_interval  # 未完成时返回的 Retry-After
+        self.corr_delay = corr_delay        # 相关性第一次请求后多久算出结果
+        self.max_inflight = max_inflight    # 同时处理的请求数上限，None 表示不限
+        self.rate = rate                    # 每秒请求数上限，None 表示不限
+        self.token_lifetime = token_lifetime
+        self.pnl_days = pnl_days
+        self.rng = random.Random(seed)
+
+        self._tokens = {}                   # token -> (过期时间戳, 用户名)
+        self._sims = {}
+        self._alphas = {}
+        self._corr_started = {}
+        self._version = 0                   # alpha 有增改时加一，/users/self/alphas 的查询缓存随之失效
+        self._query_cache = {}
+        self._seq = itertools.count(1)
+        self._inflight = 0
+        self._rate_window = (0, 0)          # (所在秒, 该秒已收到的请求数)
+        self.status_counts = Counter()
+        self.endpoint_counts = Counter()
+        self.started_at = time.time()
+
+        self._fields = self._make_fields(fields_per_dataset)
+        self._seed_alphas(n_alphas, os_ratio, start_date, end_date)
+
+    # ------------------ 数据生成 ------------------
+    def _make_fields(self, per_dataset):
+        fields = []
+        for dataset in DATASETS:
+            for i in range(per_dataset):
+                fields.append({
+                    'id': f'{dataset}_field_{i}',
+                    'description': f'synthetic field {i} of {dataset}',
+                    'dataset': {'id': dataset, 'name': dataset},
+                    'category': {'id': dataset.rstrip('0123456789'), 'name': dataset},
+                    'region': 'USA', 'delay': 1, 'universe': 'TOP3000',
+                    'type': 'VECTOR' if i % 10 == 9 else 'MATRIX',
+                    'coverage': round(self.rng.uniform(0.3, 1.0), 4),
+                    'userCount': self.rng.randint(0, 500), 'alphaCount': self.rng.randint(0, 5000),
+                })
+        return fields
+
+    def _seed_alphas(self, n, os_ratio, start_date, end_date):
+        start = datetime.fromisoformat(start_date).replace(tzinfo=TZ).timestamp()
+        end = datetime.fromisoformat(end_date).replace(tzinfo=TZ).timestamp()
+        for i in range(n):
+            settings = {'instrumentType': 'EQUITY', 'region': 'USA', 'universe': 'TOP3000', 'delay': 1,
+                        'decay': self.rng.choice([0, 4, 8]), 'neutralization': 'SUBINDUSTRY'}
+            alpha = self._new_alpha(settings, f'rank(ts_mean(pv1_field_{i % 200}, {5 + i % 60}))',
+                                    self.rng.uniform(start, end))
+            if self.rng.random() < os_ratio:
+                alpha['stage'] = 'OS'
+                alpha['status'] = 'ACTIVE'
+                alpha['dateSubmitted'] = alpha['dateCreated']
+
+    def _new_alpha(self, settings, code, created=None):
+        rng = self.rng
+        alpha_id = 'A%07d' % next(self._seq)
+        sign = 1 if rng.random() < 0.8 else -1
+        sharpe = sign * round(rng.uniform(0.5, 2.5), 2)
+        checks = [
+            {'name': 'LOW_SHARPE', 'result': 'PASS', 'limit': 1.25, 'value': sharpe},
+            {'name': 'CONCENTRATED_WEIGHT', 'result': 'PASS', 'value': round(rng.uniform(0, 0.3), 3)},
+            {'name': 'LOW_SUB_UNIVERSE_SHARPE', 'result': 'PASS', 'value': round(sharpe * 0.8, 2)},
+            {'name': 'LOW_2Y_SHARPE', 'result': 'PASS', 'value': round(sharpe * 1.1, 2)},
+            {'name': 'IS_LADDER_SHARPE', 'result': 'PASS', 'value': round(sharpe * 1.05, 2)},
+            {'name': 'MATCHES_PYRAMID', 'result': 'PASS', 'pyramids': [{'name': 'USA/D1/PV'}]},
+        ]
+        created = _fmt_date(created or time.time())
+        alpha = {
+            'id': alpha_id, 'type': 'REGULAR', 'author': 'FAKE01',
+            'settings': {'instrumentType': 'EQUITY', 'truncation': 0.08, 'pasteurization': 'ON',
+                         'unitHandling': 'VERIFY', 'nanHandling': 'ON', 'language': 'FASTEXPR',
+                         'visualization': False, **settings},
+            'regular': {'code': code, 'description': None, 'operatorCount': code.count('(')},
+            'dateCreated': created, 'dateSubmitted': None, 'dateModified': created,
+            'name': None, 'favorite': False, 'hidden': False, 'color': None, 'category': None,
+            'tags': [], 'classifications': [], 'grade': None, 'stage': 'IS', 'status': 'UNSUBMITTED',
+            'is': {'pnl': rng.randint(-10**6, 10**7), 'bookSize': 20000000,
+                   'longCount': rng.randint(50, 1500), 'shortCount': rng.randint(50, 1500),
+                   'turnover': round(rng.uniform(0.02, 0.8), 4), 'returns': round(rng.uniform(-0.1, 0.3), 4),
+                   'drawdown': round(rng.uniform(0.01, 0.2), 4), 'margin': round(rng.uniform(0, 0.002), 6),
+                   'fitness': round(sharpe * rng.uniform(0.4, 1.0), 2), 'sharpe': sharpe,
+                   'startDate': '2018-01-20', 'checks': checks},
+            'os': None, 'train': None, 'test': None, 'prod': None,
+            'competitions': None, 'themes': None, 'team': None,
+        }
+        self._alphas[alpha_id] = alpha
+        self._version += 1
+        return alpha
+
+    # ------------------ 中间件 ------------------
+    def _limited(self):
+        if self.max_inflight is not None and self._inflight >= self.max_inflight:
+            return True
+        if self.rate is not None:
+            second = int(time.monotonic())
+            bucket, n = self._rate_window
+            n = n + 1 if bucket == second else 1
+            self._rate_window = (second, n)
+            if n > self.rate:
+                return True
+        return False
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        route = request.match_info.route.resource
+        self.endpoint_counts[f"{request.method} {route.canonical if route else request.path}"] += 1
+        if self._limited():
+            response = web.json_response({'detail': 'Too many requests'}, status=429, headers={'Retry-After': '1'})
+        else:
+            self._inflight += 1
+            try:
+                if self.latency:
+                    await asyncio.sleep(self.latency * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+                if request.path != '/authentication' and not self._authorized(request):
+                    response = web.json_response({'detail': 'Incorrect authentication credentials.'}, status=401)
+                else:
+                    response = await handler(request)
+            except web.HTTPException as e:
+                self.status_counts[e.status] += 1
+                raise
+            finally:
+                self._inflight -= 1
+        self.status_counts[response.status] += 1
+        return response
+
+    def _authorized(self, request):
+        expires_at, _ = self._tokens.get(request.cookies.get(TOKEN_COOKIE), (None, None))
+        return expires_at is not None and expires_at > time.time()
+
+    def _user(self, request):
+        return self._tokens.get(request.cookies.get(TOKEN_COOKIE), (None, None))[1]
+
+    # ------------------ 接口 ------------------
+    async def authentication(self, request):
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Basic':
+            return web.json_response({'detail': 'Invalid username or password.'}, status=401)
+        username = base64.b64decode(credentials).decode('utf-8').partition(':')[0]
+        token = '%032x' % self.rng.getrandbits(128)
+        self._tokens[token] = (time.time() + self.token_lifetime, username)
+        response = web.json_response({'user': {'id': 'FAKE01'}, 'token': {'expiry': self.token_lifetime},
+                                      'permissions': ['MULTI_SIMULATION']}, status=201)
+        response.set_cookie(TOKEN_COOKIE, token, path='/')
+        return response
+
+    def active_simulations(self, now=None, user=None):
+        """在途的模拟（pool）数；user 不为 None 时只算该账号的"""
+        now = now or time.time()
+        return sum(1 for sim in self._sims.values()
+                   if sim.parent is None and sim.ended is None and sim.finish > now
+                   and (user is None or sim.user == user))
+
+    async def post_simulation(self, request):
+        payload = await request.json()
+        items = payload if isinstance(payload, list) else [payload]
+        if isinstance(payload, list) and not 2 <= len(payload) <= 10:
+            return web.json_response({'detail': 'Multi simulation requires 2 to 10 alphas.'}, status=400)
+        if any(not isinstance(item.get('regular'), str) or not item['regular'].strip() for item in items):
+            return web.json_response({'regular': ['This field may not be blank.']}, status=400)
+        now = time.time()
+        user = self._user(request)
+        if self.active_simulations(now, user) >= self.sim_limit:
+            return web.json_response({'detail': 'SIMULATION_LIMIT_EXCEEDED'}, status=429,
+                                     headers={'Retry-After': str(self.poll_interval)})
+
+        finish = now + self.sim_duration * self.rng.uniform(1 - self.sim_jitter, 1 + self.sim_jitter)
+        if isinstance(payload, list):
+            sim = _Simulation('S%07d' % next(self._seq), None, None, now, finish, user=user)
+            leaves = [_Simulation('S%07d' % next(self._seq), item.get('settings', {}), item['regular'],
+                                  now, finish, parent=sim) for item in payload]
+            sim.children = [child.id for child in leaves]
+        else:
+            sim = _Simulation('S%07d' % next(self._seq), payload.get('settings', {}), payload['regular'],
+                              now, finish, user=user)
+            leaves = [sim]
+        self._sims[sim.id] = sim
+        for leaf in leaves:
+            self._sims[leaf.id] = leaf
+            leaf.alpha = self._new_alpha(leaf.settings, leaf.regular, finish)['id']
+        location = str(request.url.with_path('/simulations/' + sim.id).with_query(None))
+        return web.Response(status=201, headers={'Location': location})
+
+    async def get_simulation(self, request):
+        sim = self._sims.get(request.match_info['sim_id'])
+        if sim is None or sim.ended is not None:
+            return web.json_response({'detail': 'Not found.'}, status=404)
+        now = time.time()
+        if now < sim.finish:
+            progress = round((now - sim.started) / (sim.finish - sim.started), 2)
+            return web.json_response({'progress': progress}, headers={'Retry-After': str(self.poll_interval)})
+        data = {'id': sim.id, 'type': 'REGULAR', 'status': 'COMPLETE'}
+        if sim.children:
+            data['children'] = sim.children
+        else:
+            data.update({'settings': sim.settings, 'regular': sim.regular, 'alpha': sim.alpha})
+            if sim.parent is not None:
+                data['parent'] = sim.parent.id
+        return web.json_response(data)
+
+    async def delete_simulation(self, request):
+        sim = self._sims.get(request.match_info['sim_id'])
+        if sim is None or sim.ended is not None:
+            return web.json_response({'detail': 'Not found.'}, status=404)
+        sim.ended = time.time()
+        return web.Response(status=204)
+
+    def _alpha_or_404(self, request):
+        alpha = self._alphas.get(request.match_info['alpha_id'])
+        if alpha is None:
+            raise web.HTTPNotFound(text='{"detail": "Not found."}', content_type='application/json')
+        return alpha
+
+    async def get_alpha(self, request):
+        return web.json_response(self._alpha_or_404(request))
+
+    async def patch_alpha(self, request):
+        alpha = self._alpha_or_404(request)
+        params = await request.json()
+        for key in ('name', 'color', 'tags', 'category'):
+            if key in params:
+                alpha[key] = params[key]
+        if 'regular' in params:
+            alpha['regular']['description'] = params['regular'].get('description')
+        alpha['dateModified'] = _fmt_date(time.time())
+        self._version += 1
+        return web.json_response(alpha)
+
+    async def get_pnl(self, request):
+        alpha = self._alpha_or_404(request)
+        rng = random.Random(alpha['id'])
+        day = datetime(2018, 1, 20)
+        pnl, records = 0.0, []
+        for _ in range(self.pnl_days):
+            pnl += rng.gauss(alpha['is']['sharpe'] * 1000, 20000)
+            records.append([day.strftime('%Y-%m-%d'), round(pnl, 2)])
+            day += timedelta(days=1)
+        return web.json_response({'schema': {'name': 'pnl', 'properties': [{'name': 'date', 'type': 'date'},
+                                                                           {'name': 'pnl', 'type': 'amount'}]},
+                                  'records': records})
+
+    async def get_correlation(self, request):
+        alpha = self._alpha_or_404(request)
+        kind = request.match_info['kind']
+        key = (alpha['id'], kind)
+        started = self._corr_started.setdefault(key, time.time())
+        if time.time() - started < self.corr_delay:
+            return web.Response(headers={'Retry-After': str(self.corr_delay)})
+        rng = random.Random('%s/%s' % key)
+        if kind == 'self':
+            properties = [{'name': 'id'}, {'name': 'name'}, {'name': 'correlation'}, {'name': 'sharpe'}]
+            peers = [a for a in self._alphas.values() if a['stage'] == 'OS'][:5]
+            records = [[a['id'], a['name'], round(rng.uniform(-0.3, 0.8), 4), a['is']['sharpe']] for a in peers]
+        elif kind == 'prod':
+            properties = [{'name': 'min'}, {'name': 'max'}, {'name': 'alphas'}]
+            records = [[round(x / 10, 1), round(x / 10 + 0.1, 1), rng.randint(0, 50) if x < 7 else 0]
+                       for x in range(-10, 10)]
+        else:
+            return web.json_response({'detail': 'Not found.'}, status=404)
+        return web.json_response({'schema': {'name': kind, 'properties': properties}, 'records': records})
+
+    async def user_alphas(self, request):
+        limit = int(request.query.get('limit', 10))
+        offset = int(request.query.get('offset', 0))
+        if offset > OFFSET_CAP:
+            return web.json_response({'offset': [f'Ensure this value is less than or equal to {OFFSET_CAP}.']},
+                                     status=400)
+        filters = tuple(sorted(f for f in (_parse_filter(k, v) for k, v in request.query.items()) if f is not None))
+        order = request.query.get('order')
+        # 翻页时同一查询只有 offset 不同，过滤排序的结果按 alpha 版本缓存
+        version, alphas = self._query_cache.get((filters, order), (None, None))
+        if version != self._version:
+            alphas = [a for a in self._alphas.values() if all(_match(a, *f) for f in filters)]
+            if order:
+                field = order.lstrip('-')
+                alphas.sort(key=lambda a: _sort_key(_lookup(a, field)), reverse=order.startswith('-'))
+            self._query_cache[(filters, order)] = (self._version, alphas)
+        return web.json_response({'count': len(alphas), 'next': None, 'previous': None,
+                                  'results': alphas[offset:offset + limit]})
+
+    async def data_fields(self, request):
+        limit = int(request.query.get('limit', 50))
+        offset = int(request.query.get('offset', 0))
+        dataset = request.query.get('dataset.id', '')
+        search = request.query.get('search', '')
+        fields = [f for f in self._fields
+                  if (not dataset or f['dataset']['id'] == dataset) and (not search or search in f['id'])]
+        return web.json_response({'count': len(fields), 'results': fields[offset:offset + limit]})
+
+    async def operators(self, request):
+        return web.json_response([{'name': name, 'category': category, 'scope': ['REGULAR'],
+                                   'definition': DEFINITIONS.get(name, f'{name}(x, d)' if name.startswith('ts_') else
+                                                                 f'{name}(x, group)' if name.startswith('group_') else
+                                                                 f'{name}(x)'),
+                                   'description': ''}
+                                  for name, category in OPERATORS])
+
+    def app(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post('/authentication', self.authentication)
+        app.router.add_post('/simulations', self.post_simulation)
+        app.router.add_get('/simulations/{sim_id}', self.get_simulation)
+        app.router.add_delete('/simulations/{sim_id}', self.delete_simulation)
+        app.router.add_get('/alphas/{alpha_id}', self.get_alpha)
+        app.router.add_patch('/alphas/{alpha_id}', self.patch_alpha)
+        app.router.add_get('/alphas/{alpha_id}/recordsets/pnl', self.get_pnl)
+        app.router.add_get('/alphas/{alpha_id}/correlations/{kind}', self.get_correlation)
+        app.router.add_get('/users/self/alphas', self.user_alphas)
+        app.router.add_get('/data-fields', self.data_fields)
+        app.router.add_get('/operators', self.operators)
+        return app
+
+    # ------------------ 统计 ------------------
+    def stats(self, since=None, until=None):
+        """
+        服务端视角的统计: since~until 之间完成的 alpha 数、模拟槽位平均占用率（按提交过模拟的账号数计算总槽位），
+        以及各状态码 / 接口的请求数
+        """
+        since = since or self.started_at
+        until = until or time.time()
+        elapsed = max(until - since, 1e-9)
+        busy = 0.0
+        completed = 0
+        users = set()
+        for sim in self._sims.values():
+            end = min(sim.finish, sim.ended or sim.finish)
+            if sim.parent is None:
+                busy += max(0.0, min(end, until) - max(sim.started, since))
+                users.add(sim.user)
+            if sim.alpha is not None and sim.ended is None and since <= sim.finish <= until:
+                completed += 1
+        return {
+            'elapsed': round(elapsed, 2),
+            'completed_alphas': completed,
+            'slot_utilization': round(busy / (self.sim_limit * max(1, len(users)) * elapsed), 4),
+            'status_counts': dict(self.status_counts),
+            'endpoint_counts': dict(self.endpoint_counts),
+        }
+
+
+# ------------------ /users/self/alphas 过滤 ------------------
+_SKIP_PARAMS = {'limit', 'offset', 'order'}
+
+
+def _parse_filter(key, value):
+    """
+    把查询参数还原成 (字段, 运算符, 值)。客户端把运算符写进了参数名，例如
+    'is.sharpe%3E=1.25' -> ('is.sharpe>', '1.25')，'dateCreated%3C2025-01-02...' -> ('dateCreated<2025-01-02...', '')
+    """
+    if key in _SKIP_PARAMS:
+        return None
+    for op, length in (('>=', 1), ('<=', 1), ('!=', 1)):
+        if key.endswith(op[0]):
+            field, op = key[:-length], op
+            break
+    else:
+        for op in ('<', '>', '='):
+            if op in key:
+                field, value = key.split(op, 1)
+                break
+        else:
+            field, op = key, '='
+    if value == '':
+        return None  # 空值（如 universe=）表示不过滤
+    return field, op, value
+
+
+def _lookup(alpha, field):
+    value = alpha
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _sort_key(value):
+    return (value is not None, value if value is not None else 0)
+
+
+def _coerce(value, expected):
+    """把查询里的字符串转成与字段值可比较的类型"""
+    if isinstance(value, bool):
+        return value, expected.lower() == 'true'
+    if isinstance(value, (int, float)):
+        return value, float(expected)
+    if isinstance(value, str) and len(value) >= 19 and value[4] == '-' and value[10] == 'T':
+        return datetime.fromisoformat(value), datetime.fromisoformat(expected)
+    return value, expected
+
+
+def _match(alpha, field, op, expected):
+    if field == 'tag':
+        return (expected in alpha['tags']) == (op != '!=')
+    value = _lookup(alpha, field)
+    if value is None:
+        return op == '!='
+    try:
+        value, expected = _coerce(value, expected)
+    except ValueError:
+        return False
+    return {'=': value == expected, '!=': value != expected, '>=': value >= expected,
+            '<=': value <= expected, '>': value > expected, '<': value < expected}[op]
+
+
+class FakeBrainServer:
+    """
+    在后台线程的事件循环里运行 FakeBrain，进程内压测用:
+        server = FakeBrainServer(FakeBrain(...)).start()
+        os.environ['BRAIN_API_URL'] = server.url
+        ...
+        server.stop()
+    """
+
+    def __init__(self, brain, host='127.0.0.1', port=0):
+        self.brain = brain
+        self.host = host
+        self.port = port
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def start(self):
+        ready = threading.Event()
+
+        async def serve():
+            self._runner = web.AppRunner(self.brain.app(), access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            self.port = self._runner.addresses[0][1]
+            self.url = f'http://{self.host}:{self.port}'
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(serve())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 BRAIN API 替身')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的基础延迟（秒）')
+    parser.add_argument('--sim-limit', type=int, default=10, help='每个账号同时在途的模拟数上限')
+    parser.add_argument('--sim-duration', type=float, default=5.0, help='每个模拟耗时（秒）')
+    parser.add_argument('--max-inflight', type=int, default=None, help='同时处理的请求数上限')
+    parser.add_argument('--rate', type=float, default=None, help='每秒请求数上限')
+    parser.add_argument('--alphas', type=int, default=2000, help='预置的 alpha 数量')
+    args = parser.parse_args()
+    brain = FakeBrain(latency=args.latency, sim_limit=args.sim_limit, sim_duration=args.sim_duration,
+                      max_inflight=args.max_inflight, rate=args.rate, n_alphas=args.alphas)
+    web.run_app(brain.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
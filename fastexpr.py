@@ -0,0 +1,341 @@
+"""
+FASTEXPR 解析与规范化
+
+同一个因子可能写成很多样子：template_factory 的多行模板、多余的空格和括号、
+_wrap_core 之类拼出来的 (a) - (b)、平台回传的 regular 与提交时的字符串不一致……
+按原始字符串去重会把它们都当成新表达式。这里把表达式解析成 AST，再按固定规则打印：
+- 空白、换行、多余括号全部去掉，运算符两侧、逗号后统一一个空格
+- 数字统一写法（0.50 -> 0.5，1.0 -> 1，1e3 -> 1000，-1 是字面量）
+- 关键字参数按名字排序；数字列表字符串（range='0.1, 1, 0.1'）去空白
+- 多语句体：把赋值的变量代入最后一个表达式，变量名不同、写成一行还是多行都得到同一结果
+- + 与 * 的连加 / 连乘按项排序
+
+用法:
+    tree = parse(expression)          # 语法错误抛 FastExprSyntaxError
+    to_source(tree)                   # 打印（不改变结构）
+    canonicalize(expression)          # 去重用的规范形式
+"""
+import re
+import math
+from functools import lru_cache
+from collections import namedtuple
+
+# ---------------- AST ----------------
+Num = namedtuple('Num', ['value'])
+Str = namedtuple('Str', ['value'])
+Name = namedtuple('Name', ['id'])
+Call = namedtuple('Call', ['func', 'args', 'kwargs'])          # args: (node, ...)；kwargs: ((name, node), ...)
+UnaryOp = namedtuple('UnaryOp', ['op', 'operand'])
+BinOp = namedtuple('BinOp', ['op', 'left', 'right'])
+Ternary = namedtuple('Ternary', ['cond', 'then', 'otherwise'])
+Assign = namedtuple('Assign', ['name', 'value'])
+Program = namedtuple('Program', ['body'])                    # 多语句：(Assign, ..., 表达式)
+
+# 运算符优先级（数字越大结合越紧）
+TERNARY, OR, AND, COMPARE, ADD, MUL, UNARY, POWER, ATOM = range(1, 10)
+BINARY_PRECEDENCE = {
+    '||': OR, '&&': AND,
+    '==': COMPARE, '!=': COMPARE, '<': COMPARE, '>': COMPARE, '<=': COMPARE, '>=': COMPARE,
+    '+': ADD, '-': ADD, '*': MUL, '/': MUL, '^': POWER,
+}
+COMMUTATIVE_OPS = {'+', '*'}
+COMMUTATIVE_FUNCS = {'add', 'multiply', 'max', 'min'}
+CONSTANT_NAMES = {'true', 'false', 'nan', 'inf'}  # 平台不区分大小写
+
+
+class FastExprSyntaxError(ValueError):
+    def __init__(self, message, expression='', pos=None):
+        self.expression = expression
+        self.pos = pos
+        if pos is not None:
+            message = f"{message} at {pos}: {expression[max(0, pos - 20):pos + 20]!r}"
+        super().__init__(message)
+
+
+# ---------------- 词法 ----------------
+_NUMBER = r'(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?'
+_TOKEN = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<number>%s)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<string>'[^']*'|"[^"]*")
+  | (?P<op>&&|\|\||==|!=|<=|>=|[-+*/^<>!?:=;,()])
+''' % _NUMBER, re.VERBOSE)
+
+Token = namedtuple('Token', ['kind', 'text', 'pos'])
+
+
+def tokenize(expression):
+    tokens = []
+    pos = 0
+    while pos < len(expression):
+        m = _TOKEN.match(expression, pos)
+        if m is None:
+            raise FastExprSyntaxError(f"unexpected character {expression[pos]!r}", expression, pos)
+        if m.lastgroup != 'ws':
+            tokens.append(Token(m.lastgroup, m.group(), pos))
+        pos = m.end()
+    tokens.append(Token('end', '', pos))
+    return tokens
+
+
+# ---------------- 语法 ----------------
+class _Parser:
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.i = 0
+
+    @property
+    def tok(self):
+        return self.tokens[self.i]
+
+    def peek(self, offset=1):
+        return self.tokens[min(self.i + offset, len(self.tokens) - 1)]
+
+    def error(self, message):
+        raise FastExprSyntaxError(message, self.expression, self.tok.pos)
+
+    def accept(self, text):
+        if self.tok.kind == 'op' and self.tok.text == text:
+            self.i += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            self.error(f"expected {text!r}, got {self.tok.text or 'end of expression'!r}")
+
+    def program(self):
+        body = []
+        while self.tok.kind != 'end':
+            if self.accept(';'):  # 空语句 / 结尾多余的分号
+                continue
+            body.append(self.statement())
+            if self.tok.kind != 'end':
+                self.expect(';')
+        if not body:
+            self.error('empty expression')
+        return body[0] if len(body) == 1 and not isinstance(body[0], Assign) else Program(tuple(body))
+
+    def statement(self):
+        if self.tok.kind == 'name' and self.peek().kind == 'op' and self.peek().text == '=':
+            name = self.tok.text
+            self.i += 2
+            return Assign(name, self.expr())
+        return self.expr()
+
+    def expr(self):
+        cond = self.binary(OR)
+        if self.accept('?'):
+            then = self.expr()
+            self.expect(':')
+            return Ternary(cond, then, self.expr())
+        return cond
+
+    def binary(self, level):
+        """level 到 MUL 之间的左结合二元运算"""
+        if level > MUL:
+            return self.unary()
+        left = self.binary(level + 1)
+        while self.tok.kind == 'op' and BINARY_PRECEDENCE.get(self.tok.text) == level:
+            op = self.tok.text
+            self.i += 1
+            left = BinOp(op, left, self.binary(level + 1))
+        return left
+
+    def unary(self):
+        if self.tok.kind == 'op' and self.tok.text in ('-', '+', '!'):
+            op = self.tok.text
+            self.i += 1
+            return UnaryOp(op, self.unary())
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.accept('^'):
+            return BinOp('^', base, self.unary())  # 右结合，-a^b 是 -(a^b)
+        return base
+
+    def primary(self):
+        tok = self.tok
+        if tok.kind == 'number':
+            self.i += 1
+            return Num(float(tok.text))
+        if tok.kind == 'string':
+            self.i += 1
+            return Str(tok.text[1:-1])
+        if tok.kind == 'name':
+            self.i += 1
+            if self.accept('('):
+                return self.call(tok.text)
+            return Name(tok.text)
+        if self.accept('('):
+            node = self.expr()
+            self.expect(')')
+            return node
+        self.error(f"unexpected {tok.text or 'end of expression'!r}")
+
+    def call(self, func):
+        args, kwargs = [], []
+        if not self.accept(')'):
+            while True:
+                if self.tok.kind == 'name' and self.peek().kind == 'op' and self.peek().text == '=':
+                    name = self.tok.text
+                    self.i += 2
+                    kwargs.append((name, self.expr()))
+                elif kwargs:
+                    self.error('positional argument after keyword argument')
+                else:
+                    args.append(self.expr())
+                if self.accept(')'):
+                    break
+                self.expect(',')
+        return Call(func, tuple(args), tuple(kwargs))
+
+
+def parse(expression):
+    """解析成 AST；单个表达式直接返回表达式节点，多语句返回 Program"""
+    return _Parser(str(expression)).program()
+
+
+# ---------------- 打印 ----------------
+def format_number(value):
+    if math.isfinite(value) and value == int(value) and abs(value) < 1e16:
+        return str(int(value))
+    return repr(value)
+
+
+def _precedence(node):
+    if isinstance(node, BinOp):
+        return BINARY_PRECEDENCE[node.op]
+    if isinstance(node, UnaryOp) or (isinstance(node, Num) and node.value < 0):
+        return UNARY
+    if isinstance(node, Ternary):
+        return TERNARY
+    return ATOM
+
+
+def _wrap(node, min_precedence):
+    text = to_source(node)
+    return f'({text})' if _precedence(node) < min_precedence else text
+
+
+@lru_cache(maxsize=65536)
+def to_source(node):
+    if isinstance(node, Num):
+        return format_number(node.value)
+    if isinstance(node, Str):
+        return "'%s'" % node.value
+    if isinstance(node, Name):
+        return node.id
+    if isinstance(node, Call):
+        args = [to_source(a) for a in node.args] + [f'{k}={to_source(v)}' for k, v in node.kwargs]
+        return f"{node.func}({', '.join(args)})"
+    if isinstance(node, UnaryOp):
+        return node.op + _wrap(node.operand, UNARY + 1 if node.op == '-' else UNARY)
+    if isinstance(node, BinOp):
+        p = BINARY_PRECEDENCE[node.op]
+        if node.op == '^':  # 右结合
+            return f'{_wrap(node.left, p + 1)}^{_wrap(node.right, p)}'
+        return f'{_wrap(node.left, p)} {node.op} {_wrap(node.right, p + 1)}'
+    if isinstance(node, Ternary):
+        return f'{_wrap(node.cond, OR)} ? {_wrap(node.then, TERNARY)} : {_wrap(node.otherwise, TERNARY)}'
+    if isinstance(node, Assign):
+        return f'{node.name} = {to_source(node.value)}'
+    if isinstance(node, Program):
+        return '; '.join(to_source(s) for s in node.body)
+    raise TypeError(f"not a FASTEXPR node: {node!r}")
+
+
+# ---------------- 规范化 ----------------
+_NUMBER_LIST = re.compile(r'\s*[-+]?%s(?:\s*,\s*[-+]?%s)*\s*' % (_NUMBER, _NUMBER))
+
+
+def inline_assignments(tree):
+    """把多语句体里的变量代入最后一个表达式，返回单个表达式节点"""
+    if not isinstance(tree, Program):
+        return tree
+    env = {}
+    result = None
+    for statement in tree.body:
+        if isinstance(statement, Assign):
+            env[statement.name] = result = _substitute(statement.value, env)
+        else:
+            result = _substitute(statement, env)  # 只有最后一个表达式语句生效
+    return result
+
+
+def _substitute(node, env):
+    if not env:
+        return node
+    if isinstance(node, Name):
+        return env.get(node.id, node)
+    if isinstance(node, Call):
+        return Call(node.func, tuple(_substitute(a, env) for a in node.args),
+                    tuple((k, _substitute(v, env)) for k, v in node.kwargs))
+    if isinstance(node, UnaryOp):
+        return UnaryOp(node.op, _substitute(node.operand, env))
+    if isinstance(node, BinOp):
+        return BinOp(node.op, _substitute(node.left, env), _substitute(node.right, env))
+    if isinstance(node, Ternary):
+        return Ternary(*(_substitute(n, env) for n in node))
+    return node
+
+
+def _flatten(node, op):
+    if isinstance(node, BinOp) and node.op == op:
+        return _flatten(node.left, op) + _flatten(node.right, op)
+    return [node]
+
+
+@lru_cache(maxsize=65536)
+def normalize(node):
+    """逐层规范化 AST（输入不能含 Assign / Program，先 inline_assignments）"""
+    if isinstance(node, Name):
+        return Name(node.id.lower()) if node.id.lower() in CONSTANT_NAMES else node
+    if isinstance(node, Str):
+        if _NUMBER_LIST.fullmatch(node.value):
+            return Str(','.join(format_number(float(x)) for x in node.value.split(',')))
+        return node
+    if isinstance(node, Call):
+        args = tuple(normalize(a) for a in node.args)
+        if node.func in COMMUTATIVE_FUNCS:
+            args = tuple(sorted(args, key=to_source))
+        kwargs = tuple(sorted((k, normalize(v)) for k, v in node.kwargs))
+        return Call(node.func, args, kwargs)
+    if isinstance(node, UnaryOp):
+        operand = normalize(node.operand)
+        if node.op == '+':
+            return operand
+        if node.op == '-' and isinstance(operand, Num):
+            return Num(-operand.value)
+        if node.op == '-' and isinstance(operand, UnaryOp) and operand.op == '-':
+            return operand.operand
+        return UnaryOp(node.op, operand)
+    if isinstance(node, BinOp):
+        if node.op in COMMUTATIVE_OPS:
+            terms = sorted((normalize(t) for t in _flatten(node, node.op)), key=to_source)
+            result = terms[0]
+            for term in terms[1:]:
+                result = BinOp(node.op, result, term)
+            return result
+        return BinOp(node.op, normalize(node.left), normalize(node.right))
+    if isinstance(node, Ternary):
+        return Ternary(*(normalize(n) for n in node))
+    return node
+
+
+@lru_cache(maxsize=65536)
+def canonicalize(expression):
+    """规范形式的字符串；语法错误抛 FastExprSyntaxError"""
+    return to_source(normalize(inline_assignments(parse(expression))))
+
+
+def canonical_key(expression):
+    """去重 key：能解析就用规范形式，解析不了（非 FASTEXPR 内容）退化为去掉所有空白"""
+    try:
+        return canonicalize(str(expression))
+    except FastExprSyntaxError:
+        return re.sub(r'\s+', '', str(expression))
@@ -0,0 +1,166 @@
+"""
+按 (region, universe, delay) 预先算好的分组表
+
+group_factory 原来每次调用都重新拼一遍 20 多个 bucket 分组字符串，基本面 / 分析师分组
+（fnd28_value_05480、anl14_buy ...）不管该 region 有没有这些字段都照样生成，提交后才失败。这里：
+- 分组定义只有一份（BASE_GROUPS / EXPERT_GROUPS / VOL_GROUP），候选与原来的 group_factory 相同；
+  OPTIONAL_GROUPS（原来注释里"看自己有没有"的那些）只在 optional=True 时加入
+- group_catalog(region, universe, delay) 第一次调用时，取一次该 region / universe / delay 的全部字段列表
+  （brain_cache.fetch_datafields，内存 + 磁盘缓存，缓存未命中才联网分页拉取），在本地判断分组用到的字段在不在，
+  再用 ExpressionValidator 检查算子，只留下能用的分组；
+  同一进程里同样的参数直接返回同一个 GroupCatalog。字段查询出错时这次先用固定分组表，不缓存，下次调用再查
+- GroupCatalog.expand() 返回预先算好的元组，每个表达式展开出的分组数固定、顺序固定
+
+用法:
+    catalog = group_catalog("EUR", "TOP2500", 1, operators=operator_catalog)
+    len(catalog), catalog.groups
+    get_group_second_order_factory(first_order, group_ops, catalog=catalog)
+"""
+import threading
+
+from brain_auth import login
+from brain_cache import fetch_datafields
+from brain_log import get_logger
+from expr_validator import ExpressionValidator, BUILTIN_NAMES
+from fastexpr import parse, FastExprSyntaxError, Name, Call, UnaryOp, BinOp, Ternary
+
+log = get_logger(__name__)
+
+BASE_GROUPS = ["market", "sector", "industry", "subindustry", "country"]
+
+# 经验总结出来的group
+EXPERT_GROUPS = [
+    "bucket(rank(fnd28_value_05480/close), range='0.2, 1, 0.2')",           # bps
+    "bucket(rank(cap), range='0.1, 1, 0.1')",                               # cap
+    "bucket(group_rank(cap,sector),range='0,1,0.1')",                       # sector cap
+    "bucket(rank(close*volume/cap),range='0.1, 1, 0.1')",                   # turnover
+    "bucket(rank(ts_std_dev(returns,20)),range = '0.1, 1, 0.1')",           # volatility
+    "bucket(rank(close*volume),range = '0.1, 1, 0.1')",                     # liquidity
+    "bucket(group_rank(assets, sector),range='0.1, 1, 0.1')",               # sector asset
+    "bucket(rank(fnd28_value_05480/bookvalue_ps), range='0.1, 1, 0.1')",    # pb
+    "bucket(rank(liabilities/assets), range='0.1, 1, 0.1')",                # debt to equity
+    "bucket(rank(dividend/close), range='0.1, 1, 0.1')",                    # dividend yield
+    "bucket(rank(adv20), range='0.1, 1, 0.1')",                             # adv20
+]
+
+VOL_GROUP = "bucket(rank(ts_std_dev(returns,240)),range = '0.1,1,0.1')"
+
+# 看自己有没有：group_catalog(..., optional=True) 时才作为候选，字段都在的 region 才加进分组表
+OPTIONAL_GROUPS = [
+    "bucket(rank(fnd23_net_income/assets), range='0.1, 1, 0.1')",
+    "bucket(rank(fnd23_net_debt/assets), range='0.1, 1, 0.1')",
+    "bucket(rank(anl14_buy), range='0.1, 1, 0.1')",
+    "bucket(rank(anl15_bps_gr_12_m_1m_chg), range='0.1, 1, 0.1')",
+    "bucket(rank(anl15_salgics_gr_18_m_pe), range='0.1, 1, 0.1')",
+    "bucket(rank(anl4_adjusted_netincome_ft), range='0.1, 1, 0.1')",
+    "bucket(rank(call_breakeven_10), range='0.1, 1, 0.1')",
+    "bucket(rank(correlation_last_60_days_spy), range='0.1, 1, 0.1')",
+    "bucket(rank(est_12m_eps_num_28d), range='0.1, 1, 0.1')",
+]
+
+CANDIDATE_GROUPS = BASE_GROUPS + EXPERT_GROUPS + [VOL_GROUP]
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+class GroupCatalog:
+    """一组可用的分组表达式（去重，顺序固定）"""
+
+    def __init__(self, groups, key=None):
+        self.groups = tuple(dict.fromkeys(groups))
+        self.key = key
+
+    def expand(self, extra=()):
+        """分组表加上调用方额外给的分组（去重、保持顺序）；没有额外分组时直接返回预先算好的元组"""
+        if not extra:
+            return self.groups
+        return tuple(dict.fromkeys(self.groups + tuple(extra)))
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, group):
+        return group in self.groups
+
+    def __repr__(self):
+        return f'GroupCatalog({self.key!r}, {len(self.groups)} groups)'
+
+
+def static_group_catalog(include_vol=True):
+    """不区分 region 的固定分组表（原来 group_factory 的列表）"""
+    return GroupCatalog(BASE_GROUPS + EXPERT_GROUPS + ([VOL_GROUP] if include_vol else []), key='static')
+
+
+def _names(node):
+    if isinstance(node, Name):
+        yield node.id
+    elif isinstance(node, Call):
+        for child in node.args + tuple(value for _, value in node.kwargs):
+            yield from _names(child)
+    elif isinstance(node, UnaryOp):
+        yield from _names(node.operand)
+    elif isinstance(node, (BinOp, Ternary)):
+        for child in (node[1:] if isinstance(node, BinOp) else node):
+            yield from _names(child)
+
+
+def required_fields(group):
+    """分组表达式里用到的数据字段（pv1 基础字段、分组字段不算）"""
+    try:
+        return {n for n in _names(parse(group)) if n.lower() not in BUILTIN_NAMES}
+    except FastExprSyntaxError:
+        return set()
+
+
+def region_field_ids(region, universe, delay, instrument_type='EQUITY', session_factory=login):
+    """该 region / universe / delay 下全部字段的 id：一次列表请求（不按数据集、不按关键字），结果走字段元数据缓存"""
+    # 查询出错（网络、登录、429）直接抛出：不能当成字段不存在，否则缺分组的表会被缓存下来
+    rows = fetch_datafields(None, instrument_type=instrument_type, region=region, delay=delay,
+                            universe=universe, dataset_id='', session_factory=session_factory)
+    return {row.get('id') for row in rows}
+
+
+def build_group_catalog(region, universe, delay, instrument_type='EQUITY', operators=None,
+                        candidates=CANDIDATE_GROUPS, session_factory=login):
+    """
+    按字段元数据与算子表筛出该 region / universe / delay 下能用的分组（不缓存，见 group_catalog）。
+    与 static_group_catalog 一样，算子表里没有 ts_returns 时不加 VOL_GROUP；字段查询出错时抛出
+    """
+    if operators is not None and "ts_returns" not in operators:
+        candidates = [g for g in candidates if g != VOL_GROUP]
+    needed = sorted(set().union(*(required_fields(g) for g in candidates)))
+    field_ids = region_field_ids(region, universe, delay, instrument_type, session_factory) if needed else set()
+    available = [{'id': f} for f in needed if f in field_ids]
+    validator = ExpressionValidator(operators, fields=available)
+    groups, dropped = [], []
+    for group in candidates:
+        (dropped if validator.check(group) else groups).append(group)
+    log.info('group catalog built', region=region, universe=universe, delay=delay,
+             groups=len(groups), dropped=len(dropped))
+    return GroupCatalog(groups, key=(instrument_type, region, universe, str(delay)))
+
+
+def group_catalog(region, universe, delay, instrument_type='EQUITY', operators=None, optional=False,
+                  session_factory=login):
+    """
+    build_group_catalog 的缓存版本：同一进程里每个 (instrumentType, region, universe, delay, optional) 只建一次。
+    optional=True 时候选里再加上 OPTIONAL_GROUPS。字段查询出错时返回固定分组表且不缓存，下次调用重新查
+    """
+    key = (instrument_type, region, universe, str(delay), bool(optional))
+    candidates = CANDIDATE_GROUPS + (OPTIONAL_GROUPS if optional else [])
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            try:
+                catalog = build_group_catalog(region, universe, delay, instrument_type, operators,
+                                              candidates=candidates, session_factory=session_factory)
+            except Exception as e:
+                log.warning('group catalog lookup failed, using static groups for now', region=region,
+                            universe=universe, delay=delay, error=str(e))
+                return static_group_catalog(include_vol=operators is None or "ts_returns" in operators)
+            _catalogs[key] = catalog
+    return catalog
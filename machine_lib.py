@@ -8,42 +8,33 @@ import time
 import json
 import pandas as pd
 from itertools import product
+import itertools
 from collections import defaultdict
 from datetime import datetime
-import aiofiles
 import aiohttp
 import asyncio
 
-def login():
-    # 从txt文件解密并读取数据
-    # txt格式:
-    # password: 'password'
-    # username: 'username'
-    def load_decrypted_data(txt_file='user_info.txt'):
-        with open(txt_file, 'r') as f:
-            data = f.read()
-            data = data.strip().split('\n')
-
-            data = {line.split(': ')[0]: line.split(': ')[1] for line in data}
-
-        return data['username'][1:-1], data['password'][1:-1]
-
-    username, password = load_decrypted_data("user_info.txt")
-
-    # Create a session to persistently store the headers
-    s = requests.Session()
-
-    # Save credentials into session
-    s.auth = (username, password)
-
-    # Send a POST request to the /authentication API
-    response = s.post('https://api.worldquantbrain.com/authentication')
-    print(response.content)
-    return s
+from brain_cache import OperatorCatalog, LazyOperatorList, fetch_datafields
+from brain_auth import login, async_login, token_lifetime, SessionManager
+from alpha_pager import iter_alpha_pages
+from throttle import AIMDLimiter
+from sim_poller import ProgressPoller
+from sim_scheduler import iter_pools, run_workers, pool_size
+from account_pool import AccountPool
+from sim_journal import SimJournal, JournalPool
+from records_writer import records_writer
+from sim_metrics import SimMetrics, NULL_METRICS
+from sim_cache import SimResultCache, is_metrics
+from brain_log import get_logger
+from expr_validator import ExpressionValidator, write_report
+from group_catalog import static_group_catalog
+from config import SIM_MAX_CONCURRENCY, CHILD_FETCH_CONCURRENCY, RECORDS_PATH, CREDENTIAL_FILES
 
 pd.set_option('expand_frame_repr', False)
 pd.set_option('display.max_rows', 1000)
 
+log = get_logger(__name__)
+
 brain_api_url = os.environ.get("BRAIN_API_URL", "https://api.worldquantbrain.com")
 
 basic_ops = ["log", "sqrt", "reverse", "inverse", "rank", "zscore", "log_diff", "s_log_1p",
@@ -70,16 +61,15 @@ vec_ops = ["vec_avg", "vec_sum", "vec_ir", "vec_max",
 
 ops_set = basic_ops + ts_ops + arsenal + group_ops
 
-s = login()
-res = s.get("https://api.worldquantbrain.com/operators")
-aval = pd.DataFrame(res.json())['name'].tolist()
-ts_ops = [op for op in ts_ops if op in aval]
-basic_ops = [op for op in basic_ops if op in aval]
-group_ops = [op for op in group_ops if op in aval]
-twin_field_ops = [op for op in twin_field_ops if op in aval]
-arsenal = [op for op in arsenal if op in aval]
-vec_ops = [op for op in vec_ops if op in aval]
-s.close()
+# 算子表惰性加载：第一次读取下面这些列表时才按平台 /operators 过滤（带磁盘缓存）
+operator_catalog = OperatorCatalog(login)
+aval = LazyOperatorList(operator_catalog)
+ts_ops = LazyOperatorList(operator_catalog, ts_ops)
+basic_ops = LazyOperatorList(operator_catalog, basic_ops)
+group_ops = LazyOperatorList(operator_catalog, group_ops)
+twin_field_ops = LazyOperatorList(operator_catalog, twin_field_ops)
+arsenal = LazyOperatorList(operator_catalog, arsenal)
+vec_ops = LazyOperatorList(operator_catalog, vec_ops)
 
 
 def set_alpha_properties(
@@ -110,7 +100,7 @@ def set_alpha_properties(
         params["selection"] = {"description": selection_desc}
 
     response = s.patch(
-        "https://api.worldquantbrain.com/alphas/" + alpha_id, json=params
+        brain_api_url + "/alphas/" + alpha_id, json=params
     )
 
 
@@ -131,7 +121,7 @@ def get_vec_fields(fields):
 
 
 def get_datafields(
-        s,
+        s=None,
         instrument_type: str = 'EQUITY',
         region: str = 'USA',
         delay: int = 1,
@@ -139,27 +129,13 @@ def get_datafields(
         dataset_id: str = '',
         search: str = ''
 ):
-    if len(search) == 0:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}&limit=50" + \
-                       "&offset={x}"
-        count = s.get(url_template.format(x=0)).json()['count']
-
-    else:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" + \
-                       f"&search={search}" + \
-                       "&offset={x}"
-        count = 100
-
-    datafields_list = []
-    for x in range(0, count, 50):
-        datafields = s.get(url_template.format(x=x))
-        datafields_list.append(datafields.json()['results'])
-
-    datafields_list_flat = [item for sublist in datafields_list for item in sublist]
+    """
+    拉取字段元数据；分页并发请求，结果按查询条件缓存在本地（见 brain_cache.fetch_datafields）。
+    命中缓存时不会用到 s；s 为 None 且需要联网时自动登录
+    """
+    datafields_list_flat = fetch_datafields(s, instrument_type=instrument_type, region=region, delay=delay,
+                                            universe=universe, dataset_id=dataset_id, search=search,
+                                            session_factory=login)
 
     datafields_df = pd.DataFrame(datafields_list_flat)
     return datafields_df
@@ -178,78 +154,43 @@ def process_datafields(df, data_type):
     return tb_fields
 
 
-def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
-               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None):
-
-
-    # color None, RED, YELLOW, GREEN, BLUE, PURPLE CYX专用
-    if s is None:
-        s = login()
-    alpha_list = []
-    next_alphas = []
-    decay_alphas = []
-    check_alphas = []
+def _alpha_query_url(sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+                     delay, instrumentType, tag='', color_exclude='', negative=False):
+    """
+    拼出 /users/self/alphas 的查询地址，offset 和 dateCreated 区间留 {offset}、{start}、{end} 占位
+    """
     # 3E large 3C less
+    if negative:
+        sharpe_cond = f"is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}"
+    else:
+        sharpe_cond = f"is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}"
+    return (f"{brain_api_url}/users/self/alphas?limit=100&offset={{offset}}"
+            f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
+            f"&settings.region={region}&{sharpe_cond}"
+            f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={{start}}"
+            f"&dateCreated%3C{{end}}&type=REGULAR&color!={color_exclude}&"
+            f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
+
+
+def _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+                      delay, instrumentType, usage, tag='', color_exclude=''):
+    args = (sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+            delay, instrumentType, tag, color_exclude)
     # 正的
-    i = 0
-    while True:
-        url_e = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                 f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                 f"&settings.region={region}&is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}"
-                 f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                 f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                 f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-        response = s.get(url_e)
-        # print(response.json())
-        try:
-            i += 100
-            count = int(response.json()["count"])
-            print(f"一共有{count}个因子等待被获取，已经获取了{i-100}个")
-            alpha_list.extend(response.json()["results"])
-            if i >= count or i == 9900:
-                break
-            time.sleep(3)
-        except Exception as e:
-            print(f"Failed to get alphas: {e}")
-            i -= 100
-            time.sleep(60)
-            s = login()
-            print("%d finished re-login" % i)
-
+    query_urls = [_alpha_query_url(*args)]
     # 负的
     if usage != "submit":
-        i = 0
-        while True:
-            url_c = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                     f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                     f"&settings.region={region}&is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}"
-                     f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                     f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                     f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-            response = s.get(url_c)
-            # print(response.json())
-            try:
-                count = response.json()["count"]
-                if i >= count or i == 9900:
-                    break
-                alpha_list.extend(response.json()["results"])
-                i += 100
-            except Exception as e:
-                print(f"Failed to get alphas: {e}")
-                time.sleep(5)
-                s = login()
-                print("%d finished re-login" % i)
+        query_urls.append(_alpha_query_url(*args, negative=True))
+    return query_urls
 
-    # print(alpha_list)
-    if len(alpha_list) == 0:
-        if usage != "submit":
-            return {"next": [], "decay": []}
-        else:
-            return {"check": []}
 
-    # print(response.json())
+def _process_alphas(alpha_list, usage, sharpe_th, s):
+    """
+    把 /users/self/alphas 返回的原始 alpha 整理成 get_alphas 的输出格式
+    """
+    next_alphas = []
+    decay_alphas = []
+    check_alphas = []
     if usage != "submit":
         for j in range(len(alpha_list)):
             alpha_id = alpha_list[j]["id"]
@@ -311,8 +252,7 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortC
                     decay_alphas.append(rec)
                 else:
                     next_alphas.append(rec)
-        output_dict = {"next": next_alphas, "decay": decay_alphas}
-        print("获取到了%d个因子" % (len(next_alphas) + len(decay_alphas)))
+        return {"next": next_alphas, "decay": decay_alphas}
     else:
         for alpha_detail in alpha_list:
             id = alpha_detail["id"]
@@ -389,16 +329,53 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortC
                        "startDate": startDate, "checks": checks, "os": os, "train": train, "test": test, "prod": prod,
                        "competitions": competitions, "themes": themes, "team": team, "pyramids": pyramids}
                 check_alphas.append(rec)
-        output_dict = {"check": check_alphas}
-
-    # 超过了限制
-    if usage == 'submit' and count >= 9900:
-        if len(output_dict['check']) < len(alpha_list):
-            # 那么就再来一遍
-            output_dict = get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th,
-                                     region, universe, delay, instrumentType, alpha_num, usage, tag, color_exclude)
+        return {"check": check_alphas}
+
+
+def iter_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
+                instrumentType, usage, tag: str = '', color_exclude='', s=None):
+    """
+    get_alphas 的流式版本：分页并发下载，每下载好一页就整理并产出一次，
+    usage != 'submit' 时产出 {"next": [...], "decay": [...]}，否则产出 {"check": [...]}
+    """
+    if s is None and usage == "submit":
+        s = login()
+    query_urls = _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th,
+                                   region, universe, delay, instrumentType, usage, tag, color_exclude)
+    for page in iter_alpha_pages(query_urls, start_date, end_date):
+        yield _process_alphas(page.results, usage, sharpe_th, s)
+
+
+def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
+               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None):
+
+
+    # color None, RED, YELLOW, GREEN, BLUE, PURPLE CYX专用
+    if s is None:
+        s = login()
+    query_urls = _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th,
+                                   region, universe, delay, instrumentType, usage, tag, color_exclude)
+    # 各页并发下载；命中数超过9900时自动按 dateCreated 切成多个区间，一遍取完
+    query_alphas = [[] for _ in query_urls]
+    for page in iter_alpha_pages(query_urls, start_date, end_date):
+        query_alphas[page.query].extend(page.results)
+        log.debug('alpha page fetched', query=page.query, offset=page.offset, total=page.total,
+                  fetched=len(query_alphas[page.query]))
+    # 切分区间后每个区间各自按 sharpe 排序，这里合并后重新排一次（与 order=-is.sharpe 一致）
+    alpha_list = []
+    for alphas in query_alphas:
+        alpha_list.extend(sorted(alphas, key=lambda x: -x["is"]["sharpe"]))
+
+    # print(alpha_list)
+    if len(alpha_list) == 0:
+        if usage != "submit":
+            return {"next": [], "decay": []}
         else:
-            raise Exception("Too many alphas to check!! over 10000, universe: %s, region: %s" % (universe, region))
+            return {"check": []}
+
+    output_dict = _process_alphas(alpha_list, usage, sharpe_th, s)
+    if usage != "submit":
+        log.info('alphas fetched', region=region, count=len(output_dict["next"]) + len(output_dict["decay"]))
 
     return output_dict
 
@@ -421,46 +398,48 @@ def ts_comp_factory(op, field, factor, paras):
     return output
 
 
-def first_order_factory(fields, ops_set):
-    alpha_set = []
-
+def iter_first_order_factory(fields, ops_set, catalog=None):
+    """first_order_factory 的生成器版本：逐条产出，fields 也可以是生成器"""
     for field in fields:
         # reverse op does the work
-        alpha_set.append(field)
+        yield field
         for op in ops_set:
             if op in field:
                 continue
             if op == "ts_percentage":
-                alpha_set += ts_comp_factory(op, field, "percentage", [0.2, 0.5, 0.8])
+                yield from ts_comp_factory(op, field, "percentage", [0.2, 0.5, 0.8])
             elif op == "ts_decay_exp_window":
-                alpha_set += ts_comp_factory(op, field, "factor", [0.5])
+                yield from ts_comp_factory(op, field, "factor", [0.5])
             elif op == "ts_moment":
-                alpha_set += ts_comp_factory(op, field, "k", [2, 3, 4])
+                yield from ts_comp_factory(op, field, "k", [2, 3, 4])
             elif op == "ts_entropy":
-                alpha_set += ts_comp_factory(op, field, "buckets", [10])
+                yield from ts_comp_factory(op, field, "buckets", [10])
             elif op.startswith("ts_") or op == "inst_tvr":
-                alpha_set += ts_factory(op, field)
+                yield from ts_factory(op, field)
             elif op.startswith("group_"):
-                alpha_set += group_factory(op, field)
+                yield from group_factory(op, field, catalog=catalog)
             elif op == "signed_power":
-                alpha = "%s(%s, 2)" % (op, field)
-                alpha_set.append(alpha)
+                yield "%s(%s, 2)" % (op, field)
             else:
-                alpha = "%s(%s)" % (op, field)
-                alpha_set.append(alpha)
+                yield "%s(%s)" % (op, field)
+
+
+def first_order_factory(fields, ops_set, catalog=None):
+    return list(iter_first_order_factory(fields, ops_set, catalog))
 
-    return alpha_set
 
-def get_group_second_order_factory(first_order, group_ops, group_fields=[]):
-    second_order = []
+def iter_group_second_order_factory(first_order, group_ops, group_fields=(), catalog=None):
+    """get_group_second_order_factory 的生成器版本：一阶表达式可以边生成边展开"""
     for fo in first_order:
         for group_op in group_ops:
-            second_order += group_factory(group_op, fo, group_fields)
-    return second_order
+            yield from group_factory(group_op, fo, group_fields, catalog)
 
 
-def trade_when_factory(op, field, region, delay=1):
-    output = []
+def get_group_second_order_factory(first_order, group_ops, group_fields=(), catalog=None):
+    return list(iter_group_second_order_factory(first_order, group_ops, group_fields, catalog))
+
+
+def iter_trade_when_factory(op, field, region, delay=1):
     open_events = [
         "ts_arg_max(volume, 5) == 0",
         "ts_corr(close, volume, 252) <= 0",
@@ -503,9 +482,11 @@ def trade_when_factory(op, field, region, delay=1):
 
     for oe in open_events:
         for ee in exit_events:
-            alpha = "%s(%s, %s, %s)" % (op, oe, field, ee)
-            output.append(alpha)
-    return output
+            yield "%s(%s, %s, %s)" % (op, oe, field, ee)
+
+
+def trade_when_factory(op, field, region, delay=1):
+    return list(iter_trade_when_factory(op, field, region, delay))
 
 
 def ts_factory(op, field):
@@ -520,55 +501,27 @@ def ts_factory(op, field):
     return output
 
 
-def group_factory(op, field, group_fields=[]):
-    output = []
-    vectors = ["cap"]
+_static_groups = None
 
-    # 量价
-    cap_group = "bucket(rank(cap), range='0.1, 1, 0.1')"
-    sector_cap_group = "bucket(group_rank(cap,sector),range='0,1,0.1')"
-    vol_group = "bucket(rank(ts_std_dev(returns,240)),range = '0.1,1,0.1')"
-    volatility_group = "bucket(rank(ts_std_dev(returns,20)),range = '0.1, 1, 0.1')"
-    liquidity_group = "bucket(rank(close*volume),range = '0.1, 1, 0.1')"
-    turnover_group = "bucket(rank(close*volume/cap),range='0.1, 1, 0.1')"
-    dividend_yield_group = "bucket(rank(dividend/close), range='0.1, 1, 0.1')"
-    adv20_group = "bucket(rank(adv20), range='0.1, 1, 0.1')"
-
-    # 基本面
-    sector_asset_group = "bucket(group_rank(assets, sector),range='0.1, 1, 0.1')"
-    bps_group = "bucket(rank(fnd28_value_05480/close), range='0.2, 1, 0.2')"
-    pb_group = "bucket(rank(fnd28_value_05480/bookvalue_ps), range='0.1, 1, 0.1')"
-    debt_to_equity_group = "bucket(rank(liabilities/assets), range='0.1, 1, 0.1')"
-
-    # 看自己有没有
-    fnd23_net_income_group = "bucket(rank(fnd23_net_income/assets), range='0.1, 1, 0.1')"
-    fnd23_net_debt_group = "bucket(rank(fnd23_net_debt/assets), range='0.1, 1, 0.1')"
-    anl14_buy_group = "bucket(rank(anl14_buy), range='0.1, 1, 0.1')"
-    anl15_bps_gr_12_m_1m_chg_group = "bucket(rank(anl15_bps_gr_12_m_1m_chg), range='0.1, 1, 0.1')"
-    anl15_salgics_gr_18_m_pe_group = "bucket(rank(anl15_salgics_gr_18_m_pe), range='0.1, 1, 0.1')"
-    anl4_adjusted_netincome_ft_group = "bucket(rank(anl4_adjusted_netincome_ft), range='0.1, 1, 0.1')"
-    call_breakeven_10_group = "bucket(rank(call_breakeven_10), range='0.1, 1, 0.1')"
-    correlation_last_60_days_spy_group = "bucket(rank(correlation_last_60_days_spy), range='0.1, 1, 0.1')"
-    est_12m_eps_num_28d_group = "bucket(rank(est_12m_eps_num_28d), range='0.1, 1, 0.1')"
-
-    base_group = ["market", "sector", "industry", "subindustry", "country"]
-
-    # 经验总结出来的group
-    experts_group = [
-        bps_group, cap_group, sector_cap_group, turnover_group,
-        volatility_group, liquidity_group, sector_asset_group,
-        pb_group, debt_to_equity_group, dividend_yield_group,
-        adv20_group
-    ]
 
-    if "ts_returns" in aval:
-        experts_group.append(vol_group)
+def default_group_catalog():
+    """没指定 region 时用的分组表（原来的固定列表）；只在第一次用到时查一次算子表"""
+    global _static_groups
+    if _static_groups is None:
+        _static_groups = static_group_catalog(include_vol="ts_returns" in operator_catalog)
+    return _static_groups
 
-    group_fields += base_group
-    group_fields +=experts_group
-    group_fields = list(set(group_fields))
 
-    for group in group_fields:
+def group_factory(op, field, group_fields=(), catalog=None):
+    """
+    catalog 为该 region 下能用的分组表（group_catalog.group_catalog(...)），不传时用固定分组表；
+    group_fields 为额外加上的分组。分组表预先算好，每个表达式展开出的条数、顺序都固定
+    """
+    output = []
+    vectors = ["cap"]
+    catalog = default_group_catalog() if catalog is None else catalog
+
+    for group in catalog.expand(group_fields):
         if op.startswith("group_vector"):
             for vector in vectors:
                 alpha = "%s(%s,%s,densify(%s))" % (op, field, vector, group)
@@ -627,59 +580,9 @@ def while_true_try_decorator(func):
                 time.sleep(2)
     return wrapper
 
-async def async_login():
-    """
-    从YAML文件加载用户信息并异步登录到指定API
-    """
-    def load_decrypted_data(txt_file='user_info.txt'):
-        with open(txt_file, 'r') as f:
-            data = f.read()
-            data = data.strip().split('\n')
-            data = {line.split(': ')[0]: line.split(': ')[1] for line in data}
-
-        return data['username'][1:-1], data['password'][1:-1]
-
-    username, password = load_decrypted_data("user_info.txt")
-
-    # 创建一个aiohttp的Session
-    conn = aiohttp.TCPConnector(ssl=False)
-    session = aiohttp.ClientSession(connector=conn)
-
-    time_out = 5
-    while True:
-        if time_out < 0:
-            print("Login timeout!")
-            await session.close()
-            raise Exception("Login timeout! 无法登录，退出程序中...")
-
-        time_out -= 1
-
-        try:
-            # 发送一个POST请求到/authentication API
-            async with session.post('https://api.worldquantbrain.com/authentication',
-                                    auth=aiohttp.BasicAuth(username, password)) as response:
-                # 检查状态码是否为201，确保登录成功
-                if response.status == 201:
-                    print("Login successful!")
-                else:
-                    print(f"Login failed! Status code: {response.status}, Response: {await response.text()}")
-                    # 异步睡眠10s
-                    await asyncio.sleep(10**time_out)
-
-            return session
-
-        except aiohttp.ClientError as e:
-            print(f"Error during login request: {e}")
-            await session.close()
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            await session.close()
-
-
-
 async def simulate_single(session_manager, alpha_expression, region_info, name, neut,
                           decay, delay, stone_bag, tags=['None'],
-                          semaphore=None):
+                          semaphore=None, poller=None):
     """
     单次模拟一个alpha表达式对应的某个地区的信息
     """
@@ -691,7 +594,8 @@ async def simulate_single(session_manager, alpha_expression, region_info, name,
         region, uni = region_info
         alpha = "%s" % (alpha_expression)
 
-        print("Simulating for alpha: %s, region: %s, universe: %s, decay: %s" % (alpha, region, uni, decay))
+        sim_log = log.bind(tag=name, region=region)
+        sim_log.debug('simulating alpha', alpha=alpha, universe=uni, decay=decay)
 
         simulation_data = {
             'type': 'REGULAR',
@@ -714,77 +618,72 @@ async def simulate_single(session_manager, alpha_expression, region_info, name,
 
         while True:
             try:
-                async with session_manager.session.post('https://api.worldquantbrain.com/simulations',
-                                                        json=simulation_data) as resp:
+                session = session_manager.session
+                async with session.post(brain_api_url + '/simulations',
+                                        json=simulation_data) as resp:
+                    if resp.status == 401:
+                        await session_manager.refresh_session(session)
+                        continue
+                    if resp.status == 429:
+                        semaphore.on_limit()
+                        await asyncio.sleep(float(resp.headers.get('Retry-After', 5)))
+                        continue
                     simulation_progress_url = resp.headers.get('Location', 0)
                     if simulation_progress_url == 0:
                         json_data = await resp.json()
-                        if type(json_data) == list:
-                            print(json_data)
-                            detail = json_data.get("detail", 0)
-                        else:
-                            detail = json_data.get("detail", 0)
+                        detail = json_data.get("detail", 0)
                         if detail == 'SIMULATION_LIMIT_EXCEEDED':
-                            print("Limited by the number of simulations allowed per time")
+                            sim_log.warning('simulation limit exceeded')
+                            semaphore.on_limit()
                             await asyncio.sleep(5)
                         else:
-                            print("detail:", detail)
-                            print("json_data:", json_data)
-                            print("Alpha expression is duplicated")
+                            sim_log.warning('simulation rejected', alpha=alpha, detail=detail, response=json_data)
                             await asyncio.sleep(1)
                             return 0
                     else:
-                        print('simulation_progress_url:', simulation_progress_url)
+                        semaphore.on_success()
+                        sim_log.info('simulation submitted', url=simulation_progress_url)
                         break
             except KeyError:
-                print("Location key error during simulation request")
+                sim_log.error('simulation response has no Location', alpha=alpha)
                 await asyncio.sleep(60)
                 return
             except Exception as e:
-                print("An error occurred:", str(e))
+                sim_log.error('simulation submit failed', alpha=alpha, error=str(e))
                 await asyncio.sleep(60)
                 return
 
-        while True:
-            try:
-                async with session_manager.session.get(simulation_progress_url) as resp:
-                    json_data = await resp.json()
-                    # 获取响应头
-                    headers = resp.headers
-                    retry_after = headers.get('Retry-After', 0)
-                    if retry_after == 0:
-                        break
-                    await asyncio.sleep(float(retry_after))
-            except Exception as e:
-                print("Error while checking progress:", str(e))
-                await asyncio.sleep(60)
-
-        print("%s done simulating, getting alpha details" % (simulation_progress_url))
+        # 进度由共用的 poller 统一轮询，模拟结束才会唤醒这里
         try:
-            alpha_id = json_data.get("alpha")
+            json_data = await poller.wait(simulation_progress_url)
+        except Exception as e:
+            sim_log.error('progress check failed', url=simulation_progress_url, error=str(e))
+            return
 
-            await async_set_alpha_properties(session_manager.session,
-                                             alpha_id,
-                                             name="%s" % name,
-                                             color=None,
-                                             tags=tags)
+        sim_log.info('simulation finished', url=simulation_progress_url)
 
-            async with aiofiles.open(f'records/{name}_simulated_alpha_expression.txt', mode='a') as f:
-                await f.write(alpha + '\n')
-            try:
-                print(datetime.now(), "updated successfully:", alpha[:120])
-            except Exception:
-                pass
+    # 槽位已经释放，打标签、等记录落盘都在槽位外完成，不占用模拟并发
+    try:
+        alpha_id = json_data.get("alpha")
 
-            # stone_bag.append(alpha_id)
+        await async_set_alpha_properties(session_manager.session,
+                                         alpha_id,
+                                         name="%s" % name,
+                                         color=None,
+                                         tags=tags)
 
-        except KeyError:
-            print("Failed to retrieve alpha ID for: %s" % simulation_progress_url)
-        except Exception as e:
-            print("An error occurred while setting alpha properties:", str(e))
+        await records_writer(name).append([alpha])
+        sim_log.debug('alpha recorded', alpha_id=alpha_id, alpha=alpha[:120])
 
-        # return stone_bag
-        return 0
+        # stone_bag.append(alpha_id)
+
+    except KeyError:
+        sim_log.error('simulation has no alpha', url=simulation_progress_url)
+    except Exception as e:
+        sim_log.error('setting alpha properties failed', url=simulation_progress_url, error=str(e))
+
+    # return stone_bag
+    return 0
 
 
 async def async_set_alpha_properties(
@@ -817,45 +716,54 @@ async def async_set_alpha_properties(
     if selection_desc:
         params["selection"] = {"description": selection_desc}
 
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
+    url = f"{brain_api_url}/alphas/{alpha_id}"
 
     try:
         async with session.patch(url, json=params) as response:
             # 检查状态码，确保请求成功
             if response.status == 200:
-                print(f"Alpha {alpha_id} properties updated successfully! Tag: {tags}")
+                log.debug('alpha properties updated', alpha_id=alpha_id, tags=tags)
+                return await response.json()  # 更新后的 alpha（含 IS 指标）
             else:
-                print(
-                    f"Failed to update alpha {alpha_id}. Status code: {response.status}, Response: {await response.text()}")
+                log.warning('alpha properties update failed', alpha_id=alpha_id, status=response.status,
+                            response=await response.text())
 
     except aiohttp.ClientError as e:
-        print(f"Error during patch request for alpha {alpha_id}: {e}")
+        log.error('alpha properties request failed', alpha_id=alpha_id, error=str(e))
     except Exception as e:
-        print(f"An unexpected error occurred for alpha {alpha_id}: {e}")
+        log.error('alpha properties update raised', alpha_id=alpha_id, error=str(e))
 
 
 
-class SessionManager:
-    def __init__(self, session, start_time, expiry_time):
-        self.session = session
-        self.start_time = start_time
-        self.expiry_time = expiry_time
-
-    async def refresh_session(self):
-        print(datetime.now(),"Session expired, logging in again...")
-        await self.session.close()
-        self.session = await async_login()
-        self.start_time = time.time()
+def simulation_settings(region, uni, decay, delay, neut):
+    """
+    提交 /simulations 时用的完整 settings；也是结果缓存 key 的一部分
+    """
+    return {
+        'instrumentType': 'EQUITY',
+        'region': region,
+        'universe': uni,
+        'delay': delay,
+        'decay': decay,
+        'neutralization': neut,
+        'truncation': 0.08,
+        'pasteurization': 'ON',
+        'unitHandling': 'VERIFY',
+        'nanHandling': 'ON',
+        'language': 'FASTEXPR',
+        'visualization': False,
+    }
 
 
 async def simulate_multi(session_manager, alpha_expression_list: list, region_info, name, neut, decay, delay, stone_bag,
 
-                         tags=['None'], semaphore=None):
+                         tags=['None'], semaphore=None, poller=None, journal=None, metrics=NULL_METRICS,
+                         cache=None, account=None, on_done=None, harvest=None):
     """
-    单次模拟一个alpha表达式对应的某个地区的信息
+    单次模拟一个alpha表达式对应的某个地区的信息；on_done(表达式列表) 在 pool 到达终态时调用：
+    结果落盘、被平台拒绝或重试耗尽。轮询出错时 pool 还以 submitted 留在模拟日志里、下次运行续跑，不调用。
+    传入 harvest（任务集合）时子模拟收尾放到后台，模拟结束就返回，见 harvest_children
     """
-    brain_api_url = 'https://api.worldquantbrain.com'
-
     async with semaphore:
         # 每个任务在执行前都检查会话时间
         if time.time() - session_manager.start_time > session_manager.expiry_time:
@@ -865,137 +773,231 @@ async def simulate_multi(session_manager, alpha_expression_list: list, region_in
             raise ValueError("The number of alpha expressions in a pool should be less than 10")
 
         region, uni = region_info
+        pool_log = log.bind(tag=name, region=region, account=account)
+        settings = simulation_settings(region, uni, decay, delay, neut)
 
         # 产生一个pool，一个pool里最多10个alpha
         sim_data_list = []
         for alpha_expression in alpha_expression_list:
             alpha = "%s" % (alpha_expression)
-            print(datetime.now(),f"Simulating for alpha: {alpha}, region: {region},"
-                         f" universe: {uni}, decay: {decay}, delay: {delay}")
+            pool_log.debug('simulating alpha', alpha=alpha, universe=uni, decay=decay, delay=delay)
 
             simulation_data = {
                 'type': 'REGULAR',
-                'settings': {
-                    'instrumentType': 'EQUITY',
-                    'region': region,
-                    'universe': uni,
-                    'delay': delay,
-                    'decay': decay,
-                    'neutralization': neut,
-                    'truncation': 0.08,
-                    'pasteurization': 'ON',
-                    'unitHandling': 'VERIFY',
-                    'nanHandling': 'ON',
-                    'language': 'FASTEXPR',
-                    'visualization': False,
-                },
+                'settings': settings,
                 'regular': alpha
             }
             sim_data_list.append(simulation_data)
 
+        # 先记入日志，拿到 Location 后再补上进度 URL，崩溃后可以从日志恢复
+        pool_id = None
+        if journal is not None:
+            pool_id = journal.add(name, alpha_expression_list, {'region': region, 'universe': uni, 'decay': decay,
+                                                                'delay': delay, 'neutralization': neut}, account)
+            pool_log = pool_log.bind(pool_id=pool_id)
+
         # 一次性提交10个alpha作为单个task
         max_retries = 5  # 最大重试次数
         retry_count = 0
         while retry_count < max_retries:
             try:
-                async with session_manager.session.post('https://api.worldquantbrain.com/simulations',
-                                                        json=sim_data_list) as simulation_response:
+                session = session_manager.session
+                submit_started = time.monotonic()
+                async with session.post(brain_api_url + '/simulations',
+                                        json=sim_data_list) as simulation_response:
+                    metrics.observe('submit_latency_seconds', time.monotonic() - submit_started, region=region)
+                    if simulation_response.status == 401:
+                        # token 失效，重新登录后再提交（并发任务只会有一个真正去登录）
+                        metrics.inc('submit_retries_total', region=region, reason='auth')
+                        await session_manager.refresh_session(session)
+                        continue
+                    if simulation_response.status == 429:
+                        metrics.inc('limit_exceeded_total', region=region)
+                        semaphore.on_limit()
+                        await asyncio.sleep(float(simulation_response.headers.get('Retry-After', 5)))
+                        continue
                     simulation_progress_url = simulation_response.headers.get('Location', 0)
                     if simulation_progress_url == 0:
                         json_data = await simulation_response.json()
-                        if type(json_data) == list:
-                            print(datetime.now(),f"Response data: {json_data}")
-                            detail = json_data.get("detail", 0)
-                        else:
-                            detail = json_data.get("detail", 0)
+                        detail = json_data.get("detail", 0)
                         if detail == 'SIMULATION_LIMIT_EXCEEDED':
-                            print(datetime.now(),"Limited by the number of simulations allowed per time")
+                            pool_log.warning('simulation limit exceeded')
+                            metrics.inc('limit_exceeded_total', region=region)
+                            semaphore.on_limit()  # 平台限流，收缩并发窗口
                             await asyncio.sleep(5)
                             continue  # 继续重试
                         else:
-                            print(datetime.now(),"detail: {}, json_data: {}".format(detail, json_data))
-                            print(datetime.now(),"Alpha expression is duplicated")
+                            pool_log.warning('simulation rejected', detail=detail, response=json_data)
+                            metrics.inc('simulations_failed_total', region=region, reason='rejected')
+                            if journal is not None:
+                                journal.finish(pool_id, 'failed')
+                            if on_done is not None:
+                                on_done(alpha_expression_list)  # 被拒是终态，重提也一样
                             await asyncio.sleep(1)
                             return 0  # 表达式重复，直接返回
                     else:
-                        print(datetime.now(),'Simulation progress URL: {}'.format(simulation_progress_url))
+                        semaphore.on_success()  # 提交成功，扩大并发窗口
+                        metrics.inc('simulations_submitted_total', region=region)
+                        if journal is not None:
+                            journal.submitted(pool_id, simulation_progress_url)
+                        pool_log.info('simulation submitted', url=simulation_progress_url)
                         break  # 成功获取进度URL，退出重试循环
             except Exception as e:
                 retry_count += 1
-                print(datetime.now(),"Error occurred (attempt {}/{}): {}".format(retry_count, max_retries, e))
+                metrics.inc('submit_retries_total', region=region, reason='error')
+                pool_log.warning('simulation submit failed', attempt=retry_count, max_retries=max_retries, error=str(e))
                 if retry_count >= max_retries:
-                    print(datetime.now(),"Max retries reached, aborting...")
+                    pool_log.error('simulation submit aborted after max retries')
+                    metrics.inc('simulations_failed_total', region=region, reason='retries')
+                    if journal is not None:
+                        journal.finish(pool_id, 'failed')
+                    if on_done is not None:
+                        on_done(alpha_expression_list)
                     return 1  # 达到最大重试次数，返回错误
                 await asyncio.sleep(60)
 
 
-        # 进度检查循环优化
-        max_progress_retries = 10  # 最大重试次数
-        progress_retry_count = 0
-        while progress_retry_count < max_progress_retries:
-            try:
-                async with session_manager.session.get(simulation_progress_url) as resp:
-                    json_data = await resp.json()
-                    # 获取响应头
-                    headers = resp.headers
-                    retry_after = headers.get('Retry-After', 0)
-                    if retry_after == 0:
-                        status = json_data.get("status", 0)
-                        children = json_data.get("children", [])
-                        if status == 'ERROR':
-                            print(datetime.now(),"Error in simulation: {}".format(simulation_progress_url))
-                        elif status != "COMPLETE":
-                            print(datetime.now(),"Simulation not complete: {}".format(simulation_progress_url))
-                            async with session_manager.session.delete(simulation_progress_url) as delete_resp:
-                                delete_json_data = await delete_resp.json()
-                                if delete_json_data.get("detail", 0) == "未找到。":
-                                    print(datetime.now(),"Successfully deleted: {}".format(simulation_progress_url))
-                                else:
-                                    print(datetime.now(),"Failed to delete: {}".format(simulation_progress_url))
-                        else:
-                            print(datetime.now(),'Simulation completed: {}'.format(simulation_progress_url))
-                        break
-                    await asyncio.sleep(float(retry_after))
-            except Exception as e:
-                progress_retry_count += 1
-                print(datetime.now(),"Progress check error (attempt {}/{}): {}". format(progress_retry_count, max_progress_retries, str(e)))
-                if progress_retry_count >= max_progress_retries:
-                    print(datetime.now(),"Max progress check retries reached")
-                    return 2  # 新增错误码
-                await asyncio.sleep(30)  # 平方退避
-
-        # alpha_id = simulation_progress.json()["alpha"]
-        children_list = []
-        for child in children:
+        # 进度检查：交给共用的 poller 按 Retry-After 统一轮询，模拟结束才会唤醒这里
+        submitted_at = time.monotonic()
+        try:
+            json_data = await poller.wait(simulation_progress_url)
+        except Exception as e:
+            pool_log.error('progress check failed', url=simulation_progress_url, error=str(e))
+            metrics.inc('simulations_failed_total', region=region, reason='poll')
+            return 2  # 新增错误码（日志里仍是 submitted，下次运行会继续轮询）
+        finally:
+            metrics.observe('polls_per_simulation', poller.take_polls(simulation_progress_url), region=region)
+        metrics.observe('simulation_wall_seconds', time.monotonic() - submitted_at, region=region)
+        children = await check_simulation_status(session_manager, json_data, simulation_progress_url, pool_log)
+
+    def recorded():
+        if journal is not None:
+            journal.finish(pool_id)
+        if on_done is not None:
+            on_done(alpha_expression_list)
+
+    # 槽位已经释放，子模拟的查询与打标签在槽位外并发完成，不占用模拟并发
+    await harvest_children(harvest, resolve_children(
+        session_manager, children, name, tags, on_recorded=recorded,
+        metrics=metrics, region=region, pool_log=pool_log, settings=settings, cache=cache), pool_log)
+    return 0
+
+
+async def check_simulation_status(session_manager, json_data, simulation_progress_url, pool_log=log):
+    """
+    根据模拟结束时的进度 json 记录状态，未完成的模拟尝试删除，返回子模拟 id 列表
+    """
+    status = json_data.get("status", 0)
+    children = json_data.get("children", [])
+    if status == 'ERROR':
+        pool_log.error('simulation error', url=simulation_progress_url, response=json_data)
+    elif status != "COMPLETE":
+        pool_log.warning('simulation not complete', url=simulation_progress_url, status=status)
+        try:
+            async with session_manager.session.delete(simulation_progress_url) as delete_resp:
+                delete_json_data = await delete_resp.json()
+                if delete_json_data.get("detail", 0) == "未找到。":
+                    pool_log.info('simulation deleted', url=simulation_progress_url)
+                else:
+                    pool_log.warning('simulation delete failed', url=simulation_progress_url,
+                                     response=delete_json_data)
+        except Exception as e:
+            pool_log.warning('simulation delete failed', url=simulation_progress_url, error=str(e))
+    else:
+        pool_log.info('simulation completed', url=simulation_progress_url, children=len(children))
+    return children
+
+
+async def resume_multi(session_manager, pool, name, tags, semaphore, poller, journal, metrics=NULL_METRICS,
+                       cache=None, harvest=None):
+    """
+    恢复上次运行中已提交、未收尾的 pool：继续轮询原来的进度 URL 并处理子模拟，不重新提交
+    """
+    region = pool.settings.get('region')
+    pool_log = log.bind(tag=name, region=region, pool_id=pool.id)
+    async with semaphore:  # 平台上这个模拟仍占着一个槽位
+        pool_log.info('resuming simulation from journal', url=pool.location)
+        try:
+            json_data = await poller.wait(pool.location)
+        except Exception as e:
+            pool_log.error('progress check failed', url=pool.location, error=str(e))
+            metrics.inc('simulations_failed_total', region=region, reason='poll')
+            return 2
+        finally:
+            metrics.observe('polls_per_simulation', poller.take_polls(pool.location), region=region)
+        children = await check_simulation_status(session_manager, json_data, pool.location, pool_log)
+
+    s = pool.settings
+    settings = simulation_settings(s['region'], s['universe'], s['decay'], s['delay'], s['neutralization'])
+    await harvest_children(harvest, resolve_children(
+        session_manager, children, name, tags, on_recorded=lambda: journal.finish(pool.id),
+        metrics=metrics, region=region, pool_log=pool_log, settings=settings, cache=cache), pool_log)
+    return 0
+
+
+async def harvest_children(harvest, resolving, pool_log=log):
+    """
+    执行子模拟收尾（resolving 为 resolve_children 协程）。harvest 为 None 时就地 await；
+    否则放到后台任务里并把任务留在 harvest 集合中（事件循环只弱引用任务），结束时移出，
+    worker 不用等打标签和落盘就能去提交下一个 pool；调用方在关闭 records_writer 之前等 harvest 里的任务跑完
+    """
+    if harvest is None:
+        await resolving
+        return
+
+    def done(task):
+        harvest.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            pool_log.error('child resolution failed', error=str(task.exception()))
+
+    task = asyncio.ensure_future(resolving)
+    harvest.add(task)
+    task.add_done_callback(done)
+
+
+async def resolve_children(session_manager, children, name, tags, concurrency=CHILD_FETCH_CONCURRENCY,
+                           on_recorded=None, metrics=NULL_METRICS, region=None, pool_log=log,
+                           settings=None, cache=None):
+    """
+    并发获取 multi simulation 的各个子模拟，给对应 alpha 打上名字/标签，
+    并把表达式交给 records_writer 追加到 records/{name}_simulated_alpha_expression.txt；
+    on_recorded 在表达式落盘后调用。传入 cache 时把 alpha id 与 IS 指标按 (表达式, settings) 存入结果缓存
+    """
+    child_semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(child):
+        async with child_semaphore:
             try:
                 async with session_manager.session.get(brain_api_url + "/simulations/" + child) as child_progress:
                     json_data = await child_progress.json()
-                    alpha_id = json_data["alpha"]
-                    alpha_express = json_data["regular"]
+                alpha_id = json_data["alpha"]
+                alpha_express = json_data["regular"]
 
-                    await async_set_alpha_properties(session_manager.session,
-                                                     alpha_id,
-                                                     name="%s" % name,
-                                                     description="""Idea: 11111111111111111111111111111111.
+                alpha = await async_set_alpha_properties(session_manager.session,
+                                                         alpha_id,
+                                                         name="%s" % name,
+                                                         description="""Idea: 11111111111111111111111111111111.
 Rationale for data used: 22222222222222222222222222222222222222.
 Rationale for operators used: 33333333333333333333333333333333333333.""",
-                                                     color=None,
-                                                     tags=tags)
-
-                    # 将alpha保存到文件
-                    async with aiofiles.open(f'records/{name}_simulated_alpha_expression.txt', mode='a') as f:
-                        await f.write(alpha_express + '\n')
-                    try:
-                        print(datetime.now(), "updated successfully:", alpha_express[:120])
-                    except Exception:
-                        pass
+                                                         color=None,
+                                                         tags=tags)
+                if cache is not None and settings is not None:
+                    cache.put(alpha_express, settings, alpha_id, is_metrics(alpha), name)
+                pool_log.debug('alpha recorded', alpha_id=alpha_id, alpha=alpha_express[:120])
+                return alpha_express
 
             except KeyError:
-                print(datetime.now(),"Failed to retrieve alpha ID for: {}".format(brain_api_url + "/simulations/" + child))
+                pool_log.error('child simulation has no alpha', url=brain_api_url + "/simulations/" + child)
             except Exception as e:
-                print(datetime.now(),"An error occurred while setting alpha properties:" + str(e))
+                pool_log.error('child resolution failed', url=brain_api_url + "/simulations/" + child, error=str(e))
 
-        return 0
+    alpha_expresses = [exp for exp in await asyncio.gather(*(resolve(child) for child in children)) if exp]
+    metrics.inc('children_harvested_total', len(alpha_expresses), region=region)
+    if alpha_expresses:
+        # 将alpha保存到文件（缓冲写入，落盘后才在模拟日志里标记完成）
+        await records_writer(name).append(alpha_expresses, on_durable=on_recorded)
+    elif on_recorded is not None:
+        on_recorded()
 
 def prune(next_alpha_recs, prefix, keep_num):
     output = []
@@ -1010,67 +1012,141 @@ def prune(next_alpha_recs, prefix, keep_num):
             output.append([exp, decay])
     return output
 
-async def simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_list, name, neut, stone_bag, n=10):
-    semaphore = asyncio.Semaphore(n)
-    tasks = []
+async def simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_list, name, neut, stone_bag, n=10,
+                                  skip_cached=True, validate=True, validator=None, credentials=None, on_done=None):
+    # n 为每个账号的初始并发数，之后按平台是否限流各自自适应调整（AIMD）；
+    # credentials 为凭证文件列表（默认 config.CREDENTIAL_FILES），pool 派给空闲槽位最多的账号，结果都记在同一个 tag 下；
+    # on_done(表达式列表) 在表达式不用再提交时调用：pool 结果落盘、被拒或重试耗尽、提交前被跳过、或交给模拟日志续跑，
+    # 没跑完的不调用（DIG1_fast 用它推进枚举游标）
     tags = [name]
-    
-    print(f"开始处理 {len(alpha_list)} 个表达式，并发数: {n}")
 
-    session = await async_login()
-    session_start_time = time.time()
-    session_expiry_time = 3 * 60 * 60  # 3小时
-    session_manager = SessionManager(session, session_start_time, session_expiry_time)
+    def settled(alphas):
+        if on_done is not None:
+            on_done(alphas)
+        return True
+    
+    # 上次运行中已提交、未收尾的 pool 直接接着轮询，其中的表达式不再重复提交
+    journal = SimJournal()
+    resumed = journal.recover(name)
+    if resumed:
+        log.info('resuming pools from journal', tag=name, pools=len(resumed))
+        resumed_alphas = {alpha for pool in resumed for alpha in pool.expressions}
+
+        def fresh(alpha):
+            if alpha in resumed_alphas:
+                settled([alpha])  # 结果交给模拟日志续跑
+                return False
+            return True
+
+        if isinstance(alpha_list, list):
+            alpha_list = [alpha for alpha in alpha_list if fresh(alpha)]
+        else:
+            alpha_list = (alpha for alpha in alpha_list if fresh(alpha))
 
-    if region_list[0][0] == "GLB":
-        alpha_list = [alpha_list[i:i + 5] for i in range(0, len(alpha_list), 5)]
-    else:
-        alpha_list = [alpha_list[i:i + 10] for i in range(0, len(alpha_list), 10)]
-
-    # 将任务划分成 n 份
-    chunk_size = (len(alpha_list) + n - 1) // n  # 向上取整
-    task_chunks = [alpha_list[i:i + chunk_size] for i in range(0, len(alpha_list), chunk_size)]
-    region_chunks = [region_list[i:i + chunk_size] for i in range(0, len(region_list), chunk_size)]
-    decay_chunks = [decay_list[i:i + chunk_size] for i in range(0, len(decay_list), chunk_size)]
-    delay_chunks = [delay_list[i:i + chunk_size] for i in range(0, len(delay_list), chunk_size)]
-
-    for i, (alpha_chunks, region_chunk, decay_chunk, delay_chunk) in enumerate(
-            zip(task_chunks, region_chunks, decay_chunks, delay_chunks)):
-        # 获取当前 chunk 对应的 session_manager
-        current_session_manager = session_manager
-        for alpha_chunk, region, decay, delay in zip(alpha_chunks, region_chunk, decay_chunk, delay_chunk):
-            # 将任务与当前的 session_manager 关联
-            task = simulate_multi(current_session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
-                                  tags, semaphore)
-            tasks.append(task)
+    try:
+        total_tasks = len(resumed) + -(-len(alpha_list) // pool_size(region_list[0]))  # 向上取整
+        log.info('simulation run started', tag=name, alphas=len(alpha_list), concurrency=n)
+    except (TypeError, IndexError):
+        total_tasks = None  # 传入的是生成器，总数未知
+        log.info('simulation run started', tag=name, concurrency=n)
+
+    # 每个账号一套会话（到期前后台换新）、并发窗口和进度轮询
+    accounts = await AccountPool.open(credentials or CREDENTIAL_FILES, n, SIM_MAX_CONCURRENCY)
+
+    # 指标定期导出到 records/{name}_metrics.prom / .json（多账号时为各账号之和）
+    metrics = SimMetrics(name)
+    metrics.gauge('concurrency_window', lambda: accounts.window)
+    metrics.gauge('in_flight', lambda: accounts.in_flight)
+    metrics.gauge('idle_slot_seconds', accounts.idle_slot_seconds)
+    metrics.gauge('polls_total', lambda: accounts.n_polls)
+    metrics.gauge('accounts', lambda: len(accounts.accounts))
+    metrics.start()
+
+    # 本机所有 tag 共用的结果缓存：同一表达式在同样 settings 下已经模拟过的不再提交
+    cache = SimResultCache() if skip_cached else None
+
+    def cached(alpha, region, decay, delay):
+        hit = cache.get(alpha, simulation_settings(region[0], region[1], decay, delay, neut))
+        if hit is not None:
+            log.debug('skipping cached simulation', tag=name, alpha=alpha, alpha_id=hit.alpha_id, cached_tag=hit.tag)
+            metrics.inc('cache_hits_total', region=region[0])
+        return hit is not None
+
+    # 提交前静态检查（算子表走本地缓存）：没通过的不进 pool，
+    # 运行结束时连同原因写到 records/{name}_invalid_alpha_expression.txt。
+    # 需要检查字段是否存在时由调用方传入带 fields 的 validator
+    if validator is None and validate:
+        validator = ExpressionValidator(operator_catalog)
+    invalid = []
+
+    def skip(alpha, region, decay, delay):
+        if validator is not None:
+            problems = validator.check(alpha)
+            if problems:
+                log.warning('invalid expression dropped', tag=name, alpha=alpha,
+                            problems=['%s: %s' % p for p in problems])
+                metrics.inc('invalid_expressions_total', kind=problems[0].kind)
+                invalid.append((alpha, problems))
+                return settled([alpha])
+        if cache is not None and cached(alpha, region, decay, delay):
+            return settled([alpha])
+        return False
+
+    # 表达式按 pool 惰性切分（alpha_list 等也可以是生成器），经有界队列交给固定数量的 worker；
+    # worker 数等于各账号并发窗口上限之和，实际同时在途的模拟数由各账号的窗口控制
+    pools = itertools.chain(resumed, iter_pools(alpha_list, region_list, decay_list, delay_list, skip=skip))
+    n_workers = int(accounts.max_window)
+
+    completed_tasks = 0
+    harvest = set()  # 模拟结束后还在后台打标签、落盘的 pool，worker 不等它们
+
+    async def worker(job):
+        nonlocal completed_tasks
+        slot = None
+        try:
+            if isinstance(job, JournalPool):
+                slot = accounts.slot(job.account)  # 进度 URL 只能用提交它的账号轮询
+                await resume_multi(slot.session_manager, job, name, tags, slot, slot.poller, journal, metrics, cache,
+                                   harvest=harvest)
+            else:
+                alpha_chunk, region, decay, delay = job
+                slot = await accounts.acquire()
+                await simulate_multi(slot.session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
+                                     tags, slot, slot.poller, journal, metrics, cache, account=slot.name,
+                                     on_done=on_done, harvest=harvest)
+        except Exception as e:
+            log.error('pool failed', tag=name, task=completed_tasks + 1, error=str(e))
+        finally:
+            if slot is not None:
+                await slot.cancel()
+        completed_tasks += 1
+        if completed_tasks % 10 == 0 or completed_tasks == total_tasks:
+            log.info('progress', tag=name, completed=completed_tasks, total=total_tasks,
+                     window=round(accounts.window, 1))
 
     try:
         # 移除硬超时限制，让任务自然完成
-        # 添加进度监控
-        completed_tasks = 0
-        total_tasks = len(tasks)
-        
-        print(f"开始执行 {total_tasks} 个任务组...")
-        
-        # 使用asyncio.as_completed来监控进度
-        for coro in asyncio.as_completed(tasks):
-            try:
-                result = await coro
-                completed_tasks += 1
-                if completed_tasks % 10 == 0 or completed_tasks == total_tasks:
-                    print(f"进度: {completed_tasks}/{total_tasks} ({completed_tasks/total_tasks*100:.1f}%)")
-            except Exception as e:
-                completed_tasks += 1
-                print(f"任务 {completed_tasks} 执行失败: {e}")
-                
-        print(datetime.now(), f"所有异步任务已完成 ({completed_tasks}/{total_tasks})")
+        log.info('workers started', tag=name, pools=total_tasks, workers=n_workers)
+        await run_workers(pools, worker, n_workers, metrics=metrics)
+        log.info('simulation run finished', tag=name, completed=completed_tasks, total=total_tasks)
     except Exception as e:
-        print(datetime.now(), f"异步任务执行出错: {str(e)}")
+        log.error('simulation run failed', tag=name, error=str(e))
     finally:  # 添加finally块确保资源释放
-        try:
-            await session_manager.session.close()
-        except Exception as e:
-            print(datetime.now(),f"Error closing session: {str(e)}")
+        if harvest:
+            log.info('waiting for child resolution', tag=name, pools=len(harvest))
+            await asyncio.gather(*list(harvest), return_exceptions=True)
+        await records_writer(name).close()
+        await metrics.close()
+        if cache is not None:
+            cache.close()
+        if invalid:
+            report_path = os.path.join(RECORDS_PATH, f'{name}_invalid_alpha_expression.txt')
+            write_report(report_path, invalid)
+            log.warning('invalid expressions reported', tag=name, count=len(invalid), path=report_path)
+        journal.close()
+        await accounts.close()
+        for account, stats in accounts.stats().items():
+            log.info('concurrency window stats', tag=name, account=account, **stats)
 
 
 def read_completed_alphas(filepath):
@@ -7,42 +7,35 @@ import time
 import json
 import pandas as pd
 from itertools import product
+import itertools
 from collections import defaultdict
 from datetime import datetime
-import aiofiles
 import aiohttp
 import asyncio
 
-def login():
-    # 从txt文件解密并读取数据
-    # txt格式:
-    # password: 'password'
-    # username: 'username'
-    def load_decrypted_data(txt_file='user_info.txt'):
-        with open(txt_file, 'r') as f:
-            data = f.read()
-            data = data.strip().split('\n')
-
-            data = {line.split(': ')[0]: line.split(': ')[1] for line in data}
-
-        return data['username'][1:-1], data['password'][1:-1]
-
-    username, password = load_decrypted_data("user_info.txt")
-
-    # Create a session to persistently store the headers
-    s = requests.Session()
-
-    # Save credentials into session
-    s.auth = (username, password)
-
-    # Send a POST request to the /authentication API
-    response = s.post('https://api.worldquantbrain.com/authentication')
-    print(response.content)
-    return s
+from brain_cache import OperatorCatalog, LazyOperatorList, fetch_datafields
+from brain_auth import login, async_login, token_lifetime, SessionManager
+from alpha_pager import iter_alpha_pages
+from throttle import AIMDLimiter
+from sim_poller import ProgressPoller
+from sim_scheduler import iter_pools, run_workers, pool_size
+from account_pool import AccountPool
+from sim_journal import SimJournal, JournalPool
+from records_writer import records_writer
+from sim_metrics import SimMetrics, NULL_METRICS
+from sim_cache import SimResultCache, is_metrics
+from fastexpr import canonical_key
+from expr_dag import call, var, template
+from brain_log import get_logger
+from expr_validator import ExpressionValidator, write_report
+from group_catalog import static_group_catalog
+from config import SIM_MAX_CONCURRENCY, CHILD_FETCH_CONCURRENCY, RECORDS_PATH, CREDENTIAL_FILES
 
 pd.set_option('expand_frame_repr', False)
 pd.set_option('display.max_rows', 1000)
 
+log = get_logger(__name__)
+
 brain_api_url = os.environ.get("BRAIN_API_URL", "https://api.worldquantbrain.com")
 
 basic_ops = ["log", "sqrt", "reverse", "inverse", "rank", "zscore", "log_diff", "s_log_1p",
@@ -69,16 +62,15 @@ vec_ops = ["vec_avg", "vec_sum", "vec_ir", "vec_max",
 
 ops_set = basic_ops + ts_ops + arsenal + group_ops
 
-s = login()
-res = s.get("https://api.worldquantbrain.com/operators")
-aval = pd.DataFrame(res.json())['name'].tolist()
-ts_ops = [op for op in ts_ops if op in aval]
-basic_ops = [op for op in basic_ops if op in aval]
-group_ops = [op for op in group_ops if op in aval]
-twin_field_ops = [op for op in twin_field_ops if op in aval]
-arsenal = [op for op in arsenal if op in aval]
-vec_ops = [op for op in vec_ops if op in aval]
-s.close()
+# 算子表惰性加载：第一次读取下面这些列表时才按平台 /operators 过滤（带磁盘缓存）
+operator_catalog = OperatorCatalog(login)
+aval = LazyOperatorList(operator_catalog)
+ts_ops = LazyOperatorList(operator_catalog, ts_ops)
+basic_ops = LazyOperatorList(operator_catalog, basic_ops)
+group_ops = LazyOperatorList(operator_catalog, group_ops)
+twin_field_ops = LazyOperatorList(operator_catalog, twin_field_ops)
+arsenal = LazyOperatorList(operator_catalog, arsenal)
+vec_ops = LazyOperatorList(operator_catalog, vec_ops)
 
 
 def set_alpha_properties(
@@ -109,7 +101,7 @@ def set_alpha_properties(
         params["selection"] = {"description": selection_desc}
 
     response = s.patch(
-        "https://api.worldquantbrain.com/alphas/" + alpha_id, json=params
+        brain_api_url + "/alphas/" + alpha_id, json=params
     )
 
 
@@ -130,7 +122,7 @@ def get_vec_fields(fields):
 
 
 def get_datafields(
-        s,
+        s=None,
         instrument_type: str = 'EQUITY',
         region: str = 'USA',
         delay: int = 1,
@@ -138,27 +130,13 @@ def get_datafields(
         dataset_id: str = '',
         search: str = ''
 ):
-    if len(search) == 0:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}&limit=50" + \
-                       "&offset={x}"
-        count = s.get(url_template.format(x=0)).json()['count']
-
-    else:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" + \
-                       f"&search={search}" + \
-                       "&offset={x}"
-        count = 100
-
-    datafields_list = []
-    for x in range(0, count, 50):
-        datafields = s.get(url_template.format(x=x))
-        datafields_list.append(datafields.json()['results'])
-
-    datafields_list_flat = [item for sublist in datafields_list for item in sublist]
+    """
+    拉取字段元数据；分页并发请求，结果按查询条件缓存在本地（见 brain_cache.fetch_datafields）。
+    命中缓存时不会用到 s；s 为 None 且需要联网时自动登录
+    """
+    datafields_list_flat = fetch_datafields(s, instrument_type=instrument_type, region=region, delay=delay,
+                                            universe=universe, dataset_id=dataset_id, search=search,
+                                            session_factory=login)
 
     datafields_df = pd.DataFrame(datafields_list_flat)
     return datafields_df
@@ -177,78 +155,43 @@ def process_datafields(df, data_type):
     return tb_fields
 
 
-def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
-               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None):
-
-
-    # color None, RED, YELLOW, GREEN, BLUE, PURPLE CYX专用
-    if s is None:
-        s = login()
-    alpha_list = []
-    next_alphas = []
-    decay_alphas = []
-    check_alphas = []
+def _alpha_query_url(sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+                     delay, instrumentType, tag='', color_exclude='', negative=False):
+    """
+    拼出 /users/self/alphas 的查询地址，offset 和 dateCreated 区间留 {offset}、{start}、{end} 占位
+    """
     # 3E large 3C less
+    if negative:
+        sharpe_cond = f"is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}"
+    else:
+        sharpe_cond = f"is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}"
+    return (f"{brain_api_url}/users/self/alphas?limit=100&offset={{offset}}"
+            f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
+            f"&settings.region={region}&{sharpe_cond}"
+            f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={{start}}"
+            f"&dateCreated%3C{{end}}&type=REGULAR&color!={color_exclude}&"
+            f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
+
+
+def _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+                      delay, instrumentType, usage, tag='', color_exclude=''):
+    args = (sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe,
+            delay, instrumentType, tag, color_exclude)
     # 正的
-    i = 0
-    while True:
-        url_e = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                 f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                 f"&settings.region={region}&is.sharpe%3E={sharpe_th}&is.fitness%3E={fitness_th}"
-                 f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                 f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                 f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-        response = s.get(url_e)
-        # print(response.json())
-        try:
-            i += 100
-            count = int(response.json()["count"])
-            print(f"一共有{count}个因子等待被获取，已经获取了{i-100}个")
-            alpha_list.extend(response.json()["results"])
-            if i >= count or i == 9900:
-                break
-            time.sleep(3)
-        except Exception as e:
-            print(f"Failed to get alphas: {e}")
-            i -= 100
-            time.sleep(60)
-            s = login()
-            print("%d finished re-login" % i)
-
+    query_urls = [_alpha_query_url(*args)]
     # 负的
     if usage != "submit":
-        i = 0
-        while True:
-            url_c = (f"https://api.worldquantbrain.com/users/self/alphas?limit=100&offset={i}"
-                     f"&tag%3D{tag}&is.longCount%3E={longCount_th}&is.shortCount%3E={shortCount_th}"
-                     f"&settings.region={region}&is.sharpe%3C=-{sharpe_th}&is.fitness%3C=-{fitness_th}"
-                     f"&settings.universe={universe}&status=UNSUBMITTED&dateCreated%3E={start_date}"
-                     f"T00:00:00-04:00&dateCreated%3C{end_date}T00:00:00-04:00&type=REGULAR&color!={color_exclude}&"
-                     f"settings.delay={delay}&settings.instrumentType={instrumentType}&order=-is.sharpe&hidden=false&type!=SUPER")
-
-            response = s.get(url_c)
-            # print(response.json())
-            try:
-                count = response.json()["count"]
-                if i >= count or i == 9900:
-                    break
-                alpha_list.extend(response.json()["results"])
-                i += 100
-            except Exception as e:
-                print(f"Failed to get alphas: {e}")
-                time.sleep(5)
-                s = login()
-                print("%d finished re-login" % i)
+        query_urls.append(_alpha_query_url(*args, negative=True))
+    return query_urls
 
-    # print(alpha_list)
-    if len(alpha_list) == 0:
-        if usage != "submit":
-            return {"next": [], "decay": []}
-        else:
-            return {"check": []}
 
-    # print(response.json())
+def _process_alphas(alpha_list, usage, sharpe_th, s):
+    """
+    把 /users/self/alphas 返回的原始 alpha 整理成 get_alphas 的输出格式
+    """
+    next_alphas = []
+    decay_alphas = []
+    check_alphas = []
     if usage != "submit":
         for j in range(len(alpha_list)):
             alpha_id = alpha_list[j]["id"]
@@ -310,8 +253,7 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortC
                     decay_alphas.append(rec)
                 else:
                     next_alphas.append(rec)
-        output_dict = {"next": next_alphas, "decay": decay_alphas}
-        print("获取到了%d个因子" % (len(next_alphas) + len(decay_alphas)))
+        return {"next": next_alphas, "decay": decay_alphas}
     else:
         for alpha_detail in alpha_list:
             id = alpha_detail["id"]
@@ -388,78 +330,146 @@ def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortC
                        "startDate": startDate, "checks": checks, "os": os, "train": train, "test": test, "prod": prod,
                        "competitions": competitions, "themes": themes, "team": team, "pyramids": pyramids}
                 check_alphas.append(rec)
-        output_dict = {"check": check_alphas}
-
-    # 超过了限制
-    if usage == 'submit' and count >= 9900:
-        if len(output_dict['check']) < len(alpha_list):
-            # 那么就再来一遍
-            output_dict = get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th,
-                                     region, universe, delay, instrumentType, alpha_num, usage, tag, color_exclude)
+        return {"check": check_alphas}
+
+
+def iter_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
+                instrumentType, usage, tag: str = '', color_exclude='', s=None):
+    """
+    get_alphas 的流式版本：分页并发下载，每下载好一页就整理并产出一次，
+    usage != 'submit' 时产出 {"next": [...], "decay": [...]}，否则产出 {"check": [...]}
+    """
+    if s is None and usage == "submit":
+        s = login()
+    query_urls = _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th,
+                                   region, universe, delay, instrumentType, usage, tag, color_exclude)
+    for page in iter_alpha_pages(query_urls, start_date, end_date):
+        yield _process_alphas(page.results, usage, sharpe_th, s)
+
+
+def get_alphas(start_date, end_date, sharpe_th, fitness_th, longCount_th, shortCount_th, region, universe, delay,
+               instrumentType, alpha_num, usage, tag: str = '', color_exclude='', s=None):
+
+
+    # color None, RED, YELLOW, GREEN, BLUE, PURPLE CYX专用
+    if s is None:
+        s = login()
+    query_urls = _alpha_query_urls(sharpe_th, fitness_th, longCount_th, shortCount_th,
+                                   region, universe, delay, instrumentType, usage, tag, color_exclude)
+    # 各页并发下载；命中数超过9900时自动按 dateCreated 切成多个区间，一遍取完
+    query_alphas = [[] for _ in query_urls]
+    for page in iter_alpha_pages(query_urls, start_date, end_date):
+        query_alphas[page.query].extend(page.results)
+        log.debug('alpha page fetched', query=page.query, offset=page.offset, total=page.total,
+                  fetched=len(query_alphas[page.query]))
+    # 切分区间后每个区间各自按 sharpe 排序，这里合并后重新排一次（与 order=-is.sharpe 一致）
+    alpha_list = []
+    for alphas in query_alphas:
+        alpha_list.extend(sorted(alphas, key=lambda x: -x["is"]["sharpe"]))
+
+    # print(alpha_list)
+    if len(alpha_list) == 0:
+        if usage != "submit":
+            return {"next": [], "decay": []}
         else:
-            raise Exception("Too many alphas to check!! over 10000, universe: %s, region: %s" % (universe, region))
+            return {"check": []}
+
+    output_dict = _process_alphas(alpha_list, usage, sharpe_th, s)
+    if usage != "submit":
+        log.info('alphas fetched', region=region, count=len(output_dict["next"]) + len(output_dict["decay"]))
 
     return output_dict
 
 
-def ts_comp_factory(op, field, factor, paras):
-    output = []
-    # l1, l2 = [3, 5, 10, 20, 60, 120, 240], paras
-    l1, l2 = [5, 22, 66, 120, 240], paras
-    comb = list(product(l1, l2))
+# 工厂里的表达式都由 expr_dag 的共享模板绑定取值得到（expr_dag.Bound），str() 时才渲染；
+# iter_* 传 render=False 时直接产出 Bound，下游可以按结构去重、再套一层模板，不用解析字符串
+_OP, _X, _D, _G = var("op"), var("x"), var("d"), var("g")
+_FIELD = template(_X, "x")
+_TS = template(call(_OP, _X, _D), "op", "x", "d")
+_UNARY = template(call(_OP, _X), "op", "x")
+_SIGNED_POWER = template(call(_OP, _X, 2), "op", "x")
+_GROUP = template(call(_OP, _X, call("densify", _G)), "op", "x", "g")
+_GROUP_VECTOR = template(call(_OP, _X, var("v"), call("densify", _G)), "op", "x", "v", "g")
+_GROUP_PERCENTAGE = template(call(_OP, _X, call("densify", _G), percentage=0.5), "op", "x", "g")
+_TRADE_WHEN = template(call(_OP, var("open"), _X, var("exit")), "op", "open", "x", "exit")
+_TS_COMP = {}
 
-    for day, para in comb:
 
-        if type(para) == float:
-            alpha = "%s(%s, %d, %s=%.1f)" % (op, field, day, factor, para)
-        elif type(para) == int:
-            alpha = "%s(%s, %d, %s=%d)" % (op, field, day, factor, para)
+def _rendered(nodes, render):
+    return map(str, nodes) if render else nodes
 
-        output.append(alpha)
 
-    return output
+def _ts_comp_nodes(op, field, factor, paras):
+    t = _TS_COMP.get(factor)
+    if t is None:
+        t = _TS_COMP[factor] = template(call(_OP, _X, _D, **{factor: var("p")}), "op", "x", "d", "p")
+    # l1, l2 = [3, 5, 10, 20, 60, 120, 240], paras
+    l1, l2 = [5, 22, 66, 120, 240], paras
+    for day, para in product(l1, l2):
+        yield t.bind(op, field, day, para)
 
 
-def first_order_factory(fields, ops_set):
-    alpha_set = []
+def ts_comp_factory(op, field, factor, paras):
+    return [str(alpha) for alpha in _ts_comp_nodes(op, field, factor, paras)]
+
 
+def _first_order_nodes(fields, ops_set, catalog=None):
     for field in fields:
         # reverse op does the work
-        alpha_set.append(field)
+        yield _FIELD.bind(field)
         for op in ops_set:
             if op in field:
                 continue
             if op == "ts_percentage":
-                alpha_set += ts_comp_factory(op, field, "percentage", [0.2, 0.5, 0.8])
+                yield from _ts_comp_nodes(op, field, "percentage", [0.2, 0.5, 0.8])
             elif op == "ts_decay_exp_window":
-                alpha_set += ts_comp_factory(op, field, "factor", [0.5])
+                yield from _ts_comp_nodes(op, field, "factor", [0.5])
             elif op == "ts_moment":
-                alpha_set += ts_comp_factory(op, field, "k", [2, 3, 4])
+                yield from _ts_comp_nodes(op, field, "k", [2, 3, 4])
             elif op == "ts_entropy":
-                alpha_set += ts_comp_factory(op, field, "buckets", [10])
+                yield from _ts_comp_nodes(op, field, "buckets", [10])
             elif op.startswith("ts_") or op == "inst_tvr":
-                alpha_set += ts_factory(op, field)
+                yield from _ts_nodes(op, field)
             elif op.startswith("group_"):
-                alpha_set += group_factory(op, field)
+                yield from _group_nodes(op, field, catalog=catalog)
             elif op == "signed_power":
-                alpha = "%s(%s, 2)" % (op, field)
-                alpha_set.append(alpha)
+                yield _SIGNED_POWER.bind(op, field)
             else:
-                alpha = "%s(%s)" % (op, field)
-                alpha_set.append(alpha)
+                yield _UNARY.bind(op, field)
+
 
-    return alpha_set
+def iter_first_order_factory(fields, ops_set, render=True, catalog=None):
+    """first_order_factory 的生成器版本：逐条产出，fields 也可以是生成器；render=False 时产出 Bound"""
+    return _rendered(_first_order_nodes(fields, ops_set, catalog), render)
 
-def get_group_second_order_factory(first_order, group_ops, group_fields=[]):
-    second_order = []
+
+def first_order_factory(fields, ops_set, catalog=None):
+    return list(iter_first_order_factory(fields, ops_set, catalog=catalog))
+
+
+def _group_second_order_nodes(first_order, group_ops, group_fields, catalog):
     for fo in first_order:
         for group_op in group_ops:
-            second_order += group_factory(group_op, fo, group_fields)
-    return second_order
+            yield from _group_nodes(group_op, fo, group_fields, catalog)
 
 
-def trade_when_factory(op, field, region, delay=1):
-    output = []
+def iter_group_second_order_factory(first_order, group_ops, group_fields=(), render=True, catalog=None):
+    """
+    get_group_second_order_factory 的生成器版本：一阶表达式可以边生成边展开；
+    first_order 可以是 iter_first_order_factory(..., render=False) 的 Bound，外层模板直接引用，不再拼接文本
+    """
+    return _rendered(_group_second_order_nodes(first_order, group_ops, group_fields, catalog), render)
+
+
+def get_group_second_order_factory(first_order, group_ops, group_fields=(), catalog=None):
+    return list(iter_group_second_order_factory(first_order, group_ops, group_fields, catalog=catalog))
+
+
+def iter_trade_when_factory(op, field, region, delay=1, render=True):
+    return _rendered(_trade_when_nodes(op, field, region, delay), render)
+
+
+def _trade_when_nodes(op, field, region, delay):
     open_events = [
         "ts_arg_max(volume, 5) == 0",
         "ts_corr(close, volume, 252) <= 0",
@@ -502,84 +512,56 @@ def trade_when_factory(op, field, region, delay=1):
 
     for oe in open_events:
         for ee in exit_events:
-            alpha = "%s(%s, %s, %s)" % (op, oe, field, ee)
-            output.append(alpha)
-    return output
+            yield _TRADE_WHEN.bind(op, oe, field, ee)
 
 
-def ts_factory(op, field):
-    output = []
+def trade_when_factory(op, field, region, delay=1):
+    return list(iter_trade_when_factory(op, field, region, delay))
+
+
+def _ts_nodes(op, field):
     # 3天，1周，半个月，一个月，一个季度，半年，一年，两年
     days = [3, 5, 11, 22, 66, 122, 252, 504]
 
     for day in days:
-        alpha = "%s(%s, %d)" % (op, field, day)
-        output.append(alpha)
+        yield _TS.bind(op, field, day)
 
-    return output
 
+def ts_factory(op, field):
+    return [str(alpha) for alpha in _ts_nodes(op, field)]
 
-def group_factory(op, field, group_fields=[]):
-    output = []
-    vectors = ["cap"]
 
-    # 量价
-    cap_group = "bucket(rank(cap), range='0.1, 1, 0.1')"
-    sector_cap_group = "bucket(group_rank(cap,sector),range='0,1,0.1')"
-    vol_group = "bucket(rank(ts_std_dev(returns,240)),range = '0.1,1,0.1')"
-    volatility_group = "bucket(rank(ts_std_dev(returns,20)),range = '0.1, 1, 0.1')"
-    liquidity_group = "bucket(rank(close*volume),range = '0.1, 1, 0.1')"
-    turnover_group = "bucket(rank(close*volume/cap),range='0.1, 1, 0.1')"
-    dividend_yield_group = "bucket(rank(dividend/close), range='0.1, 1, 0.1')"
-    adv20_group = "bucket(rank(adv20), range='0.1, 1, 0.1')"
-
-    # 基本面
-    sector_asset_group = "bucket(group_rank(assets, sector),range='0.1, 1, 0.1')"
-    bps_group = "bucket(rank(fnd28_value_05480/close), range='0.2, 1, 0.2')"
-    pb_group = "bucket(rank(fnd28_value_05480/bookvalue_ps), range='0.1, 1, 0.1')"
-    debt_to_equity_group = "bucket(rank(liabilities/assets), range='0.1, 1, 0.1')"
-
-    # 看自己有没有
-    fnd23_net_income_group = "bucket(rank(fnd23_net_income/assets), range='0.1, 1, 0.1')"
-    fnd23_net_debt_group = "bucket(rank(fnd23_net_debt/assets), range='0.1, 1, 0.1')"
-    anl14_buy_group = "bucket(rank(anl14_buy), range='0.1, 1, 0.1')"
-    anl15_bps_gr_12_m_1m_chg_group = "bucket(rank(anl15_bps_gr_12_m_1m_chg), range='0.1, 1, 0.1')"
-    anl15_salgics_gr_18_m_pe_group = "bucket(rank(anl15_salgics_gr_18_m_pe), range='0.1, 1, 0.1')"
-    anl4_adjusted_netincome_ft_group = "bucket(rank(anl4_adjusted_netincome_ft), range='0.1, 1, 0.1')"
-    call_breakeven_10_group = "bucket(rank(call_breakeven_10), range='0.1, 1, 0.1')"
-    correlation_last_60_days_spy_group = "bucket(rank(correlation_last_60_days_spy), range='0.1, 1, 0.1')"
-    est_12m_eps_num_28d_group = "bucket(rank(est_12m_eps_num_28d), range='0.1, 1, 0.1')"
-
-    base_group = ["market", "sector", "industry", "subindustry", "country"]
-
-    # 经验总结出来的group
-    experts_group = [
-        bps_group, cap_group, sector_cap_group, turnover_group,
-        volatility_group, liquidity_group, sector_asset_group,
-        pb_group, debt_to_equity_group, dividend_yield_group,
-        adv20_group
-    ]
+_static_groups = None
+
+
+def default_group_catalog():
+    """没指定 region 时用的分组表（原来的固定列表）；只在第一次用到时查一次算子表"""
+    global _static_groups
+    if _static_groups is None:
+        _static_groups = static_group_catalog(include_vol="ts_returns" in operator_catalog)
+    return _static_groups
 
-    if "ts_returns" in aval:
-        experts_group.append(vol_group)
 
-    group_fields += base_group
-    group_fields +=experts_group
-    group_fields = list(set(group_fields))
+def _group_nodes(op, field, group_fields=(), catalog=None):
+    vectors = ["cap"]
+    catalog = default_group_catalog() if catalog is None else catalog
 
-    for group in group_fields:
+    for group in catalog.expand(group_fields):
         if op.startswith("group_vector"):
             for vector in vectors:
-                alpha = "%s(%s,%s,densify(%s))" % (op, field, vector, group)
-                output.append(alpha)
+                yield _GROUP_VECTOR.bind(op, field, vector, group)
         elif op.startswith("group_percentage"):
-            alpha = "%s(%s,densify(%s),percentage=0.5)" % (op, field, group)
-            output.append(alpha)
+            yield _GROUP_PERCENTAGE.bind(op, field, group)
         else:
-            alpha = "%s(%s,densify(%s))" % (op, field, group)
-            output.append(alpha)
+            yield _GROUP.bind(op, field, group)
 
-    return output
+
+def group_factory(op, field, group_fields=(), catalog=None):
+    """
+    catalog 为该 region 下能用的分组表（group_catalog.group_catalog(...)），不传时用固定分组表；
+    group_fields 为额外加上的分组。分组表预先算好，每个表达式展开出的条数、顺序都固定
+    """
+    return [str(alpha) for alpha in _group_nodes(op, field, group_fields, catalog)]
 
 
 def template_factory(field, region):
@@ -626,59 +608,9 @@ def while_true_try_decorator(func):
                 time.sleep(2)
     return wrapper
 
-async def async_login():
-    """
-    从YAML文件加载用户信息并异步登录到指定API
-    """
-    def load_decrypted_data(txt_file='user_info.txt'):
-        with open(txt_file, 'r') as f:
-            data = f.read()
-            data = data.strip().split('\n')
-            data = {line.split(': ')[0]: line.split(': ')[1] for line in data}
-
-        return data['username'][1:-1], data['password'][1:-1]
-
-    username, password = load_decrypted_data("user_info.txt")
-
-    # 创建一个aiohttp的Session
-    conn = aiohttp.TCPConnector(ssl=False)
-    session = aiohttp.ClientSession(connector=conn)
-
-    time_out = 5
-    while True:
-        if time_out < 0:
-            print("Login timeout!")
-            await session.close()
-            raise Exception("Login timeout! 无法登录，退出程序中...")
-
-        time_out -= 1
-
-        try:
-            # 发送一个POST请求到/authentication API
-            async with session.post('https://api.worldquantbrain.com/authentication',
-                                    auth=aiohttp.BasicAuth(username, password)) as response:
-                # 检查状态码是否为201，确保登录成功
-                if response.status == 201:
-                    print("Login successful!")
-                else:
-                    print(f"Login failed! Status code: {response.status}, Response: {await response.text()}")
-                    # 异步睡眠10s
-                    await asyncio.sleep(10**time_out)
-
-            return session
-
-        except aiohttp.ClientError as e:
-            print(f"Error during login request: {e}")
-            await session.close()
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            await session.close()
-
-
-
 async def simulate_single(session_manager, alpha_expression, region_info, name, neut,
                           decay, delay, stone_bag, tags=['None'],
-                          semaphore=None):
+                          semaphore=None, poller=None):
     """
     单次模拟一个alpha表达式对应的某个地区的信息
     """
@@ -690,7 +622,8 @@ async def simulate_single(session_manager, alpha_expression, region_info, name,
         region, uni = region_info
         alpha = "%s" % (alpha_expression)
 
-        print("Simulating for alpha: %s, region: %s, universe: %s, decay: %s" % (alpha, region, uni, decay))
+        sim_log = log.bind(tag=name, region=region)
+        sim_log.debug('simulating alpha', alpha=alpha, universe=uni, decay=decay)
 
         simulation_data = {
             'type': 'REGULAR',
@@ -713,73 +646,72 @@ async def simulate_single(session_manager, alpha_expression, region_info, name,
 
         while True:
             try:
-                async with session_manager.session.post('https://api.worldquantbrain.com/simulations',
-                                                        json=simulation_data) as resp:
+                session = session_manager.session
+                async with session.post(brain_api_url + '/simulations',
+                                        json=simulation_data) as resp:
+                    if resp.status == 401:
+                        await session_manager.refresh_session(session)
+                        continue
+                    if resp.status == 429:
+                        semaphore.on_limit()
+                        await asyncio.sleep(float(resp.headers.get('Retry-After', 5)))
+                        continue
                     simulation_progress_url = resp.headers.get('Location', 0)
                     if simulation_progress_url == 0:
                         json_data = await resp.json()
-                        if type(json_data) == list:
-                            print(json_data)
-                            detail = json_data.get("detail", 0)
-                        else:
-                            detail = json_data.get("detail", 0)
+                        detail = json_data.get("detail", 0)
                         if detail == 'SIMULATION_LIMIT_EXCEEDED':
-                            print("Limited by the number of simulations allowed per time")
+                            sim_log.warning('simulation limit exceeded')
+                            semaphore.on_limit()
                             await asyncio.sleep(5)
                         else:
-                            print("detail:", detail)
-                            print("json_data:", json_data)
-                            print("Alpha expression is duplicated")
+                            sim_log.warning('simulation rejected', alpha=alpha, detail=detail, response=json_data)
                             await asyncio.sleep(1)
                             return 0
                     else:
-                        print('simulation_progress_url:', simulation_progress_url)
+                        semaphore.on_success()
+                        sim_log.info('simulation submitted', url=simulation_progress_url)
                         break
             except KeyError:
-                print("Location key error during simulation request")
+                sim_log.error('simulation response has no Location', alpha=alpha)
                 await asyncio.sleep(60)
                 return
             except Exception as e:
-                print("An error occurred:", str(e))
+                sim_log.error('simulation submit failed', alpha=alpha, error=str(e))
                 await asyncio.sleep(60)
                 return
 
-        while True:
-            try:
-                async with session_manager.session.get(simulation_progress_url) as resp:
-                    json_data = await resp.json()
-                    # 获取响应头
-                    headers = resp.headers
-                    retry_after = headers.get('Retry-After', 0)
-                    if retry_after == 0:
-                        break
-                    await asyncio.sleep(float(retry_after))
-            except Exception as e:
-                print("Error while checking progress:", str(e))
-                await asyncio.sleep(60)
-
-        print("%s done simulating, getting alpha details" % (simulation_progress_url))
+        # 进度由共用的 poller 统一轮询，模拟结束才会唤醒这里
         try:
-            alpha_id = json_data.get("alpha")
+            json_data = await poller.wait(simulation_progress_url)
+        except Exception as e:
+            sim_log.error('progress check failed', url=simulation_progress_url, error=str(e))
+            return
 
-            await async_set_alpha_properties(session_manager.session,
-                                             alpha_id,
-                                             name="%s" % name,
-                                             color=None,
-                                             tags=tags)
+        sim_log.info('simulation finished', url=simulation_progress_url)
 
-            async with aiofiles.open(f'records/{name}_simulated_alpha_expression.txt', mode='a') as f:
-                await f.write(alpha + '\n')
+    # 槽位已经释放，打标签、等记录落盘都在槽位外完成，不占用模拟并发
+    try:
+        alpha_id = json_data.get("alpha")
 
-            # stone_bag.append(alpha_id)
+        await async_set_alpha_properties(session_manager.session,
+                                         alpha_id,
+                                         name="%s" % name,
+                                         color=None,
+                                         tags=tags)
 
-        except KeyError:
-            print("Failed to retrieve alpha ID for: %s" % simulation_progress_url)
-        except Exception as e:
-            print("An error occurred while setting alpha properties:", str(e))
+        await records_writer(name).append([alpha])
+        sim_log.debug('alpha recorded', alpha_id=alpha_id, alpha=alpha[:120])
+
+        # stone_bag.append(alpha_id)
 
-        # return stone_bag
-        return 0
+    except KeyError:
+        sim_log.error('simulation has no alpha', url=simulation_progress_url)
+    except Exception as e:
+        sim_log.error('setting alpha properties failed', url=simulation_progress_url, error=str(e))
+
+    # return stone_bag
+    return 0
 
 
 async def async_set_alpha_properties(
@@ -812,45 +744,54 @@ async def async_set_alpha_properties(
     if selection_desc:
         params["selection"] = {"description": selection_desc}
 
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
+    url = f"{brain_api_url}/alphas/{alpha_id}"
 
     try:
         async with session.patch(url, json=params) as response:
             # 检查状态码，确保请求成功
             if response.status == 200:
-                print(f"Alpha {alpha_id} properties updated successfully! Tag: {tags}")
+                log.debug('alpha properties updated', alpha_id=alpha_id, tags=tags)
+                return await response.json()  # 更新后的 alpha（含 IS 指标）
             else:
-                print(
-                    f"Failed to update alpha {alpha_id}. Status code: {response.status}, Response: {await response.text()}")
+                log.warning('alpha properties update failed', alpha_id=alpha_id, status=response.status,
+                            response=await response.text())
 
     except aiohttp.ClientError as e:
-        print(f"Error during patch request for alpha {alpha_id}: {e}")
+        log.error('alpha properties request failed', alpha_id=alpha_id, error=str(e))
     except Exception as e:
-        print(f"An unexpected error occurred for alpha {alpha_id}: {e}")
-
+        log.error('alpha properties update raised', alpha_id=alpha_id, error=str(e))
 
 
-class SessionManager:
-    def __init__(self, session, start_time, expiry_time):
-        self.session = session
-        self.start_time = start_time
-        self.expiry_time = expiry_time
 
-    async def refresh_session(self):
-        print(datetime.now(),"Session expired, logging in again...")
-        await self.session.close()
-        self.session = await async_login()
-        self.start_time = time.time()
+def simulation_settings(region, uni, decay, delay, neut):
+    """
+    提交 /simulations 时用的完整 settings；也是结果缓存 key 的一部分
+    """
+    return {
+        'instrumentType': 'EQUITY',
+        'region': region,
+        'universe': uni,
+        'delay': delay,
+        'decay': decay,
+        'neutralization': neut,
+        'truncation': 0.08,
+        'pasteurization': 'ON',
+        'unitHandling': 'VERIFY',
+        'nanHandling': 'ON',
+        'language': 'FASTEXPR',
+        'visualization': False,
+    }
 
 
 async def simulate_multi(session_manager, alpha_expression_list: list, region_info, name, neut, decay, delay, stone_bag,
 
-                         tags=['None'], semaphore=None):
+                         tags=['None'], semaphore=None, poller=None, journal=None, metrics=NULL_METRICS,
+                         cache=None, account=None, on_done=None, harvest=None):
     """
-    单次模拟一个alpha表达式对应的某个地区的信息
+    单次模拟一个alpha表达式对应的某个地区的信息；on_done(表达式列表) 在 pool 到达终态时调用：
+    结果落盘、被平台拒绝或重试耗尽。轮询出错时 pool 还以 submitted 留在模拟日志里、下次运行续跑，不调用。
+    传入 harvest（任务集合）时子模拟收尾放到后台，模拟结束就返回，见 harvest_children
     """
-    brain_api_url = 'https://api.worldquantbrain.com'
-
     async with semaphore:
         # 每个任务在执行前都检查会话时间
         if time.time() - session_manager.start_time > session_manager.expiry_time:
@@ -860,133 +801,231 @@ async def simulate_multi(session_manager, alpha_expression_list: list, region_in
             raise ValueError("The number of alpha expressions in a pool should be less than 10")
 
         region, uni = region_info
+        pool_log = log.bind(tag=name, region=region, account=account)
+        settings = simulation_settings(region, uni, decay, delay, neut)
 
         # 产生一个pool，一个pool里最多10个alpha
         sim_data_list = []
         for alpha_expression in alpha_expression_list:
             alpha = "%s" % (alpha_expression)
-            print(datetime.now(),f"Simulating for alpha: {alpha}, region: {region},"
-                         f" universe: {uni}, decay: {decay}, delay: {delay}")
+            pool_log.debug('simulating alpha', alpha=alpha, universe=uni, decay=decay, delay=delay)
 
             simulation_data = {
                 'type': 'REGULAR',
-                'settings': {
-                    'instrumentType': 'EQUITY',
-                    'region': region,
-                    'universe': uni,
-                    'delay': delay,
-                    'decay': decay,
-                    'neutralization': neut,
-                    'truncation': 0.08,
-                    'pasteurization': 'ON',
-                    'unitHandling': 'VERIFY',
-                    'nanHandling': 'ON',
-                    'language': 'FASTEXPR',
-                    'visualization': False,
-                },
+                'settings': settings,
                 'regular': alpha
             }
             sim_data_list.append(simulation_data)
 
+        # 先记入日志，拿到 Location 后再补上进度 URL，崩溃后可以从日志恢复
+        pool_id = None
+        if journal is not None:
+            pool_id = journal.add(name, alpha_expression_list, {'region': region, 'universe': uni, 'decay': decay,
+                                                                'delay': delay, 'neutralization': neut}, account)
+            pool_log = pool_log.bind(pool_id=pool_id)
+
         # 一次性提交10个alpha作为单个task
         max_retries = 5  # 最大重试次数
         retry_count = 0
         while retry_count < max_retries:
             try:
-                async with session_manager.session.post('https://api.worldquantbrain.com/simulations',
-                                                        json=sim_data_list) as simulation_response:
+                session = session_manager.session
+                submit_started = time.monotonic()
+                async with session.post(brain_api_url + '/simulations',
+                                        json=sim_data_list) as simulation_response:
+                    metrics.observe('submit_latency_seconds', time.monotonic() - submit_started, region=region)
+                    if simulation_response.status == 401:
+                        # token 失效，重新登录后再提交（并发任务只会有一个真正去登录）
+                        metrics.inc('submit_retries_total', region=region, reason='auth')
+                        await session_manager.refresh_session(session)
+                        continue
+                    if simulation_response.status == 429:
+                        metrics.inc('limit_exceeded_total', region=region)
+                        semaphore.on_limit()
+                        await asyncio.sleep(float(simulation_response.headers.get('Retry-After', 5)))
+                        continue
                     simulation_progress_url = simulation_response.headers.get('Location', 0)
                     if simulation_progress_url == 0:
                         json_data = await simulation_response.json()
-                        if type(json_data) == list:
-                            print(datetime.now(),f"Response data: {json_data}")
-                            detail = json_data.get("detail", 0)
-                        else:
-                            detail = json_data.get("detail", 0)
+                        detail = json_data.get("detail", 0)
                         if detail == 'SIMULATION_LIMIT_EXCEEDED':
-                            print(datetime.now(),"Limited by the number of simulations allowed per time")
+                            pool_log.warning('simulation limit exceeded')
+                            metrics.inc('limit_exceeded_total', region=region)
+                            semaphore.on_limit()  # 平台限流，收缩并发窗口
                             await asyncio.sleep(5)
                             continue  # 继续重试
                         else:
-                            print(datetime.now(),"detail: {}, json_data: {}".format(detail, json_data))
-                            print(datetime.now(),"Alpha expression is duplicated")
+                            pool_log.warning('simulation rejected', detail=detail, response=json_data)
+                            metrics.inc('simulations_failed_total', region=region, reason='rejected')
+                            if journal is not None:
+                                journal.finish(pool_id, 'failed')
+                            if on_done is not None:
+                                on_done(alpha_expression_list)  # 被拒是终态，重提也一样
                             await asyncio.sleep(1)
                             return 0  # 表达式重复，直接返回
                     else:
-                        print(datetime.now(),'Simulation progress URL: {}'.format(simulation_progress_url))
+                        semaphore.on_success()  # 提交成功，扩大并发窗口
+                        metrics.inc('simulations_submitted_total', region=region)
+                        if journal is not None:
+                            journal.submitted(pool_id, simulation_progress_url)
+                        pool_log.info('simulation submitted', url=simulation_progress_url)
                         break  # 成功获取进度URL，退出重试循环
             except Exception as e:
                 retry_count += 1
-                print(datetime.now(),"Error occurred (attempt {}/{}): {}".format(retry_count, max_retries, e))
+                metrics.inc('submit_retries_total', region=region, reason='error')
+                pool_log.warning('simulation submit failed', attempt=retry_count, max_retries=max_retries, error=str(e))
                 if retry_count >= max_retries:
-                    print(datetime.now(),"Max retries reached, aborting...")
+                    pool_log.error('simulation submit aborted after max retries')
+                    metrics.inc('simulations_failed_total', region=region, reason='retries')
+                    if journal is not None:
+                        journal.finish(pool_id, 'failed')
+                    if on_done is not None:
+                        on_done(alpha_expression_list)
                     return 1  # 达到最大重试次数，返回错误
                 await asyncio.sleep(60)
 
 
-        # 进度检查循环优化
-        max_progress_retries = 10  # 最大重试次数
-        progress_retry_count = 0
-        while progress_retry_count < max_progress_retries:
-            try:
-                async with session_manager.session.get(simulation_progress_url) as resp:
-                    json_data = await resp.json()
-                    # 获取响应头
-                    headers = resp.headers
-                    retry_after = headers.get('Retry-After', 0)
-                    if retry_after == 0:
-                        status = json_data.get("status", 0)
-                        children = json_data.get("children", [])
-                        if status == 'ERROR':
-                            print(datetime.now(),"Error in simulation: {}".format(simulation_progress_url))
-                        elif status != "COMPLETE":
-                            print(datetime.now(),"Simulation not complete: {}".format(simulation_progress_url))
-                            async with session_manager.session.delete(simulation_progress_url) as delete_resp:
-                                delete_json_data = await delete_resp.json()
-                                if delete_json_data.get("detail", 0) == "未找到。":
-                                    print(datetime.now(),"Successfully deleted: {}".format(simulation_progress_url))
-                                else:
-                                    print(datetime.now(),"Failed to delete: {}".format(simulation_progress_url))
-                        else:
-                            print(datetime.now(),'Simulation completed: {}'.format(simulation_progress_url))
-                        break
-                    await asyncio.sleep(float(retry_after))
-            except Exception as e:
-                progress_retry_count += 1
-                print(datetime.now(),"Progress check error (attempt {}/{}): {}". format(progress_retry_count, max_progress_retries, str(e)))
-                if progress_retry_count >= max_progress_retries:
-                    print(datetime.now(),"Max progress check retries reached")
-                    return 2  # 新增错误码
-                await asyncio.sleep(30)  # 平方退避
-
-        # alpha_id = simulation_progress.json()["alpha"]
-        children_list = []
-        for child in children:
+        # 进度检查：交给共用的 poller 按 Retry-After 统一轮询，模拟结束才会唤醒这里
+        submitted_at = time.monotonic()
+        try:
+            json_data = await poller.wait(simulation_progress_url)
+        except Exception as e:
+            pool_log.error('progress check failed', url=simulation_progress_url, error=str(e))
+            metrics.inc('simulations_failed_total', region=region, reason='poll')
+            return 2  # 新增错误码（日志里仍是 submitted，下次运行会继续轮询）
+        finally:
+            metrics.observe('polls_per_simulation', poller.take_polls(simulation_progress_url), region=region)
+        metrics.observe('simulation_wall_seconds', time.monotonic() - submitted_at, region=region)
+        children = await check_simulation_status(session_manager, json_data, simulation_progress_url, pool_log)
+
+    def recorded():
+        if journal is not None:
+            journal.finish(pool_id)
+        if on_done is not None:
+            on_done(alpha_expression_list)
+
+    # 槽位已经释放，子模拟的查询与打标签在槽位外并发完成，不占用模拟并发
+    await harvest_children(harvest, resolve_children(
+        session_manager, children, name, tags, on_recorded=recorded,
+        metrics=metrics, region=region, pool_log=pool_log, settings=settings, cache=cache), pool_log)
+    return 0
+
+
+async def check_simulation_status(session_manager, json_data, simulation_progress_url, pool_log=log):
+    """
+    根据模拟结束时的进度 json 记录状态，未完成的模拟尝试删除，返回子模拟 id 列表
+    """
+    status = json_data.get("status", 0)
+    children = json_data.get("children", [])
+    if status == 'ERROR':
+        pool_log.error('simulation error', url=simulation_progress_url, response=json_data)
+    elif status != "COMPLETE":
+        pool_log.warning('simulation not complete', url=simulation_progress_url, status=status)
+        try:
+            async with session_manager.session.delete(simulation_progress_url) as delete_resp:
+                delete_json_data = await delete_resp.json()
+                if delete_json_data.get("detail", 0) == "未找到。":
+                    pool_log.info('simulation deleted', url=simulation_progress_url)
+                else:
+                    pool_log.warning('simulation delete failed', url=simulation_progress_url,
+                                     response=delete_json_data)
+        except Exception as e:
+            pool_log.warning('simulation delete failed', url=simulation_progress_url, error=str(e))
+    else:
+        pool_log.info('simulation completed', url=simulation_progress_url, children=len(children))
+    return children
+
+
+async def resume_multi(session_manager, pool, name, tags, semaphore, poller, journal, metrics=NULL_METRICS,
+                       cache=None, harvest=None):
+    """
+    恢复上次运行中已提交、未收尾的 pool：继续轮询原来的进度 URL 并处理子模拟，不重新提交
+    """
+    region = pool.settings.get('region')
+    pool_log = log.bind(tag=name, region=region, pool_id=pool.id)
+    async with semaphore:  # 平台上这个模拟仍占着一个槽位
+        pool_log.info('resuming simulation from journal', url=pool.location)
+        try:
+            json_data = await poller.wait(pool.location)
+        except Exception as e:
+            pool_log.error('progress check failed', url=pool.location, error=str(e))
+            metrics.inc('simulations_failed_total', region=region, reason='poll')
+            return 2
+        finally:
+            metrics.observe('polls_per_simulation', poller.take_polls(pool.location), region=region)
+        children = await check_simulation_status(session_manager, json_data, pool.location, pool_log)
+
+    s = pool.settings
+    settings = simulation_settings(s['region'], s['universe'], s['decay'], s['delay'], s['neutralization'])
+    await harvest_children(harvest, resolve_children(
+        session_manager, children, name, tags, on_recorded=lambda: journal.finish(pool.id),
+        metrics=metrics, region=region, pool_log=pool_log, settings=settings, cache=cache), pool_log)
+    return 0
+
+
+async def harvest_children(harvest, resolving, pool_log=log):
+    """
+    执行子模拟收尾（resolving 为 resolve_children 协程）。harvest 为 None 时就地 await；
+    否则放到后台任务里并把任务留在 harvest 集合中（事件循环只弱引用任务），结束时移出，
+    worker 不用等打标签和落盘就能去提交下一个 pool；调用方在关闭 records_writer 之前等 harvest 里的任务跑完
+    """
+    if harvest is None:
+        await resolving
+        return
+
+    def done(task):
+        harvest.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            pool_log.error('child resolution failed', error=str(task.exception()))
+
+    task = asyncio.ensure_future(resolving)
+    harvest.add(task)
+    task.add_done_callback(done)
+
+
+async def resolve_children(session_manager, children, name, tags, concurrency=CHILD_FETCH_CONCURRENCY,
+                           on_recorded=None, metrics=NULL_METRICS, region=None, pool_log=log,
+                           settings=None, cache=None):
+    """
+    并发获取 multi simulation 的各个子模拟，给对应 alpha 打上名字/标签，
+    并把表达式交给 records_writer 追加到 records/{name}_simulated_alpha_expression.txt；
+    on_recorded 在表达式落盘后调用。传入 cache 时把 alpha id 与 IS 指标按 (表达式, settings) 存入结果缓存
+    """
+    child_semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(child):
+        async with child_semaphore:
             try:
                 async with session_manager.session.get(brain_api_url + "/simulations/" + child) as child_progress:
                     json_data = await child_progress.json()
-                    alpha_id = json_data["alpha"]
-                    alpha_express = json_data["regular"]
+                alpha_id = json_data["alpha"]
+                alpha_express = json_data["regular"]
 
-                    await async_set_alpha_properties(session_manager.session,
-                                                     alpha_id,
-                                                     name="%s" % name,
-                                                     description="""Idea: 11111111111111111111111111111111.
+                alpha = await async_set_alpha_properties(session_manager.session,
+                                                         alpha_id,
+                                                         name="%s" % name,
+                                                         description="""Idea: 11111111111111111111111111111111.
 Rationale for data used: 22222222222222222222222222222222222222.
 Rationale for operators used: 33333333333333333333333333333333333333.""",
-                                                     color=None,
-                                                     tags=tags)
-
-                    # 将alpha保存到文件
-                    async with aiofiles.open(f'records/{name}_simulated_alpha_expression.txt', mode='a') as f:
-                        await f.write(alpha_express + '\n')
+                                                         color=None,
+                                                         tags=tags)
+                if cache is not None and settings is not None:
+                    cache.put(alpha_express, settings, alpha_id, is_metrics(alpha), name)
+                pool_log.debug('alpha recorded', alpha_id=alpha_id, alpha=alpha_express[:120])
+                return alpha_express
 
             except KeyError:
-                print(datetime.now(),"Failed to retrieve alpha ID for: {}".format(brain_api_url + "/simulations/" + child))
+                pool_log.error('child simulation has no alpha', url=brain_api_url + "/simulations/" + child)
             except Exception as e:
-                print(datetime.now(),"An error occurred while setting alpha properties:" + str(e))
+                pool_log.error('child resolution failed', url=brain_api_url + "/simulations/" + child, error=str(e))
 
-        return 0
+    alpha_expresses = [exp for exp in await asyncio.gather(*(resolve(child) for child in children)) if exp]
+    metrics.inc('children_harvested_total', len(alpha_expresses), region=region)
+    if alpha_expresses:
+        # 将alpha保存到文件（缓冲写入，落盘后才在模拟日志里标记完成）
+        await records_writer(name).append(alpha_expresses, on_durable=on_recorded)
+    elif on_recorded is not None:
+        on_recorded()
 
 def prune(next_alpha_recs, prefix, keep_num):
     output = []
@@ -1001,47 +1040,142 @@ def prune(next_alpha_recs, prefix, keep_num):
             output.append([exp, decay])
     return output
 
-async def simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_list, name, neut, stone_bag, n=10):
-    semaphore = asyncio.Semaphore(n)
-    tasks = []
+async def simulate_multiple_tasks(alpha_list, region_list, decay_list, delay_list, name, neut, stone_bag, n=10,
+                                  skip_cached=True, validate=True, validator=None, credentials=None, on_done=None):
+    # n 为每个账号的初始并发数，之后按平台是否限流各自自适应调整（AIMD）；
+    # credentials 为凭证文件列表（默认 config.CREDENTIAL_FILES），pool 派给空闲槽位最多的账号，结果都记在同一个 tag 下；
+    # on_done(表达式列表) 在表达式不用再提交时调用：pool 结果落盘、被拒或重试耗尽、提交前被跳过、或交给模拟日志续跑，
+    # 没跑完的不调用（DIG1_fast 用它推进枚举游标）
     tags = [name]
 
-    session = await async_login()
-    session_start_time = time.time()
-    session_expiry_time = 3 * 60 * 60  # 3小时
-    session_manager = SessionManager(session, session_start_time, session_expiry_time)
+    def settled(alphas):
+        if on_done is not None:
+            on_done(alphas)
+        return True
+    
+    # 上次运行中已提交、未收尾的 pool 直接接着轮询，其中的表达式不再重复提交
+    journal = SimJournal()
+    resumed = journal.recover(name)
+    if resumed:
+        log.info('resuming pools from journal', tag=name, pools=len(resumed))
+        resumed_alphas = {alpha for pool in resumed for alpha in pool.expressions}
+
+        def fresh(alpha):
+            if alpha in resumed_alphas:
+                settled([alpha])  # 结果交给模拟日志续跑
+                return False
+            return True
+
+        if isinstance(alpha_list, list):
+            alpha_list = [alpha for alpha in alpha_list if fresh(alpha)]
+        else:
+            alpha_list = (alpha for alpha in alpha_list if fresh(alpha))
 
-    if region_list[0][0] == "GLB":
-        alpha_list = [alpha_list[i:i + 5] for i in range(0, len(alpha_list), 5)]
-    else:
-        alpha_list = [alpha_list[i:i + 10] for i in range(0, len(alpha_list), 10)]
-
-    # 将任务划分成 n 份
-    chunk_size = (len(alpha_list) + n - 1) // n  # 向上取整
-    task_chunks = [alpha_list[i:i + chunk_size] for i in range(0, len(alpha_list), chunk_size)]
-    region_chunks = [region_list[i:i + chunk_size] for i in range(0, len(region_list), chunk_size)]
-    decay_chunks = [decay_list[i:i + chunk_size] for i in range(0, len(decay_list), chunk_size)]
-    delay_chunks = [delay_list[i:i + chunk_size] for i in range(0, len(delay_list), chunk_size)]
-
-    for i, (alpha_chunks, region_chunk, decay_chunk, delay_chunk) in enumerate(
-            zip(task_chunks, region_chunks, decay_chunks, delay_chunks)):
-        # 获取当前 chunk 对应的 session_manager
-        current_session_manager = session_manager
-        for alpha_chunk, region, decay, delay in zip(alpha_chunks, region_chunk, decay_chunk, delay_chunk):
-            # 将任务与当前的 session_manager 关联
-            task = simulate_multi(current_session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
-                                  tags, semaphore)
-            tasks.append(task)
+    try:
+        total_tasks = len(resumed) + -(-len(alpha_list) // pool_size(region_list[0]))  # 向上取整
+        log.info('simulation run started', tag=name, alphas=len(alpha_list), concurrency=n)
+    except (TypeError, IndexError):
+        total_tasks = None  # 传入的是生成器，总数未知
+        log.info('simulation run started', tag=name, concurrency=n)
+
+    # 每个账号一套会话（到期前后台换新）、并发窗口和进度轮询
+    accounts = await AccountPool.open(credentials or CREDENTIAL_FILES, n, SIM_MAX_CONCURRENCY)
+
+    # 指标定期导出到 records/{name}_metrics.prom / .json（多账号时为各账号之和）
+    metrics = SimMetrics(name)
+    metrics.gauge('concurrency_window', lambda: accounts.window)
+    metrics.gauge('in_flight', lambda: accounts.in_flight)
+    metrics.gauge('idle_slot_seconds', accounts.idle_slot_seconds)
+    metrics.gauge('polls_total', lambda: accounts.n_polls)
+    metrics.gauge('accounts', lambda: len(accounts.accounts))
+    metrics.start()
+
+    # 本机所有 tag 共用的结果缓存：同一表达式在同样 settings 下已经模拟过的不再提交
+    cache = SimResultCache() if skip_cached else None
+
+    def cached(alpha, region, decay, delay):
+        hit = cache.get(alpha, simulation_settings(region[0], region[1], decay, delay, neut))
+        if hit is not None:
+            log.debug('skipping cached simulation', tag=name, alpha=alpha, alpha_id=hit.alpha_id, cached_tag=hit.tag)
+            metrics.inc('cache_hits_total', region=region[0])
+        return hit is not None
+
+    # 提交前静态检查（算子表走本地缓存）：没通过的不进 pool，
+    # 运行结束时连同原因写到 records/{name}_invalid_alpha_expression.txt。
+    # 需要检查字段是否存在时由调用方传入带 fields 的 validator
+    if validator is None and validate:
+        validator = ExpressionValidator(operator_catalog)
+    invalid = []
+
+    def skip(alpha, region, decay, delay):
+        if validator is not None:
+            problems = validator.check(alpha)
+            if problems:
+                log.warning('invalid expression dropped', tag=name, alpha=alpha,
+                            problems=['%s: %s' % p for p in problems])
+                metrics.inc('invalid_expressions_total', kind=problems[0].kind)
+                invalid.append((alpha, problems))
+                return settled([alpha])
+        if cache is not None and cached(alpha, region, decay, delay):
+            return settled([alpha])
+        return False
+
+    # 表达式按 pool 惰性切分（alpha_list 等也可以是生成器），经有界队列交给固定数量的 worker；
+    # worker 数等于各账号并发窗口上限之和，实际同时在途的模拟数由各账号的窗口控制
+    pools = itertools.chain(resumed, iter_pools(alpha_list, region_list, decay_list, delay_list, skip=skip))
+    n_workers = int(accounts.max_window)
+
+    completed_tasks = 0
+    harvest = set()  # 模拟结束后还在后台打标签、落盘的 pool，worker 不等它们
+
+    async def worker(job):
+        nonlocal completed_tasks
+        slot = None
+        try:
+            if isinstance(job, JournalPool):
+                slot = accounts.slot(job.account)  # 进度 URL 只能用提交它的账号轮询
+                await resume_multi(slot.session_manager, job, name, tags, slot, slot.poller, journal, metrics, cache,
+                                   harvest=harvest)
+            else:
+                alpha_chunk, region, decay, delay = job
+                slot = await accounts.acquire()
+                await simulate_multi(slot.session_manager, alpha_chunk, region, name, neut, decay, delay, stone_bag,
+                                     tags, slot, slot.poller, journal, metrics, cache, account=slot.name,
+                                     on_done=on_done, harvest=harvest)
+        except Exception as e:
+            log.error('pool failed', tag=name, task=completed_tasks + 1, error=str(e))
+        finally:
+            if slot is not None:
+                await slot.cancel()
+        completed_tasks += 1
+        if completed_tasks % 10 == 0 or completed_tasks == total_tasks:
+            log.info('progress', tag=name, completed=completed_tasks, total=total_tasks,
+                     window=round(accounts.window, 1))
 
     try:
-        await asyncio.wait_for(asyncio.gather(*tasks), timeout=6*60*60)  # 改为6小时与注释一致
+        log.info('workers started', tag=name, pools=total_tasks, workers=n_workers)
+        await asyncio.wait_for(run_workers(pools, worker, n_workers, metrics=metrics), timeout=6*60*60)  # 改为6小时与注释一致
+        log.info('simulation run finished', tag=name, completed=completed_tasks, total=total_tasks)
     except asyncio.TimeoutError:
-        print(datetime.now(),"Task group timed out after 6 hours")
+        log.error('simulation run timed out after 6 hours', tag=name)
+    except Exception as e:
+        log.error('simulation run failed', tag=name, error=str(e))
     finally:  # 添加finally块确保资源释放
-        try:
-            await session_manager.session.close()
-        except Exception as e:
-            print(datetime.now(),f"Error closing session: {str(e)}")
+        if harvest:
+            log.info('waiting for child resolution', tag=name, pools=len(harvest))
+            await asyncio.gather(*list(harvest), return_exceptions=True)
+        await records_writer(name).close()
+        await metrics.close()
+        if cache is not None:
+            cache.close()
+        if invalid:
+            report_path = os.path.join(RECORDS_PATH, f'{name}_invalid_alpha_expression.txt')
+            write_report(report_path, invalid)
+            log.warning('invalid expressions reported', tag=name, count=len(invalid), path=report_path)
+        journal.close()
+        await accounts.close()
+        for account, stats in accounts.stats().items():
+            log.info('concurrency window stats', tag=name, account=account, **stats)
 
 
 def read_completed_alphas(filepath):
@@ -1066,19 +1200,52 @@ def save_completed_alphas(path, alpha_list):
             f.write(alpha.strip() + '\n')
 # ======== SAFE ADD-ON: machinelib 模板化扩展（命名空间封装，避免冲突） ========
 
-import itertools, re, unicodedata
-from typing import List, Dict, Tuple, Optional
+import functools, itertools, re, unicodedata
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator
+from expr_dag import Bound, call, binop, var, template, wrap_core
+from expr_space import Space, ProductSpace
+
+
+def _streaming(space_method):
+    """
+    space_* -> iter_* 类方法：按空间顺序逐条产出（各轴已去重，同一模板内不会重复）；
+    多接受一个 render 参数，render=False 时产出 Bound 节点（共享子树，按需 str() 渲染）
+    """
+    make = space_method.__func__
+
+    @functools.wraps(make)
+    def iter_(cls, *args, render=True, **kwargs):
+        nodes = iter(make(cls, *args, **kwargs))
+        return map(str, nodes) if render else nodes
+    iter_.__name__ = make.__name__.replace('space_', 'iter_', 1)
+    iter_.__qualname__ = make.__qualname__.replace('.space_', '.iter_', 1)
+    return classmethod(iter_)
+
+
+def _materialized(space_method):
+    """space_* -> build_*：参数相同，返回按规范形式精确去重的字符串列表（原有接口）；render=False 时返回 Bound 列表"""
+    make = space_method.__func__
+
+    @functools.wraps(make)
+    def build(cls, *args, render=True, **kwargs) -> List[str]:
+        nodes = make(cls, *args, **kwargs)
+        return cls._uniq(map(str, nodes)) if render else list(dict.fromkeys(nodes))
+    build.__name__ = make.__name__.replace('space_', 'build_', 1)
+    build.__qualname__ = make.__qualname__.replace('.space_', '.build_', 1)
+    return classmethod(build)
 
 class MachinelibTemplates:
     """模板家族生成器：不依赖外部数据，仅做表达式拼装。"""
 
     # ------------------ 基础工具（私有，不改你原逻辑） ------------------
     @staticmethod
-    def _uniq(seq: List[str]) -> List[str]:
+    def _uniq(seq: Iterable[str]) -> List[str]:
+        # 按 FASTEXPR 规范形式去重：只差括号、空白、项的顺序的视为同一条
         seen, out = set(), []
         for x in seq:
-            if x not in seen:
-                seen.add(x); out.append(x)
+            k = canonical_key(x)
+            if k not in seen:
+                seen.add(k); out.append(x)
         return out
 
     @staticmethod
@@ -1095,24 +1262,22 @@ class MachinelibTemplates:
     # ------------------ 统一包装（不与外部重名） ------------------
     @staticmethod
     def _wrap_core(expr: str, backfill_window: int = 120, winsor_std: float = 4.0, do_reverse: bool = True) -> str:
-        core = f"ts_backfill({expr}, {backfill_window})" if backfill_window else expr
-        core = f"winsorize({core}, std={winsor_std})"    if winsor_std else core
-        return f"-reverse({core})" if do_reverse else core
+        return str(template(wrap_core(var("x"), backfill_window, winsor_std, do_reverse), "x").bind(expr))
 
     @staticmethod
-    def _apply_trade_masks(exprs: List[str], masks: Optional[List[str]] = None, delay: int = -1) -> List[str]:
+    def _apply_trade_masks(exprs: Iterable, masks: Optional[List[str]] = None, delay: int = -1) -> Iterable:
+        # exprs 是下标空间时结果仍是下标空间（每条表达式 × 每个 mask）
         if not masks: return exprs
-        out = []
-        for e in exprs:
-            for m in masks:
-                out.append(f"trade_when({m}, {e}, {delay})")
-        return out
+        gated = template(call("trade_when", var("mask"), var("expr"), delay), "mask", "expr")
+        if isinstance(exprs, Space):
+            return ProductSpace([exprs, masks], lambda e, m: gated.bind(m, e))
+        return (gated.bind(m, e) for e in exprs for m in masks)
 
     @staticmethod
-    def _multi_group_neutralize(expr: str, groups: List[str]) -> str:
+    def _multi_group_neutralize(expr, groups: List[str]):
         out = expr
         for g in groups:
-            out = f"group_neutralize({out}, densify({g}))"
+            out = call("group_neutralize", out, call("densify", g))
         return out
 
     # ------------------ 预设域/算子 ------------------
@@ -1141,155 +1306,191 @@ class MachinelibTemplates:
         ]
 
     # ------------------ 构建器：各模型族 ------------------
+    # 每个构建器先用 expr_dag 搭一次模板（外壳、分组等共享子树只有一份），再把取值范围组成下标空间（expr_space）：
+    # space_* 返回空间本身（len 即候选数，可按下标取、均匀抽样）；iter_* 按顺序逐条产出；
+    # 同名 build_* 参数相同，返回精确去重后的列表；iter_* / build_* 都可以传 render=False 拿节点
     @classmethod
-    def build_option_iv_spread(cls,
+    def space_option_iv_spread(cls,
         call_fields: List[str], put_fields: List[str],
         groups: Optional[List[str]] = None, windows: Optional[List[int]] = None,
         use_pcr_gate: bool = True, wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         groups  = groups or ["sector","industry"]
         windows = windows or cls.SHORT_WINDOWS
-        out = []
-        for c, p, L, g in itertools.product(call_fields, put_fields, windows, groups):
-            core = f"ts_delta({c} - {p}, {L})"
-            expr = f"group_neutralize({core}, densify({g}))"
-            out.append(cls._wrap_core(expr, *wrap))
+        c, p, L, g = var("c"), var("p"), var("L"), var("g")
+        t = template(wrap_core(call("group_neutralize", call("ts_delta", c - p, L), call("densify", g)), *wrap),
+                     "c", "p", "L", "g")
+        out = ProductSpace([call_fields, put_fields, windows, groups], t.bind)
         if use_pcr_gate:
             out = cls._apply_trade_masks(out, masks=["pcr_oi_d > 1", "pcr_oi > 1"], delay=-1)
-        return cls._uniq(out)
+        return out
+
+    iter_option_iv_spread = _streaming(space_option_iv_spread)
+    build_option_iv_spread = _materialized(space_option_iv_spread)
 
     @classmethod
-    def build_momentum_diverse(cls,
+    def space_momentum_diverse(cls,
         fields: List[str], groups: Optional[List[str]] = None,
         short_windows: Optional[List[int]] = None, long_windows: Optional[List[int]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         groups = groups or ["sector","industry"]
         short_windows = short_windows or [5, 22]
         long_windows  = long_windows or [66, 120]
-        out = []
-        for X, w1, w2, g in itertools.product(fields, short_windows, long_windows, groups):
-            if w2 <= w1: continue
-            a = f"group_zscore(ts_zscore({X}, {w1}), densify({g}))"
-            b = f"group_zscore(ts_zscore({X}, {w2}), densify({g}))"
-            out.append(cls._wrap_core(f"({a}) - ({b})", *wrap))
-        return cls._uniq(out)
+        X, w1, w2, g = var("X"), var("w1"), var("w2"), var("g")
+        a = call("group_zscore", call("ts_zscore", X, w1), call("densify", g))
+        b = call("group_zscore", call("ts_zscore", X, w2), call("densify", g))
+        t = template(wrap_core(a - b, *wrap), "X", "w1", "w2", "g")
+        # 只要 w1 < w2 的窗口对：合成一个轴，空间大小就是真实的候选数
+        windows = [(w1, w2) for w1, w2 in itertools.product(short_windows, long_windows) if w2 > w1]
+        return ProductSpace([fields, windows, groups], lambda X, w, g: t.bind(X, w[0], w[1], g))
+
+    iter_momentum_diverse = _streaming(space_momentum_diverse)
+    build_momentum_diverse = _materialized(space_momentum_diverse)
 
     @classmethod
-    def build_twin_ops(cls,
+    def space_twin_ops(cls,
         primary_fields: List[str], twin_fields: List[str],
         windows: Optional[List[int]] = None, twin_ops: Optional[List[str]] = None,
         groups: Optional[List[str]] = None, wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         windows  = windows or cls.LONG_WINDOWS
         twin_ops = twin_ops or ["ts_corr","ts_covariance"]
         groups   = groups or ["sector","industry"]
-        out = []
-        for X, Y, L, op, g in itertools.product(primary_fields, twin_fields, windows, twin_ops, groups):
-            if X == Y: continue
-            core = f"{op}({X}, {Y}, {L})"
-            out.append(cls._wrap_core(f"group_neutralize({core}, densify({g}))", *wrap))
-        return cls._uniq(out)
+        t = template(wrap_core(call("group_neutralize", call(var("op"), var("X"), var("Y"), var("L")),
+                                    call("densify", var("g"))), *wrap),
+                     "X", "Y", "L", "op", "g")
+        pairs = [(X, Y) for X, Y in itertools.product(primary_fields, twin_fields) if X != Y]
+        return ProductSpace([pairs, windows, twin_ops, groups], lambda XY, L, op, g: t.bind(XY[0], XY[1], L, op, g))
+
+    iter_twin_ops = _streaming(space_twin_ops)
+    build_twin_ops = _materialized(space_twin_ops)
 
     @classmethod
-    def build_vol_divergence(cls,
+    def space_vol_divergence(cls,
         fields: List[str], windows: Optional[List[int]] = None, groups: Optional[List[str]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         windows = windows or cls.SHORT_WINDOWS
         groups  = groups or ["sector"]
-        out = []
-        for X, L, g in itertools.product(fields, windows, groups):
-            a = f"power(ts_mean(abs({X}), {L}), 2)"
-            b = f"power(ts_mean({X}, {L}), 2)"
-            out.append(cls._wrap_core(f"group_neutralize(({a}) - ({b}), densify({g}))", *wrap))
-        return cls._uniq(out)
+        X, L = var("X"), var("L")
+        a = call("power", call("ts_mean", call("abs", X), L), 2)
+        b = call("power", call("ts_mean", X, L), 2)
+        t = template(wrap_core(call("group_neutralize", a - b, call("densify", var("g"))), *wrap), "X", "L", "g")
+        return ProductSpace([fields, windows, groups], t.bind)
+
+    iter_vol_divergence = _streaming(space_vol_divergence)
+    build_vol_divergence = _materialized(space_vol_divergence)
 
     @classmethod
-    def build_risk_group_compare(cls,
+    def space_risk_group_compare(cls,
         risk_fields: List[str], groups: Optional[List[str]] = None, compare_ops: Optional[List[str]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         groups = groups or cls.get_builtin_groups()
         compare_ops = compare_ops or cls.GROUP_COMPARE_OPS
-        out = []
-        for R, g, op in itertools.product(risk_fields, groups, compare_ops):
-            out.append(cls._wrap_core(f"{op}({R}, densify({g}))", *wrap))
-        return cls._uniq(out)
+        t = template(wrap_core(call(var("op"), var("R"), call("densify", var("g"))), *wrap), "R", "g", "op")
+        return ProductSpace([risk_fields, groups, compare_ops], t.bind)
+
+    iter_risk_group_compare = _streaming(space_risk_group_compare)
+    build_risk_group_compare = _materialized(space_risk_group_compare)
 
     @classmethod
-    def build_vector_neutralized(cls,
+    def space_vector_neutralized(cls,
         fields: List[str], risk_field: str, windows: Optional[List[int]] = None, groups_after: Optional[List[str]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         windows = windows or cls.SHORT_WINDOWS
-        out = []
-        for X, L in itertools.product(fields, windows):
-            base = f"vector_neut(ts_zscore({X}, {L}), ts_backfill({risk_field}, 120))"
-            if groups_after:
-                base = cls._multi_group_neutralize(base, groups_after)
-            out.append(cls._wrap_core(base, *wrap))
-        return cls._uniq(out)
+        base = call("vector_neut", call("ts_zscore", var("X"), var("L")), call("ts_backfill", risk_field, 120))
+        if groups_after:
+            base = cls._multi_group_neutralize(base, groups_after)
+        t = template(wrap_core(base, *wrap), "X", "L")
+        return ProductSpace([fields, windows], t.bind)
+
+    iter_vector_neutralized = _streaming(space_vector_neutralized)
+    build_vector_neutralized = _materialized(space_vector_neutralized)
 
     @classmethod
-    def build_mean_deviation(cls,
+    def space_mean_deviation(cls,
         fields: List[str], windows: Optional[List[int]] = None, groups: Optional[List[str]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         windows = windows or cls.SHORT_WINDOWS
         groups  = groups or ["sector"]
-        out = []
-        for X, L, g in itertools.product(fields, windows, groups):
-            mu = f"ts_mean({X}, {L})"
-            expr = f"({X} - {mu}) / max(abs({mu}), 1e-6)"
-            out.append(cls._wrap_core(f"group_neutralize({expr}, densify({g}))", *wrap))
-        return cls._uniq(out)
+        X = var("X")
+        mu = call("ts_mean", X, var("L"))
+        expr = (X - mu) / call("max", call("abs", mu), 1e-6)
+        t = template(wrap_core(call("group_neutralize", expr, call("densify", var("g"))), *wrap), "X", "L", "g")
+        return ProductSpace([fields, windows, groups], t.bind)
+
+    iter_mean_deviation = _streaming(space_mean_deviation)
+    build_mean_deviation = _materialized(space_mean_deviation)
 
     @classmethod
-    def build_news_return_corr(cls,
+    def space_news_return_corr(cls,
         news_fields: List[str], windows: Optional[List[int]] = None, groups: Optional[List[str]] = None,
         wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         windows = windows or [120, 252]
         groups  = groups or ["sector","country"]
-        out = []
-        for N, L, g in itertools.product(news_fields, windows, groups):
-            core = f"ts_corr({N}, returns, {L})"
-            out.append(cls._wrap_core(f"group_neutralize({core}, densify({g}))", *wrap))
-        return cls._uniq(out)
+        core = call("ts_corr", var("N"), "returns", var("L"))
+        t = template(wrap_core(call("group_neutralize", core, call("densify", var("g"))), *wrap), "N", "L", "g")
+        return ProductSpace([news_fields, windows, groups], t.bind)
+
+    iter_news_return_corr = _streaming(space_news_return_corr)
+    build_news_return_corr = _materialized(space_news_return_corr)
 
     @classmethod
-    def build_fcf_ratio(cls,
+    def space_fcf_ratio(cls,
         fcf_field: str = "fcf", mkt_cap_field: str = "market_cap", smooth_window: int = 60,
         groups: Optional[List[str]] = None, wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         groups = groups or ["sector","industry"]
-        core = f"ts_mean(winsorize(ts_backfill({fcf_field}/{mkt_cap_field}, 120), std=4), {smooth_window})"
-        out = [cls._wrap_core(f"group_neutralize(-{core}, densify({g}))", *wrap) for g in groups]
-        return cls._uniq(out)
+        ratio = call("ts_backfill", binop("/", fcf_field, mkt_cap_field), 120)
+        core = call("ts_mean", call("winsorize", ratio, std=4), smooth_window)
+        t = template(wrap_core(call("group_neutralize", -core, call("densify", var("g"))), *wrap), "g")
+        return ProductSpace([groups], t.bind)
+
+    iter_fcf_ratio = _streaming(space_fcf_ratio)
+    build_fcf_ratio = _materialized(space_fcf_ratio)
 
     @classmethod
-    def build_analyst_regression(cls,
+    def space_analyst_regression(cls,
         analyst_fields: List[str], pv_fields: List[str], w1: int = 22, w2: int = 120,
         groups: Optional[List[str]] = None, wrap=(120,4.0,True)
-    ) -> List[str]:
+    ) -> Space:
         groups = groups or ["country","industry"]
-        out = []
-        for A, P, G in itertools.product(analyst_fields, pv_fields, groups):
-            x = f"ts_zscore({A}, {w1})"
-            y = f"ts_zscore({P}, {w1})"
-            tg = f"ts_regression({x}, {y}, {w2})"
-            expr = f"-ts_mean(group_neutralize({tg}, densify({G})), {w2})"
-            out.append(cls._wrap_core(expr, *wrap))
-        return cls._uniq(out)
+        tg = call("ts_regression", call("ts_zscore", var("A"), w1), call("ts_zscore", var("P"), w1), w2)
+        expr = -call("ts_mean", call("group_neutralize", tg, call("densify", var("G"))), w2)
+        t = template(wrap_core(expr, *wrap), "A", "P", "G")
+        return ProductSpace([analyst_fields, pv_fields, groups], t.bind)
+
+    iter_analyst_regression = _streaming(space_analyst_regression)
+    build_analyst_regression = _materialized(space_analyst_regression)
 
     @classmethod
-    def build_explore_simple(cls, fields: List[str], wrap=(120,4.0,True)) -> List[str]:
-        return [cls._wrap_core("zscore(ts_delta(rank(ts_zscore(%s, 60)), 5))" % X, *wrap) for X in fields]
+    def space_explore_simple(cls, fields: List[str], wrap=(120,4.0,True)) -> Space:
+        core = call("zscore", call("ts_delta", call("rank", call("ts_zscore", var("X"), 60)), 5))
+        t = template(wrap_core(core, *wrap), "X")
+        return ProductSpace([fields], t.bind)
+
+    iter_explore_simple = _streaming(space_explore_simple)
+    build_explore_simple = _materialized(space_explore_simple)
 
     # ------------------ 统一入口：人为选择 ------------------
     @classmethod
-    def generate_by_model_type(cls,
+    def generate_by_model_type(cls, model_type: str, **kwargs) -> List[str]:
+        """iter_by_model_type 的列表版本（精确去重），参数相同"""
+        return cls._uniq(cls.iter_by_model_type(model_type, render=True, **kwargs))
+
+    @classmethod
+    def iter_by_model_type(cls, model_type: str, *, render: bool = True, **kwargs) -> Iterator[str]:
+        """按 model_type 返回表达式流（惰性），参数同 space_by_model_type；render=False 时产出 Bound 节点"""
+        alphas = iter(cls.space_by_model_type(model_type, **kwargs))
+        return map(str, alphas) if render else alphas
+
+    @classmethod
+    def space_by_model_type(cls,
         model_type: str,
         *,
         core_fields: Optional[List[str]] = None,
@@ -1303,8 +1504,9 @@ class MachinelibTemplates:
         masks: Optional[List[str]] = None,
         extra_groups: Optional[List[str]] = None,
         wrap: Tuple[int, float, bool] = (120, 4.0, True)
-    ) -> List[str]:
+    ) -> Space:
         """
+        按 model_type 返回候选的下标空间（model_type 不认识时抛 ValueError）。
         可选 model_type：
           - option1            : 期权IV差 + PCR门禁
           - momentum_diverse   : 动量分歧（短vs长）
@@ -1323,39 +1525,39 @@ class MachinelibTemplates:
         if key in ("option1","option","options"):
             call_fields = call_fields or ["iv_call_d"]
             put_fields  = put_fields  or ["iv_put_d"]
-            alphas = cls.build_option_iv_spread(call_fields, put_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_option_iv_spread(call_fields, put_fields, groups=extra_groups, wrap=wrap)
         elif key in ("momentum_diverse","momentum","mom_div"):
             core_fields = core_fields or ["returns","close"]
-            alphas = cls.build_momentum_diverse(core_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_momentum_diverse(core_fields, groups=extra_groups, wrap=wrap)
         elif key in ("twin","pair","corr"):
             core_fields = core_fields or ["returns"]
             twin_fields = twin_fields or ["volume","cap"]
-            alphas = cls.build_twin_ops(core_fields, twin_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_twin_ops(core_fields, twin_fields, groups=extra_groups, wrap=wrap)
         elif key in ("vol_div","volatility_divergence"):
             core_fields = core_fields or ["returns"]
-            alphas = cls.build_vol_divergence(core_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_vol_divergence(core_fields, groups=extra_groups, wrap=wrap)
         elif key in ("risk_compare","risk_group"):
             core_fields = core_fields or ["beta_60","vol_20"]
-            alphas = cls.build_risk_group_compare(core_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_risk_group_compare(core_fields, groups=extra_groups, wrap=wrap)
         elif key in ("vector_neut","risk_neutral"):
             core_fields = core_fields or ["returns"]
             risk_field  = risk_field or "risk70"
-            alphas = cls.build_vector_neutralized(core_fields, risk_field, groups_after=extra_groups, wrap=wrap)
+            alphas = cls.space_vector_neutralized(core_fields, risk_field, groups_after=extra_groups, wrap=wrap)
         elif key in ("mean_dev","mean_deviation"):
             core_fields = core_fields or ["close/ts_mean(close,20) - 1"]
-            alphas = cls.build_mean_deviation(core_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_mean_deviation(core_fields, groups=extra_groups, wrap=wrap)
         elif key in ("news_corr","news_volume"):
             news_fields = news_fields or ["nws77","news18"]
-            alphas = cls.build_news_return_corr(news_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_news_return_corr(news_fields, groups=extra_groups, wrap=wrap)
         elif key in ("fcf","fundamental_fcf"):
-            alphas = cls.build_fcf_ratio(wrap=wrap)
+            alphas = cls.space_fcf_ratio(wrap=wrap)
         elif key in ("analyst_reg","analyst_regression"):
             analyst_fields = analyst_fields or ["anl69_best_net_income"]
             pv_fields      = pv_fields or ["close*volume"]
-            alphas = cls.build_analyst_regression(analyst_fields, pv_fields, groups=extra_groups, wrap=wrap)
+            alphas = cls.space_analyst_regression(analyst_fields, pv_fields, groups=extra_groups, wrap=wrap)
         elif key in ("explore","smoke"):
             core_fields = core_fields or ["returns"]
-            alphas = cls.build_explore_simple(core_fields, wrap=wrap)
+            alphas = cls.space_explore_simple(core_fields, wrap=wrap)
         else:
             raise ValueError(f"未知的 model_type: {model_type}")
 
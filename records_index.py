@@ -0,0 +1,178 @@
+"""
+records/ 目录的全局去重索引（SQLite）
+
+每个阶段只读自己的 records/{tag}_simulated_alpha_expression.txt，不同 tag（DIG1_fast、DIG1_enhenced、
+DIG1model ...）生成的相同表达式会被重复提交。这里把 records/ 下所有记录文件的表达式收进一张表：
+- 每个文件记下已读到的字节偏移，refresh() 只读新追加的完整行（文件变短则从头重读）
+- 表达式按 normalize_expression（FASTEXPR 规范形式）作主键，写法不同但语义相同的视为同一条
+- 注释行（# 开头）和空行跳过
+
+用法:
+    with RecordsIndex() as index:
+        alpha_list = list(index.filter_new(alpha_list))   # 剔除所有 tag 里模拟过的
+    alphas = iter_filter_simulated(expression_stream)    # 流式版本，不物化整个列表
+"""
+import os
+import glob
+import time
+import sqlite3
+
+from config import RECORDS_PATH, CACHE_PATH
+from sim_cache import normalize_expression
+from expr_stream import BoundedSeen
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+INDEX_FILE = os.path.join(CACHE_PATH, 'records_index.sqlite3')
+RECORDS_SUFFIX = '_simulated_alpha_expression.txt'
+INDEX_VERSION = 2  # key 的计算方式变了就加一，旧索引整体重建
+BATCH_SIZE = 500  # 单条 SQL 里 IN (...) 的参数个数，低于 SQLite 的变量上限
+
+
+def _tag_of(path):
+    return os.path.basename(path)[:-len(RECORDS_SUFFIX)]
+
+
+class RecordsIndex:
+
+    def __init__(self, path=INDEX_FILE, records_dir=RECORDS_PATH, refresh=True):
+        self.path = path
+        self.records_dir = records_dir
+        self.conn = sqlite3.connect(path, timeout=30)  # 多个阶段同时跑时共用，写锁等一会儿
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < INDEX_VERSION:
+            self.conn.executescript(f'''
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS expressions;
+                PRAGMA user_version = {INDEX_VERSION};''')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                ingested_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS expressions (
+                key TEXT PRIMARY KEY,
+                expression TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                first_seen REAL NOT NULL
+            );''')
+        self.conn.commit()
+        if refresh:
+            self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self):
+        """读入所有记录文件新追加的行，返回新增的表达式数"""
+        added = 0
+        for file_path in sorted(glob.glob(os.path.join(self.records_dir, '*' + RECORDS_SUFFIX))):
+            try:
+                added += self._ingest(file_path)
+            except OSError as e:
+                log.warning('records file ingest failed', path=file_path, error=str(e))
+        if added:
+            log.info('records index refreshed', added=added, total=len(self))
+        return added
+
+    def _ingest(self, file_path):
+        row = self.conn.execute('SELECT offset FROM files WHERE path = ?', (file_path,)).fetchone()
+        offset = row[0] if row else 0
+        size = os.path.getsize(file_path)
+        if size < offset:
+            offset = 0  # 文件被截断或重建，重新读一遍（已有的表达式主键冲突会被忽略）
+        if size == offset:
+            return 0
+
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b'\n') + 1  # 最后一行可能还没写完，留到下次
+        if end == 0:
+            return 0
+
+        tag = _tag_of(file_path)
+        now = time.time()
+        rows = []
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                rows.append((normalize_expression(line), line, tag, now))
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO expressions (key, expression, tag, first_seen) VALUES (?, ?, ?, ?)', rows)
+            added = self.conn.total_changes - before
+            self.conn.execute('INSERT OR REPLACE INTO files (path, offset, ingested_at) VALUES (?, ?, ?)',
+                              (file_path, offset + end, now))
+        return added
+
+    def __contains__(self, expression):
+        return self.conn.execute('SELECT 1 FROM expressions WHERE key = ?',
+                                 (normalize_expression(expression),)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM expressions').fetchone()[0]
+
+    def tag_of(self, expression):
+        """最早记录该表达式的 tag，没有则 None"""
+        row = self.conn.execute('SELECT tag FROM expressions WHERE key = ?',
+                                (normalize_expression(expression),)).fetchone()
+        return row[0] if row else None
+
+    def filter_new(self, expressions):
+        """
+        按原顺序产出没在任何记录文件里出现过的表达式（惰性，分批查询）；
+        输入里规范形式相同的只保留第一条（只记最近 STREAM_DEDUP_CAPACITY 个，内存有界）。
+        expressions 的元素也可以是 (expression, ...) 元组，按第一个元素判断
+        """
+        emitted = BoundedSeen(key=str)  # 存的已经是规范形式
+        batch = []
+        for item in expressions:
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                yield from self._filter_batch(batch, emitted)
+                batch = []
+        if batch:
+            yield from self._filter_batch(batch, emitted)
+
+    def _filter_batch(self, batch, emitted):
+        keys = [normalize_expression(item[0] if type(item) in (tuple, list) else item) for item in batch]
+        unique = list(set(keys))
+        seen = set()
+        for i in range(0, len(unique), BATCH_SIZE):
+            chunk = unique[i:i + BATCH_SIZE]
+            seen.update(k for (k,) in self.conn.execute(
+                'SELECT key FROM expressions WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk))
+        for item, key in zip(batch, keys):
+            if key not in seen and emitted.add(key):
+                yield item
+
+    def close(self):
+        self.conn.close()
+
+
+def filter_simulated(alpha_list):
+    """
+    生成脚本用：刷新索引后剔除所有 tag 里已经模拟过的表达式（以及列表内规范形式重复的），返回列表
+    """
+    with RecordsIndex() as index:
+        fresh = list(index.filter_new(alpha_list))
+    if len(fresh) < len(alpha_list):
+        log.info('dropped duplicate or already simulated expressions', dropped=len(alpha_list) - len(fresh),
+                 remaining=len(fresh))
+    return fresh
+
+
+def iter_filter_simulated(expressions):
+    """
+    filter_simulated 的生成器版本：表达式逐条流过，索引在生成器耗尽或关闭时才关闭
+    """
+    with RecordsIndex() as index:
+        yield from index.filter_new(expressions)
@@ -0,0 +1,116 @@
+"""
+records/{tag}_simulated_alpha_expression.txt 的缓冲写入
+
+同一进程里每个记录文件只有一个 RecordsWriter：文件只打开一次，追加的表达式先进缓冲区，
+攒够 max_lines 行或每隔 interval 秒写一次，每次写完 fsync 作为检查点。
+append() 在所写内容落盘后才返回；on_durable 回调在落盘后调用（即使 append 的调用方已被取消），
+用来标记模拟日志完成。
+"""
+import os
+import asyncio
+
+import aiofiles
+
+from config import RECORDS_PATH, RECORDS_FLUSH_LINES, RECORDS_FLUSH_INTERVAL
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+_writers = {}
+
+
+def records_path(name):
+    return os.path.join(RECORDS_PATH, f'{name}_simulated_alpha_expression.txt')
+
+
+def records_writer(name):
+    """取 tag 对应的 writer，没有（或已关闭）就新建一个"""
+    path = records_path(name)
+    writer = _writers.get(path)
+    if writer is None or writer.closed:
+        writer = _writers[path] = RecordsWriter(path)
+    return writer
+
+
+class RecordsWriter:
+
+    def __init__(self, path, max_lines=RECORDS_FLUSH_LINES, interval=RECORDS_FLUSH_INTERVAL):
+        self.path = path
+        self.max_lines = max_lines
+        self.interval = interval
+        self.closed = False
+        self._buffer = []
+        self._waiters = []
+        self._callbacks = []
+        self._kick = None
+        self._task = None
+
+    async def append(self, lines, on_durable=None):
+        """追加若干行，写入并 fsync 后返回"""
+        if self.closed:
+            raise RuntimeError(f"records writer already closed: {self.path}")
+        if self._task is None:
+            self._kick = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        self._buffer.extend(line + '\n' for line in lines)
+        if on_durable is not None:
+            self._callbacks.append(on_durable)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if len(self._buffer) >= self.max_lines:
+            self._kick.set()
+        await waiter
+
+    async def _run(self):
+        try:
+            async with aiofiles.open(self.path, mode='a', encoding='utf-8') as f:
+                while True:
+                    try:
+                        await asyncio.wait_for(self._kick.wait(), timeout=self.interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._kick.clear()
+                    await self._flush(f)
+                    if self.closed and not self._buffer:
+                        return
+        except Exception as e:
+            # 文件打不开等错误：让正在等待的 append 抛出，而不是一直挂起
+            self.closed = True
+            for waiter in self._waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            self._waiters = []
+            raise
+
+    async def _flush(self, f):
+        if not self._buffer:
+            return
+        buffer, waiters, callbacks = self._buffer, self._waiters, self._callbacks
+        self._buffer, self._waiters, self._callbacks = [], [], []
+        try:
+            await f.write(''.join(buffer))
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())  # 检查点：确保崩溃后已确认的行不丢
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for callback in callbacks:
+            callback()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def close(self):
+        """把缓冲区写完并关闭文件"""
+        self.closed = True
+        if self._task is not None:
+            self._kick.set()
+            try:
+                await self._task
+            except Exception as e:
+                log.error('records write failed', path=self.path, error=str(e))
+            self._task = None
+        if _writers.get(self.path) is self:
+            del _writers[self.path]
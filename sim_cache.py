@@ -0,0 +1,105 @@
+"""
+模拟结果缓存（SQLite，内容寻址）
+
+按「规范化后的表达式（fastexpr.canonical_key）+ 完整 settings」的 sha256 记录模拟得到的 alpha id 与 IS 指标。
+records/{tag}_simulated_alpha_expression.txt 只能在同一个 tag 内去重，
+这里的缓存放在 .cache/ 下、本机所有 tag 共用：同一表达式在同样设置下模拟过一次，
+换 tag、换阶段再跑时 simulate_multiple_tasks 会直接跳过。
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from collections import namedtuple
+
+from config import CACHE_PATH
+from fastexpr import canonical_key
+
+CACHE_FILE = os.path.join(CACHE_PATH, 'sim_results.sqlite3')
+KEY_VERSION = 2  # key 的计算方式变了就加一，打开旧库时按存下的表达式与 settings 重算
+
+CachedResult = namedtuple('CachedResult', ['alpha_id', 'expression', 'settings', 'metrics', 'tag', 'created_at'])
+
+
+def normalize_expression(expression):
+    """规范形式：只差空白、括号、数字写法、关键字顺序、变量名的表达式得到同一个 key"""
+    return canonical_key(expression)
+
+
+def result_key(expression, settings):
+    payload = normalize_expression(expression) + '\n' + json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_metrics(alpha):
+    """从 /alphas/{id} 的返回里取 IS 的标量指标（不含 checks 等列表）"""
+    stats = (alpha or {}).get('is') or {}
+    return {k: v for k, v in stats.items() if isinstance(v, (int, float, str)) or v is None}
+
+
+class SimResultCache:
+    """
+    用法:
+        cache = SimResultCache()
+        if cache.get(expression, settings) is None:
+            ...  # 提交模拟
+            cache.put(expression, settings, alpha_id, metrics, tag)
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)  # 多个进程共用，写锁等一会儿
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                alpha_id TEXT NOT NULL,
+                expression TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                tag TEXT,
+                created_at REAL NOT NULL
+            )''')
+        self.conn.commit()
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < KEY_VERSION:
+            self._rekey()
+        self.hits = 0
+        self.misses = 0
+
+    def _rekey(self):
+        rows = self.conn.execute('SELECT key, expression, settings FROM results').fetchall()
+        with self.conn:
+            for key, expression, settings in rows:
+                new_key = result_key(expression, json.loads(settings))
+                if new_key != key:
+                    self.conn.execute('UPDATE OR REPLACE results SET key = ? WHERE key = ?', (new_key, key))
+            self.conn.execute(f'PRAGMA user_version = {KEY_VERSION}')
+
+    def get(self, expression, settings):
+        """命中时返回 CachedResult，否则 None"""
+        row = self.conn.execute(
+            'SELECT alpha_id, expression, settings, metrics, tag, created_at FROM results WHERE key = ?',
+            (result_key(expression, settings),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        alpha_id, expr, s, m, tag, created_at = row
+        return CachedResult(alpha_id, expr, json.loads(s), json.loads(m), tag, created_at)
+
+    def __contains__(self, item):
+        expression, settings = item
+        return self.get(expression, settings) is not None
+
+    def put(self, expression, settings, alpha_id, metrics=None, tag=None):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (key, alpha_id, expression, settings, metrics, tag, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (result_key(expression, settings), alpha_id, expression, json.dumps(settings, sort_keys=True),
+                 json.dumps(metrics or {}), tag, time.time()))
+
+    def close(self):
+        self.conn.close()
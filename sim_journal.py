@@ -0,0 +1,99 @@
+"""
+模拟任务日志（SQLite）
+
+每个 pool 提交前记一行（表达式、设置、状态），拿到 Location 后写入进度 URL，
+子模拟全部处理完再标记完成。进程崩溃或超时退出后重新运行同一个 tag 时，
+simulate_multiple_tasks 会继续轮询已提交但未收尾的 pool，而不是重新提交占用回测额度。
+
+状态: pending（已登记未提交）→ submitted（已拿到 Location）→ done / failed
+"""
+import os
+import json
+import time
+import sqlite3
+from collections import namedtuple
+
+from config import RECORDS_PATH
+
+JOURNAL_FILE = os.path.join(RECORDS_PATH, 'sim_journal.sqlite3')
+KEEP_FINISHED = 7 * 24 * 60 * 60  # 已完成的记录保留 7 天
+
+JournalPool = namedtuple('JournalPool', ['id', 'tag', 'expressions', 'settings', 'location', 'account'],
+                         defaults=[None])
+
+
+class SimJournal:
+    """
+    用法:
+        journal = SimJournal()
+        pool_id = journal.add(tag, expressions, settings, account)
+        journal.submitted(pool_id, location)
+        journal.finish(pool_id)
+        for pool in journal.outstanding(tag): ...
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS pools (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tag TEXT NOT NULL,
+                expressions TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                location TEXT,
+                account TEXT,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pools_tag_state ON pools (tag, state)')
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(pools)')}
+        if 'account' not in columns:  # 多账号之前建的日志
+            self.conn.execute('ALTER TABLE pools ADD COLUMN account TEXT')
+        self.conn.commit()
+
+    def add(self, tag, expressions, settings, account=None):
+        """登记一个即将提交的 pool，返回 pool id；account 为提交所用的账号（恢复时要用同一个账号轮询）"""
+        now = time.time()
+        with self.conn:
+            cur = self.conn.execute(
+                'INSERT INTO pools (tag, expressions, settings, account, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (tag, json.dumps(list(expressions), ensure_ascii=False), json.dumps(settings), account, 'pending',
+                 now, now))
+        return cur.lastrowid
+
+    def submitted(self, pool_id, location):
+        with self.conn:
+            self.conn.execute('UPDATE pools SET location = ?, state = ?, updated_at = ? WHERE id = ?',
+                              (location, 'submitted', time.time(), pool_id))
+
+    def finish(self, pool_id, state='done'):
+        with self.conn:
+            self.conn.execute('UPDATE pools SET state = ?, updated_at = ? WHERE id = ?',
+                              (state, time.time(), pool_id))
+
+    def outstanding(self, tag):
+        """已提交但还没收尾的 pool"""
+        rows = self.conn.execute(
+            'SELECT id, tag, expressions, settings, location, account FROM pools '
+            'WHERE tag = ? AND state = ? ORDER BY id', (tag, 'submitted')).fetchall()
+        return [JournalPool(i, t, json.loads(e), json.loads(s), loc, acc) for i, t, e, s, loc, acc in rows]
+
+    def recover(self, tag, keep_finished=KEEP_FINISHED):
+        """
+        进程启动时调用：没来得及提交的 pending 记录作废（表达式会照常重新提交），
+        清理过期的已完成记录，返回需要继续轮询的 pool
+        """
+        with self.conn:
+            self.conn.execute('UPDATE pools SET state = ?, updated_at = ? WHERE tag = ? AND state = ?',
+                              ('failed', time.time(), tag, 'pending'))
+            self.conn.execute('DELETE FROM pools WHERE state IN (?, ?) AND updated_at < ?',
+                              ('done', 'failed', time.time() - keep_finished))
+        return self.outstanding(tag)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,226 @@
+"""
+模拟客户端的运行指标
+
+SimMetrics 记录计数器与直方图（提交延迟、模拟耗时、每个模拟的轮询次数、限流、重试、收割的子模拟数），
+并在导出时采样 gauge（并发窗口、在途数、空闲槽位秒数、队列深度）。
+后台任务每隔 interval 秒把快照原子写入
+records/{tag}_metrics.prom（Prometheus 文本格式，可交给 node_exporter 的 textfile collector）
+和 records/{tag}_metrics.json。
+"""
+import os
+import json
+import time
+import bisect
+import asyncio
+from datetime import datetime
+
+from config import RECORDS_PATH, METRICS_EXPORT_INTERVAL
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+PREFIX = 'brain_sim_'
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+WALL_TIME_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+BUCKETS = {
+    'submit_latency_seconds': LATENCY_BUCKETS,
+    'simulation_wall_seconds': WALL_TIME_BUCKETS,
+    'polls_per_simulation': COUNT_BUCKETS,
+}
+
+HELP = {
+    'submit_latency_seconds': 'POST /simulations 的响应时间',
+    'simulation_wall_seconds': '拿到 Location 到模拟结束的时间',
+    'polls_per_simulation': '每个模拟的进度轮询次数',
+    'simulations_submitted_total': '被平台接受的模拟（pool）数',
+    'limit_exceeded_total': 'SIMULATION_LIMIT_EXCEEDED / 429 次数',
+    'submit_retries_total': '提交重试次数（按原因）',
+    'simulations_failed_total': '失败的模拟（pool）数（按原因）',
+    'children_harvested_total': '拿到 alpha id 并打好标签的子模拟数',
+    'cache_hits_total': '结果缓存里已有、跳过提交的表达式数',
+    'invalid_expressions_total': '提交前静态检查没通过的表达式数（按第一个问题的类型）',
+    'concurrency_window': '当前 AIMD 并发窗口',
+    'in_flight': '占用中的模拟槽位数',
+    'idle_slot_seconds': '窗口允许但空闲的槽位秒数（累计）',
+    'polls_total': '进度轮询总次数',
+    'queue_depth': '等待 worker 取走的 pool 数',
+    'busy_workers': '正在处理 pool 的 worker 数',
+    'accounts': '参与模拟的账号数',
+}
+
+
+class Histogram:
+    """累积分桶直方图（与 Prometheus histogram 语义一致）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for upper, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += n
+            yield upper, total
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in key) + '}'
+
+
+class SimMetrics:
+    """
+    用法:
+        metrics = SimMetrics(tag)
+        metrics.start()                                   # 后台定期导出
+        metrics.inc('limit_exceeded_total', region='USA')
+        metrics.observe('submit_latency_seconds', 0.3, region='USA')
+        metrics.gauge('queue_depth', queue.qsize)         # 导出时才调用
+        ...
+        await metrics.close()                             # 最后再导出一次
+    """
+
+    def __init__(self, tag, directory=RECORDS_PATH, interval=METRICS_EXPORT_INTERVAL):
+        self.tag = tag
+        self.interval = interval
+        self.prom_path = os.path.join(directory, f'{tag}_metrics.prom')
+        self.json_path = os.path.join(directory, f'{tag}_metrics.json')
+        self.started = time.time()
+        self._counters = {}    # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._gauges = {}      # name -> 无参函数
+        self._task = None
+
+    def inc(self, name, value=1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = _label_key(labels)
+        if key not in series:
+            series[key] = Histogram(BUCKETS.get(name, LATENCY_BUCKETS))
+        series[key].observe(value)
+
+    def gauge(self, name, fn):
+        self._gauges[name] = fn
+
+    def _sample_gauges(self):
+        values = {}
+        for name, fn in self._gauges.items():
+            try:
+                values[name] = float(fn())
+            except Exception:
+                continue  # 采样失败（例如对象已关闭）时跳过
+        return values
+
+    def snapshot(self):
+        """当前所有指标的 dict 形式"""
+        histograms = {}
+        for name, series in self._histograms.items():
+            histograms[name] = [{'labels': dict(key), 'count': h.count, 'sum': round(h.sum, 4),
+                                 'buckets': {str(upper): n for upper, n in h.cumulative()}}
+                                for key, h in series.items()]
+        return {
+            'tag': self.tag,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'counters': {name: [{'labels': dict(key), 'value': v} for key, v in series.items()]
+                         for name, series in self._counters.items()},
+            'histograms': histograms,
+            'gauges': self._sample_gauges(),
+        }
+
+    def to_prometheus(self):
+        tag = ('tag', self.tag)
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            for key, value in series.items():
+                lines.append(f'{PREFIX}{name}{_format_labels((tag,) + key)} {value}')
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for key, h in series.items():
+                for upper, n in h.cumulative():
+                    lines.append(f'{PREFIX}{name}_bucket{_format_labels((tag,) + key + (("le", str(upper)),))} {n}')
+                lines.append(f'{PREFIX}{name}_sum{_format_labels((tag,) + key)} {h.sum:.6f}')
+                lines.append(f'{PREFIX}{name}_count{_format_labels((tag,) + key)} {h.count}')
+        for name, value in sorted(self._sample_gauges().items()):
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} gauge')
+            lines.append(f'{PREFIX}{name}{_format_labels((tag,))} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _render(self):
+        return ((self.prom_path, self.to_prometheus()),
+                (self.json_path, json.dumps(self.snapshot(), ensure_ascii=False, indent=1)))
+
+    @staticmethod
+    def _write(files):
+        for path, text in files:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+
+    def export(self):
+        """把 Prometheus 文本与 JSON 快照原子写入 records/"""
+        self._write(self._render())
+
+    def start(self):
+        """启动后台定期导出（需要在事件循环里调用）"""
+        if self._task is None and self.interval:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # 快照在事件循环里生成（指标只在循环里修改），写文件放到线程里
+                await asyncio.to_thread(self._write, self._render())
+            except Exception as e:
+                log.warning('metrics export failed', tag=self.tag, error=str(e))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.export()
+
+
+class _NullMetrics:
+    """不记录任何东西，simulate_multi 等单独调用（没传 metrics）时使用"""
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def gauge(self, name, fn):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
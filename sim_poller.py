@@ -0,0 +1,134 @@
+"""
+模拟进度轮询
+
+原来每个 simulate_single / simulate_multi 协程各自循环 GET Location 并按 Retry-After 睡眠，
+并发 N 个槽位就有 N 个轮询循环。ProgressPoller 把所有在途的进度 URL 放进一个按下次轮询时间
+排序的堆里，由一个后台任务批量发出到期的请求，只唤醒模拟已经结束的协程。
+"""
+import heapq
+import asyncio
+import itertools
+from config import SIM_POLL_RATE
+from throttle import RateBudget
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+
+class ProgressPoller:
+    """
+    用法:
+        poller = ProgressPoller(session_manager)
+        json_data = await poller.wait(simulation_progress_url)  # 模拟结束（没有 Retry-After）时返回
+        ...
+        await poller.close()
+    """
+
+    def __init__(self, session_manager, rate=SIM_POLL_RATE, error_delay=30, max_errors=10):
+        self.session_manager = session_manager
+        self.budget = RateBudget(rate)
+        self.error_delay = error_delay  # 轮询出错后隔多久再试
+        self.max_errors = max_errors    # 同一个 URL 连续出错这么多次就放弃
+        self._heap = []                 # (下次轮询时间, 序号, url)
+        self._waiters = {}              # url -> Future
+        self._errors = {}
+        self._polls = {}                # url -> 已轮询次数，由 take_polls 取走
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.n_polls = 0
+
+    def _schedule(self, url, delay=0.0):
+        due = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._heap, (due, next(self._seq), url))
+        self._wakeup.set()
+
+    async def wait(self, url):
+        """登记一个进度 URL，模拟结束后返回最后一次 GET 的 json"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        future = self._waiters.get(url)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[url] = future
+            self._errors[url] = 0
+            self._polls[url] = 0
+            self._schedule(url)
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - loop.time()
+            if delay > 0:
+                # 睡到最早的 URL 到期，期间有新 URL 登记就提前醒来
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = loop.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+            await asyncio.gather(*(self._poll(url) for url in due))
+
+    async def _poll(self, url):
+        future = self._waiters.get(url)
+        if future is None or future.done():
+            self._forget(url)
+            return
+        try:
+            async with self.budget:
+                self.n_polls += 1
+                self._polls[url] = self._polls.get(url, 0) + 1
+                session = self.session_manager.session
+                async with session.get(url) as resp:
+                    if resp.status == 401:
+                        await self.session_manager.refresh_session(session)
+                        self._schedule(url)
+                        return
+                    json_data = await resp.json()
+                    retry_after = resp.headers.get('Retry-After', 0)
+        except Exception as e:
+            self._errors[url] += 1
+            log.warning('progress check error', url=url, attempt=self._errors[url],
+                        max_errors=self.max_errors, error=str(e))
+            if self._errors[url] >= self.max_errors:
+                future.set_exception(Exception("Max progress check retries reached: %s" % url))
+                self._forget(url)
+            else:
+                self._schedule(url, self.error_delay)
+            return
+
+        if retry_after == 0:
+            future.set_result(json_data)
+            self._forget(url)
+        else:
+            self._schedule(url, float(retry_after))
+
+    def take_polls(self, url):
+        """wait(url) 返回后调用：该模拟一共被轮询了几次"""
+        return self._polls.pop(url, 0)
+
+    def _forget(self, url):
+        self._waiters.pop(url, None)
+        self._errors.pop(url, None)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for future in self._waiters.values():
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
@@ -0,0 +1,84 @@
+"""
+模拟任务调度
+
+表达式来源可以是列表，也可以是生成器：iter_pools 惰性地把表达式切成 pool，
+run_workers 用一个有界队列把 pool 交给固定数量的 worker，内存占用与运行总量无关。
+"""
+import asyncio
+import itertools
+
+from brain_log import get_logger
+
+log = get_logger(__name__)
+
+POOL_SIZE = 10     # 一次 multi simulation 最多 10 个表达式
+GLB_POOL_SIZE = 5  # GLB 地区每个 pool 5 个
+
+
+def pool_size(region):
+    return GLB_POOL_SIZE if region[0] == "GLB" else POOL_SIZE
+
+
+def iter_pools(alpha_list, region_list, decay_list, delay_list, skip=None):
+    """
+    惰性产出 (pool, region, decay, delay)。
+    与原来的切分方式一致：第 k 个 pool 使用 region_list / decay_list / delay_list 的第 k 个元素，
+    pool 大小由第一个 region 决定。
+    skip(alpha, region, decay, delay) 返回 True 的表达式不进 pool（例如已有模拟结果），pool 由后面的表达式补满
+    """
+    alphas = iter(alpha_list)
+    regions = iter(region_list)
+    first_region = next(regions, None)
+    if first_region is None:
+        return
+    size = pool_size(first_region)
+
+    for region, decay, delay in zip(itertools.chain([first_region], regions), decay_list, delay_list):
+        if skip is None:
+            pool = list(itertools.islice(alphas, size))
+        else:
+            pool = list(itertools.islice((a for a in alphas if not skip(a, region, decay, delay)), size))
+        if not pool:
+            return
+        yield pool, region, decay, delay
+
+
+async def run_workers(jobs, worker, n_workers, queue_size=None, metrics=None):
+    """
+    生产者/消费者：生产者从 jobs 迭代器里取任务放进有界队列，
+    n_workers 个 worker 取到任务就 await worker(job)，一个任务结束立刻取下一个。
+    传入 metrics（SimMetrics）时导出队列深度与忙碌的 worker 数
+    """
+    queue = asyncio.Queue(maxsize=queue_size or n_workers)
+    busy = 0
+    if metrics is not None:
+        metrics.gauge('queue_depth', queue.qsize)
+        metrics.gauge('busy_workers', lambda: busy)
+    done = object()
+
+    async def produce():
+        for job in jobs:
+            await queue.put(job)
+        for _ in range(n_workers):
+            await queue.put(done)
+
+    async def consume():
+        nonlocal busy
+        while True:
+            job = await queue.get()
+            if job is done:
+                return
+            busy += 1
+            try:
+                await worker(job)
+            except Exception as e:
+                log.error('worker job failed', error=str(e))
+            finally:
+                busy -= 1
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(n_workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,14 @@
+"""
+测试共用设置：仓库根目录加入 sys.path；records / 缓存 / 日志写到临时目录（config 在导入时读取环境变量，必须先设置）
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix='brain_tests_')
+os.environ.setdefault('BRAIN_RECORDS_PATH', os.path.join(_workdir, 'records'))
+os.environ.setdefault('BRAIN_CACHE_PATH', os.path.join(_workdir, '.cache'))
+os.environ.setdefault('BRAIN_LOG_CONSOLE_LEVEL', 'ERROR')
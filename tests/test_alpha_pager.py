@@ -0,0 +1,52 @@
+import base64
+import asyncio
+
+import aiohttp
+import pytest
+
+from fake_brain import FakeBrain, FakeBrainServer
+from alpha_pager import AlphaPager, OFFSET_CAP
+
+START, END = '2025-01-01T00:00:00', '2025-03-01T00:00:00'
+
+
+@pytest.fixture(scope='module')
+def server():
+    brain = FakeBrain(latency=0, jitter=0, n_alphas=OFFSET_CAP + 2500, start_date=START[:10], end_date=END[:10])
+    server = FakeBrainServer(brain).start()
+    yield server
+    server.stop()
+
+
+async def fetch(server, query):
+    session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))  # 服务在 127.0.0.1 上
+    auth = 'Basic ' + base64.b64encode(b'test:test').decode()
+    async with session.post(server.url + '/authentication', headers={'Authorization': auth}) as resp:
+        assert resp.status == 201
+    pager = AlphaPager(session=session, concurrency=8, rate=1000)
+    url = (server.url + '/users/self/alphas?limit=100&offset={offset}'
+           '&dateCreated%3E={start}&dateCreated%3C{end}' + query)
+    try:
+        return [page async for page in pager.pages([url], START, END)]
+    finally:
+        await session.close()
+
+
+def test_windows_are_bisected_past_offset_cap(server):
+    pages = asyncio.run(fetch(server, ''))
+    windows = sorted({page.window for page in pages})
+    assert len(windows) > 1
+    assert all(page.count < OFFSET_CAP for page in pages)
+    # 子区间首尾相接，覆盖整个查询区间
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+
+    ids = [alpha['id'] for page in pages for alpha in page.results]
+    assert len(ids) == len(set(ids)) == pages[0].total
+    assert pages[0].total > OFFSET_CAP
+
+
+def test_small_query_is_not_split(server):
+    pages = asyncio.run(fetch(server, '&is.sharpe%3E=2.5'))
+    assert len({page.window for page in pages}) == 1
+    assert [page.offset for page in pages] == list(range(0, max(pages[0].count, 1), 100))
+    assert sum(len(page.results) for page in pages) == pages[0].count
@@ -0,0 +1,73 @@
+from enum_cursor import EnumerationCursor, seeded_order, fields_digest
+
+FIELDS = ['close', 'volume', 'cap']
+
+
+def cursor(tmp_path, fields=FIELDS, seed=1, save_every=1):
+    return EnumerationCursor('t', fields, seed=seed, path=str(tmp_path / 't_cursor.json'), save_every=save_every)
+
+
+def test_order_depends_only_on_field_set_and_seed():
+    assert seeded_order(FIELDS, 1) == seeded_order(list(reversed(FIELDS)) + ['cap'], 1)
+    assert fields_digest(FIELDS, 1) != fields_digest(FIELDS, 2)
+
+
+def test_position_waits_for_earliest_pending(tmp_path):
+    c = cursor(tmp_path)
+    for position, alpha in [((0, 0), 'a'), ((0, 1), 'b'), ((1, 0), 'c')]:
+        c.issue(position, alpha)
+    assert c.position == (0, 0)
+
+    c.done(['b'])  # 后面的先完成，前面的还在途：游标不动
+    assert c.position == (0, 0)
+    c.done(['a'])
+    assert c.position == (1, 0)
+    c.done(['c'])
+    assert c.position == (1, 1)
+    assert c.emitted == 3
+
+
+def test_unknown_expressions_do_not_move_cursor(tmp_path):
+    c = cursor(tmp_path)
+    c.issue((0, 0), 'a')
+    c.done(['from-journal'])
+    assert c.position == (0, 0)
+    assert c.emitted == 0
+
+
+def test_duplicate_expressions_settle_one_position_each(tmp_path):
+    c = cursor(tmp_path)
+    c.issue((0, 0), 'a')
+    c.issue((0, 1), 'a')
+    c.done(['a'])
+    assert c.position == (0, 1)
+    c.done(['a'])
+    assert c.position == (0, 2)
+
+
+def test_finish_waits_for_pending(tmp_path):
+    c = cursor(tmp_path)
+    c.issue((2, 3), 'a')
+    c.finish()
+    assert not c.exhausted
+    c.done(['a'])
+    assert c.exhausted
+
+
+def test_resume_from_saved_position(tmp_path):
+    with cursor(tmp_path, save_every=100) as c:
+        c.issue((0, 0), 'a')
+        c.issue((0, 1), 'b')
+        c.done(['a'])  # b 还在途时中断
+    resumed = cursor(tmp_path)
+    assert resumed.position == (0, 1)
+    assert resumed.emitted == 1
+
+
+def test_changed_fields_or_seed_start_over(tmp_path):
+    with cursor(tmp_path) as c:
+        c.issue((1, 0), 'a')
+        c.done(['a'])
+    assert cursor(tmp_path, fields=FIELDS + ['returns']).position == (0, 0)
+    assert cursor(tmp_path, seed=2).position == (0, 0)
+    assert cursor(tmp_path).position == (1, 1)
@@ -0,0 +1,42 @@
+import random
+import itertools
+
+import pytest
+
+from expr_space import ProductSpace, ChainSpace, FeistelPermutation, iter_sample
+
+
+def test_product_order_matches_itertools():
+    axes = [['a', 'b'], [1, 2, 3], ['x', 'y']]
+    space = ProductSpace(axes)
+    assert len(space) == 12
+    assert list(space) == list(itertools.product(*axes))
+    assert [space[i] for i in range(len(space))] == list(space)
+
+
+def test_nested_and_chained_spaces():
+    inner = ProductSpace([['p', 'q'], [1, 2]], lambda a, b: f'{a}{b}')
+    space = ChainSpace(ProductSpace([inner, ['x']]), ProductSpace([['z'], [9]]))
+    assert list(space) == [space[i] for i in range(len(space))]
+    assert space[-1] == ('z', 9)
+    with pytest.raises(IndexError):
+        space[len(space)]
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 10, 257, 1000])
+def test_feistel_is_a_permutation(n):
+    permutation = FeistelPermutation(n, random.Random(n))
+    assert sorted(permutation(i) for i in range(n)) == list(range(n))
+
+
+def test_iter_sample_yields_every_point_once():
+    space = ProductSpace([range(37), range(11)])
+    sample = list(iter_sample(space, random.Random(0)))
+    assert sorted(sample) == sorted(space)
+    assert sample != list(space)
+
+
+def test_iter_sample_is_lazy_on_large_spaces():
+    space = ProductSpace([range(10_000), range(1_000)])
+    head = list(itertools.islice(iter_sample(space, random.Random(0)), 1000))
+    assert len(set(head)) == 1000
@@ -0,0 +1,55 @@
+import pytest
+
+from fastexpr import parse, to_source, canonicalize, FastExprSyntaxError
+
+
+@pytest.mark.parametrize('expression', [
+    "rank(close)",
+    "ts_mean(close, 5) - ts_mean(close, 20)",
+    "group_rank(x, densify(sector))",
+    "bucket(rank(cap), range='0.1, 1, 0.1')",
+    "a > b ? a : b",
+    "a - (b - c)",
+    "-1 * close",
+    "x = close; y = rank(x); y - 1",
+])
+def test_to_source_round_trip(expression):
+    tree = parse(expression)
+    assert to_source(tree) == expression
+    assert parse(to_source(tree)) == tree
+
+
+@pytest.mark.parametrize('a, b', [
+    ("rank( close )", "rank(close)"),
+    ("((a - b))", "a - b"),
+    ("ts_mean(close,5.0)", "ts_mean(close, 5)"),
+    ("1e3+x", "1000 + x"),
+    ("b + a", "a + b"),
+    ("c*(b*a)", "(a*b)*c"),
+    ("ts_decay_linear(close, 10, dense = false)", "ts_decay_linear(close, 10, dense=false)"),
+    ("bucket(rank(cap), range = '0.1, 1, 0.1')", "bucket(rank(cap), range='0.1,1,0.1')"),
+    ("x = close;\ny = rank(x);\ny - 1", "rank(close) - 1"),
+])
+def test_canonicalize_equivalent_spellings(a, b):
+    assert canonicalize(a) == canonicalize(b)
+
+
+@pytest.mark.parametrize('a, b', [
+    ("a - b", "b - a"),
+    ("a - b - c", "a - (b - c)"),
+    ("ts_mean(close, 5)", "ts_mean(close, 20)"),
+])
+def test_canonicalize_keeps_different_expressions_apart(a, b):
+    assert canonicalize(a) != canonicalize(b)
+
+
+def test_canonicalize_is_idempotent():
+    expression = "x = ts_delta(close, 5);\n  group_neutralize( rank(x)*-1 , subindustry)"
+    once = canonicalize(expression)
+    assert canonicalize(once) == once
+
+
+def test_syntax_error_reports_position():
+    with pytest.raises(FastExprSyntaxError) as e:
+        parse("rank(close")
+    assert e.value.pos == len("rank(close")
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from throttle import AIMDLimiter
+
+
+def test_additive_increase_is_about_one_slot_per_window():
+    async def run():  # 窗口变大时 on_success 会安排唤醒任务，需要事件循环
+        limiter = AIMDLimiter(initial=4, max_window=10)
+        for _ in range(4):
+            limiter.on_success()
+        assert 4.9 < limiter.window < 5.0
+        limiter.on_success()
+        assert limiter.window > 5
+
+    asyncio.run(run())
+
+
+def test_increase_is_capped_at_max_window():
+    async def run():
+        limiter = AIMDLimiter(initial=9, max_window=10)
+        for _ in range(100):
+            limiter.on_success()
+        assert limiter.window == 10
+
+    asyncio.run(run())
+
+
+def test_multiplicative_decrease_once_per_cooldown():
+    limiter = AIMDLimiter(initial=8, max_window=10, cooldown=60)
+    limiter.on_limit()
+    assert limiter.window == 4
+    limiter.on_limit()  # 同一次拥塞
+    assert limiter.window == 4
+    assert limiter.n_limited == 2
+
+
+def test_decrease_is_floored_at_min_window():
+    limiter = AIMDLimiter(initial=2, min_window=1, cooldown=0)
+    for _ in range(5):
+        limiter.on_limit()
+    assert limiter.window == 1
+
+
+def test_acquire_blocks_until_window_grows():
+    async def run():
+        limiter = AIMDLimiter(initial=1, max_window=2)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        limiter.on_success()  # 窗口 1 -> 2，唤醒等待的任务
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 2
+        assert limiter.peak == 2
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('initial, expected', [(0, 1), (3, 3), (50, 10)])
+def test_initial_window_is_clamped(initial, expected):
+    assert AIMDLimiter(initial=initial, min_window=1, max_window=10).window == expected
@@ -0,0 +1,164 @@
+"""
+异步请求节流工具
+
+- RateBudget  : 令牌桶，限制每秒请求数和同时在途数
+- AIMDLimiter : 按平台反馈自适应调整的并发窗口
+"""
+import time
+import asyncio
+
+
+class RateBudget:
+    """
+    异步令牌桶：每秒最多 rate 个请求（允许 burst 个突发），
+    可选 concurrency 限制同时在途的请求数。
+
+    用法:
+        budget = RateBudget(rate=2, concurrency=4)
+        async with budget:
+            await session.get(url)
+    """
+
+    def __init__(self, rate, burst=None, concurrency=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._last = None
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def acquire(self):
+        """拿到一个令牌才返回；令牌不足时按速率等待"""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self._last is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            await self.acquire()
+        except BaseException:
+            if self._semaphore is not None:
+                self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+class AIMDLimiter:
+    """
+    加性增、乘性减（AIMD）的并发窗口，用来代替固定大小的 asyncio.Semaphore：
+    提交成功时窗口每轮约加 increase，平台返回 SIMULATION_LIMIT_EXCEEDED / 429 时窗口乘以 decrease。
+    同一次拥塞在 cooldown 秒内只减一次，避免一批请求同时被拒时把窗口直接压到最小。
+
+    用法:
+        limiter = AIMDLimiter(initial=3, max_window=10)
+        async with limiter:
+            ...
+            limiter.on_success()   # 或 limiter.on_limit()
+    """
+
+    def __init__(self, initial, min_window=1, max_window=None, increase=1.0, decrease=0.5, cooldown=5.0):
+        self.min_window = float(min_window)
+        self.max_window = float(max_window or initial)
+        self.window = min(max(float(initial), self.min_window), self.max_window)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.peak = 0
+        self.n_success = 0
+        self.n_limited = 0
+        self._last_decrease = None
+        self._started = None
+        self._changed = None
+        self._busy_area = 0.0  # in_flight 对时间的积分，用于计算平均占用槽位
+        self._idle_area = 0.0  # 窗口内空闲槽位对时间的积分（空闲槽位秒数）
+        self._cond = asyncio.Condition()
+        self._wake_tasks = set()  # 事件循环只弱引用任务，这里留着引用直到唤醒完成
+
+    def _tick(self):
+        now = time.monotonic()
+        if self._changed is None:
+            self._started = now
+        else:
+            self._busy_area += self.in_flight * (now - self._changed)
+            self._idle_area += max(0, int(self.window) - self.in_flight) * (now - self._changed)
+        self._changed = now
+        return now
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.window))
+            self._tick()
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    async def release(self):
+        async with self._cond:
+            self._tick()
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def on_success(self):
+        """一次提交被平台接受：窗口加 increase / window（每轮约加 increase）"""
+        self.n_success += 1
+        self._tick()
+        old = int(self.window)
+        self.window = min(self.max_window, self.window + self.increase / self.window)
+        if int(self.window) > old:
+            task = asyncio.ensure_future(self._wake())
+            self._wake_tasks.add(task)
+            task.add_done_callback(self._wake_tasks.discard)
+
+    def on_limit(self):
+        """平台限流：窗口乘以 decrease，cooldown 内的重复信号忽略"""
+        self.n_limited += 1
+        now = time.monotonic()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._tick()
+        self.window = max(self.min_window, self.window * self.decrease)
+
+    async def _wake(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def idle_slot_seconds(self):
+        """窗口允许但没有被占用的槽位秒数"""
+        self._tick()
+        return self._idle_area
+
+    def stats(self):
+        """当前窗口、在途数、峰值与运行期间的平均在途数"""
+        now = self._tick()
+        elapsed = now - self._started
+        return {
+            'window': round(self.window, 2),
+            'in_flight': self.in_flight,
+            'peak': self.peak,
+            'mean_in_flight': round(self._busy_area / elapsed, 2) if elapsed > 0 else float(self.in_flight),
+            'success': self.n_success,
+            'limited': self.n_limited,
+            'idle_slot_seconds': round(self._idle_area, 1),
+        }